@@ -0,0 +1 @@
+"""Offline benchmarks for the crawler and the image extractor; run with ``python -m benchmarks``."""
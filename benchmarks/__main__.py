@@ -0,0 +1,143 @@
+"""Run the offline benchmarks: ``python -m benchmarks [options]`` from the repository root.
+
+A synthetic site is crawled through local stand-ins for Tor's SOCKS and
+control ports, then its images are extracted twice; the second run shows
+the incremental path. No network access is needed.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+from typing import Dict, List
+
+from .standins import SiteSpec
+from .suite import BENCHMARKS, CRAWL, CrawlOptions, run_suite
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    defaults = SiteSpec()
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the crawler and the image extractor against a local synthetic site"
+    )
+    site = parser.add_argument_group("synthetic site")
+    site.add_argument("--pages", type=int, default=defaults.pages,
+                      help=f"Number of HTML pages (default: {defaults.pages})")
+    site.add_argument("--fanout", type=int, default=defaults.fanout,
+                      help=f"Links from each page to other pages (default: {defaults.fanout})")
+    site.add_argument("--assets", type=int, default=defaults.assets,
+                      help=f"Images on each page (default: {defaults.assets})")
+    site.add_argument("--asset-size", type=int, default=defaults.asset_size,
+                      help=f"Average image size in bytes (default: {defaults.asset_size})")
+    site.add_argument("--page-size", type=int, default=defaults.page_size,
+                      help=f"Text on each page in bytes (default: {defaults.page_size})")
+    site.add_argument("--latency", type=float, default=defaults.latency,
+                      help=f"Seconds before each response, like Tor's round trips (default: {defaults.latency})")
+    site.add_argument("--connect-latency", type=float, default=defaults.connect_latency,
+                      help="Seconds the SOCKS stand-in takes to open each connection "
+                           f"(default: {defaults.connect_latency})")
+    site.add_argument("--forbidden-rate", type=float, default=defaults.forbidden_rate,
+                      help="Fraction of requests answered with 403, which triggers NEWNYM (default: 0)")
+    site.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate,
+                      help="Fraction of requests answered with 429 and Retry-After (default: 0)")
+    site.add_argument("--seed", type=int, default=defaults.seed,
+                      help="Seed for content and injected errors")
+    
+    crawler = parser.add_argument_group("crawler")
+    crawler.add_argument("--workers", "-w", type=int, default=None, help="Concurrent requests")
+    crawler.add_argument("--circuits", "-c", type=int, default=None, help="Isolated circuits")
+    crawler.add_argument("--parse-processes", type=int, default=None,
+                         help="HTML parsing processes (0 = one per CPU core)")
+    crawler.add_argument("--rate", type=float, default=None,
+                         help="Initial requests/s per host instead of the configured pacing")
+    crawler.add_argument("--sitemaps", action="store_true", default=None,
+                         help="Queue the pages listed in the site's sitemaps before link discovery finds them")
+    
+    parser.add_argument("--only", choices=BENCHMARKS, action="append",
+                        help="Run only this benchmark; may be repeated (extraction needs a crawl "
+                             "in the same or a kept working directory)")
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="Directory for downloads and images (default: a temporary one, removed afterwards)")
+    parser.add_argument("--json", type=Path, default=None,
+                        help="Also write the results, with the settings used, to this JSON file")
+    return parser.parse_args()
+
+
+def _megabytes(nbytes: float) -> str:
+    return f"{nbytes / 1024 / 1024:.1f} MB"
+
+
+def print_results(results: List[Dict[str, object]]) -> None:
+    """Print one line per benchmark."""
+    print(f"\n{'Benchmark':<15}{'Seconds':>9}{'Rate':>18}{'Throughput':>14}"
+          f"{'CPU s':>8}{'CPU':>6}{'Peak RSS':>11}")
+    for result in results:
+        rate = f"{result['items_per_second']:.1f} {result['unit']}/s"
+        cpu_share = result['cpu_seconds'] / result['seconds']
+        print(f"{result['name']:<15}{result['seconds']:>9.2f}{rate:>18}"
+              f"{_megabytes(result['bytes_per_second']) + '/s':>14}"
+              f"{result['cpu_seconds']:>8.2f}{cpu_share:>6.0%}{_megabytes(result['peak_rss']):>11}")
+    for result in results:
+        if result['name'] == CRAWL:
+            print(f"\nCrawl: {result['items']} URLs, {_megabytes(result['bytes'])}; "
+                  f"retries {result['retries'] or 'none'}, {result['newnym']} NEWNYM")
+            print(f"Timings: {result['timings']}")
+
+
+def main() -> int:
+    """Main entry point."""
+    args = parse_args()
+    spec = SiteSpec(
+        pages=args.pages,
+        fanout=args.fanout,
+        assets=args.assets,
+        asset_size=args.asset_size,
+        page_size=args.page_size,
+        latency=args.latency,
+        connect_latency=args.connect_latency,
+        forbidden_rate=args.forbidden_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed
+    )
+    options = CrawlOptions(
+        workers=args.workers,
+        circuits=args.circuits,
+        parse_processes=args.parse_processes,
+        rate=args.rate,
+        sitemaps=args.sitemaps
+    )
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='dld-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    benchmarks = tuple(name for name in BENCHMARKS if not args.only or name in args.only)
+    
+    print(f"Benchmarking in {workdir}: {spec.pages} pages with {spec.assets} images each, "
+          f"{spec.latency * 1000:.0f} ms latency")
+    try:
+        results = run_suite(spec, options, workdir, benchmarks)
+    except KeyboardInterrupt:
+        print("\nBenchmark cancelled by user.")
+        return 130
+    except Exception as e:
+        print(f"\nBenchmark failed: {e}")
+        return 1
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps({
+            'site': spec._asdict(),
+            'crawler': options._asdict(),
+            'results': results,
+        }, indent=2), encoding='utf-8')
+        print(f"\nResults written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""Local stand-ins for a website, Tor's SOCKS port and Tor's control port.
+
+Everything listens on 127.0.0.1, so benchmarks need no network. The SOCKS
+stand-in sends every connection to the synthetic site whatever host it
+names, which lets the crawler use made-up domains resolved through the
+proxy as it would with Tor.
+"""
+
+import gzip
+import http.server
+import random
+import select
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import List, NamedTuple, Set, Tuple
+
+# Host name the benchmarks crawl; only the SOCKS stand-in ever resolves it
+SITE_HOST = 'bench.test'
+# Pages listed in each gzipped sitemap of the synthetic site's sitemap index
+SITEMAP_PAGES = 1000
+# <lastmod> of every page of the synthetic site
+LASTMOD = '2024-01-01T00:00:00Z'
+
+
+class SiteSpec(NamedTuple):
+    """Shape and behaviour of the synthetic site."""
+    
+    pages: int = 200
+    # Links from each page to other pages
+    fanout: int = 4
+    # Images on each page and their average size in bytes
+    assets: int = 3
+    asset_size: int = 50 * 1024
+    # Size of the text of each page in bytes
+    page_size: int = 20 * 1024
+    # Seconds before each response (time to first byte) and before each new
+    # proxied connection is established
+    latency: float = 0.05
+    connect_latency: float = 0.0
+    # Fraction of requests answered with 403 or with 429 and Retry-After
+    forbidden_rate: float = 0.0
+    throttle_rate: float = 0.0
+    seed: int = 1
+
+
+class _Site:
+    """Deterministic content of the synthetic site."""
+    
+    def __init__(self, spec: SiteSpec):
+        self.spec = spec
+        rng = random.Random(spec.seed)
+        # Assets are slices of this pool, so they differ without generating each one
+        pool_size = 4 * spec.asset_size + 1024
+        self._pool = rng.getrandbits(8 * pool_size).to_bytes(pool_size, 'little')
+        words = ['tor', 'relay', 'circuit', 'exit', 'onion', 'stream', 'guard', 'bridge']
+        self._text = ' '.join(rng.choice(words) for _ in range(spec.page_size // 6 + 1))[:spec.page_size]
+        self._errors = random.Random(spec.seed)
+        self._lock = threading.Lock()
+    
+    def asset_size(self, page: int, index: int) -> int:
+        """Size of an asset, between half and one and a half times the average."""
+        return int(self.spec.asset_size * (0.5 + (page * 31 + index * 17) % 100 / 100))
+    
+    def asset(self, page: int, index: int) -> bytes:
+        offset = (page * 7919 + index * 104729) % (2 * self.spec.asset_size + 1)
+        return self._pool[offset:offset + self.asset_size(page, index)]
+    
+    def page(self, page: int) -> bytes:
+        spec = self.spec
+        links = ''.join(
+            f'<li><a href="/pages/{(page * spec.fanout + k) % spec.pages}.html">Page</a></li>'
+            for k in range(1, spec.fanout + 1)
+        )
+        images = ''.join(
+            f'<img src="/assets/{page}-{index}.png" alt="">' for index in range(spec.assets)
+        )
+        return (
+            f'<!DOCTYPE html><html><head><title>Page {page}</title>'
+            f'<link rel="stylesheet" href="/assets/site.css"></head><body>'
+            f'<h1>Page {page}</h1><ul>{links}</ul>{images}<p>{self._text}</p></body></html>'
+        ).encode('utf-8')
+    
+    def sitemap_index(self, base_url: str) -> bytes:
+        entries = ''.join(
+            f'<sitemap><loc>{base_url}/sitemaps/{first // SITEMAP_PAGES}.xml.gz</loc></sitemap>'
+            for first in range(0, self.spec.pages, SITEMAP_PAGES)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>'
+        ).encode('utf-8')
+        
+    def sitemap(self, base_url: str, index: int) -> bytes:
+        """Gzipped sitemap of the pages in the ``index``-th slice of SITEMAP_PAGES."""
+        pages = range(index * SITEMAP_PAGES, min((index + 1) * SITEMAP_PAGES, self.spec.pages))
+        entries = ''.join(
+            f'<url><loc>{base_url}/pages/{page}.html</loc><lastmod>{LASTMOD}</lastmod></url>'
+            for page in pages
+        )
+        return gzip.compress((
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+        ).encode('utf-8'))
+        
+    def injected_error(self) -> int:
+        """Status of an injected error for the next request, 0 for none."""
+        with self._lock:
+            roll = self._errors.random()
+        if roll < self.spec.forbidden_rate:
+            return 403
+        if roll < self.spec.forbidden_rate + self.spec.throttle_rate:
+            return 429
+        return 0
+
+
+class _SiteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    site: _Site
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _resolve(self) -> Tuple[int, str, bytes]:
+        path = self.path.split('?')[0]
+        if path in ('/', '/index.html'):
+            return 200, 'text/html; charset=utf-8', self.site.page(0)
+        if path == '/assets/site.css':
+            return 200, 'text/css', b'body { font-family: sans-serif; }\n'
+        base_url = f"http://{self.headers.get('Host', SITE_HOST)}"
+        if path == '/robots.txt':
+            return 200, 'text/plain', f'User-agent: *\nSitemap: {base_url}/sitemap-index.xml\n'.encode('ascii')
+        if path == '/sitemap-index.xml':
+            return 200, 'application/xml', self.site.sitemap_index(base_url)
+        try:
+            if path.startswith('/sitemaps/') and path.endswith('.xml.gz'):
+                index = int(path[len('/sitemaps/'):-len('.xml.gz')])
+                if 0 <= index * SITEMAP_PAGES < self.site.spec.pages:
+                    return 200, 'application/gzip', self.site.sitemap(base_url, index)
+            if path.startswith('/pages/') and path.endswith('.html'):
+                page = int(path[len('/pages/'):-len('.html')])
+                if 0 <= page < self.site.spec.pages:
+                    return 200, 'text/html; charset=utf-8', self.site.page(page)
+            if path.startswith('/assets/') and path.endswith('.png'):
+                page, index = map(int, path[len('/assets/'):-len('.png')].split('-'))
+                if 0 <= page < self.site.spec.pages and 0 <= index < self.site.spec.assets:
+                    return 200, 'image/png', self.site.asset(page, index)
+        except ValueError:
+            pass
+        return 404, 'text/plain', b'Not found\n'
+    
+    def _respond(self, send_body: bool) -> None:
+        time.sleep(self.site.spec.latency)
+        error = self.site.injected_error()
+        if error:
+            body = b'Slow down\n'
+            self.send_response(error)
+            if error == 429:
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Type', 'text/plain')
+        else:
+            status, content_type, body = self._resolve()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+    
+    def do_GET(self):
+        self._respond(send_body=True)
+    
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+
+class _QuietDisconnects:
+    """Don't print tracebacks for clients that drop their connections.
+    
+    The crawler does this whenever it renews a circuit's session; it is
+    not an error of the stand-in.
+    """
+    
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class _ThreadingTCPServer(_QuietDisconnects, socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _ThreadingHTTPServer(_QuietDisconnects, socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("SOCKS client closed the connection")
+        data += chunk
+    return data
+
+
+class _SocksHandler(socketserver.BaseRequestHandler):
+    """SOCKS5 (RFC 1928) CONNECT with optional username/password (RFC 1929).
+    
+    Tor isolates circuits by SOCKS credentials; here any credentials are
+    accepted and every destination is the synthetic site.
+    """
+    
+    target: Tuple[str, int]
+    connect_latency: float
+    
+    def handle(self):
+        client = self.request
+        try:
+            _, nmethods = _recv_exact(client, 2)
+            methods = _recv_exact(client, nmethods)
+            if 2 in methods:
+                client.sendall(b'\x05\x02')
+                _, username_length = _recv_exact(client, 2)
+                _recv_exact(client, username_length)
+                password_length = _recv_exact(client, 1)[0]
+                _recv_exact(client, password_length)
+                client.sendall(b'\x01\x00')
+            else:
+                client.sendall(b'\x05\x00')
+            _, command, _, address_type = _recv_exact(client, 4)
+            if address_type == 1:
+                _recv_exact(client, 4)
+            elif address_type == 3:
+                _recv_exact(client, _recv_exact(client, 1)[0])
+            else:
+                _recv_exact(client, 16)
+            _recv_exact(client, 2)
+            if command != 1:
+                # Only CONNECT is supported
+                client.sendall(b'\x05\x07\x00\x01' + bytes(6))
+                return
+            time.sleep(self.connect_latency)
+            upstream = socket.create_connection(self.target)
+        except (ConnectionError, OSError):
+            return
+        with upstream:
+            client.sendall(b'\x05\x00\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('>H', 0))
+            self._relay(client, upstream)
+    
+    @staticmethod
+    def _relay(client: socket.socket, upstream: socket.socket) -> None:
+        sockets = [client, upstream]
+        while True:
+            readable, _, _ = select.select(sockets, [], [], 60)
+            if not readable:
+                return
+            for sock in readable:
+                data = sock.recv(64 * 1024)
+                if not data:
+                    return
+                (upstream if sock is client else client).sendall(data)
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """Just enough of Tor's control protocol for stem and ``TorController``.
+    
+    Authentication always succeeds, NEWNYM is acknowledged and followed by
+    a ``CIRC ... BUILT`` event for subscribers, as Tor builds new circuits.
+    """
+    
+    newnym_count: List[int]
+    
+    def _send(self, *lines: str) -> None:
+        self.wfile.write(''.join(f"{line}\r\n" for line in lines).encode('ascii'))
+    
+    def handle(self):
+        events: Set[str] = set()
+        circuit_id = 0
+        for raw in self.rfile:
+            line = raw.decode('ascii', 'replace').strip()
+            command, _, arguments = line.partition(' ')
+            command = command.upper()
+            if command == 'PROTOCOLINFO':
+                self._send('250-PROTOCOLINFO 1', '250-AUTH METHODS=NULL',
+                           '250-VERSION Tor="0.4.8.12"', '250 OK')
+            elif command in ('AUTHENTICATE', 'CLOSECIRCUIT', 'TAKEOWNERSHIP', 'RESETCONF'):
+                self._send('250 OK')
+            elif command == 'SETEVENTS':
+                events = set(arguments.upper().split())
+                self._send('250 OK')
+            elif command == 'GETCONF':
+                # Every option is unset
+                keys = arguments.split() or ['OK']
+                self._send(*(f"250-{key}" for key in keys[:-1]), f"250 {keys[-1]}")
+            elif command == 'GETINFO':
+                if arguments == 'version':
+                    self._send('250-version=0.4.8.12', '250 OK')
+                else:
+                    self._send(f'552 Unrecognized key "{arguments}"')
+            elif command == 'SIGNAL':
+                self._send('250 OK')
+                if arguments.upper() == 'NEWNYM':
+                    self.newnym_count[0] += 1
+                    if 'CIRC' in events:
+                        circuit_id += 1
+                        self._send(f'650 CIRC {circuit_id} BUILT ${"A" * 40}~bench PURPOSE=GENERAL')
+            elif command == 'QUIT':
+                self._send('250 closing connection')
+                return
+            else:
+                self._send(f'510 Unrecognized command "{command}"')
+            self.wfile.flush()
+
+
+class StandIns:
+    """The synthetic site, SOCKS stand-in and control port stand-in, serving in threads."""
+    
+    def __init__(self, spec: SiteSpec):
+        site_handler = type('SiteHandler', (_SiteHandler,), {'site': _Site(spec)})
+        self._site = _ThreadingHTTPServer(('127.0.0.1', 0), site_handler)
+        socks_handler = type('SocksHandler', (_SocksHandler,), {
+            'target': self._site.server_address,
+            'connect_latency': spec.connect_latency,
+        })
+        self._socks = _ThreadingTCPServer(('127.0.0.1', 0), socks_handler)
+        self.newnym_count = [0]
+        control_handler = type('ControlHandler', (_ControlHandler,), {'newnym_count': self.newnym_count})
+        self._control = _ThreadingTCPServer(('127.0.0.1', 0), control_handler)
+        self._servers = [self._site, self._socks, self._control]
+        for server in self._servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    @property
+    def ports(self) -> Tuple[int, int, int]:
+        """Ports of the site, the SOCKS stand-in and the control port stand-in."""
+        return tuple(server.server_address[1] for server in self._servers)
+    
+    def close(self) -> None:
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+
+def serve(spec: SiteSpec, ready, stop) -> None:
+    """Run the stand-ins until ``stop`` is set; entry point of the stand-in process.
+    
+    The ports are put on the ``ready`` queue once everything listens.
+    """
+    stand_ins = StandIns(spec)
+    ready.put(stand_ins.ports)
+    stop.wait()
+    stand_ins.close()
@@ -0,0 +1,157 @@
+"""The benchmarks, each run in a fresh process so its CPU time and peak RSS are its own."""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+from .standins import SITE_HOST, SiteSpec, serve
+
+# Benchmarks measure the working tree, not an installed release
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+CRAWL = 'crawl'
+EXTRACT = 'extract'
+EXTRACT_RERUN = 'extract-rerun'
+BENCHMARKS = (CRAWL, EXTRACT, EXTRACT_RERUN)
+
+
+class CrawlOptions(NamedTuple):
+    """Settings of the crawler under test; None keeps the default."""
+    
+    workers: Optional[int] = None
+    circuits: Optional[int] = None
+    parse_processes: Optional[int] = None
+    # Initial requests/s per host, instead of config.RATE_INITIAL
+    rate: Optional[float] = None
+    # Seed the frontier from the site's sitemaps
+    sitemaps: Optional[bool] = None
+
+
+def _usage() -> Tuple[float, int]:
+    """CPU seconds used by this process and its finished children, and the peak RSS in bytes."""
+    if resource is None:
+        return time.process_time(), 0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) * scale
+
+
+def _measure(name: str, unit: str, run: Callable[[], Tuple[int, int]]) -> Dict[str, object]:
+    """Time ``run``, which returns the items and bytes it handled."""
+    cpu_before, _ = _usage()
+    started = time.monotonic()
+    items, nbytes = run()
+    seconds = max(time.monotonic() - started, 1e-9)
+    cpu_after, peak_rss = _usage()
+    return {
+        'name': name,
+        'unit': unit,
+        'seconds': round(seconds, 3),
+        'items': items,
+        'bytes': nbytes,
+        'items_per_second': round(items / seconds, 2),
+        'bytes_per_second': round(nbytes / seconds),
+        'cpu_seconds': round(cpu_after - cpu_before, 3),
+        'peak_rss': peak_rss,
+    }
+
+
+def _crawl(workdir: str, ports: Tuple[int, int, int], options: CrawlOptions) -> Dict[str, object]:
+    """Crawl the synthetic site through the stand-ins; runs in its own process."""
+    _, socks_port, control_port = ports
+    os.chdir(workdir)
+    # Must be set before the downloader is imported, which binds them as defaults
+    from download_webpage_data.lib import config
+    config.TOR_SOCKS_ADDRESS = f'127.0.0.1:{socks_port}'
+    config.TOR_PROXY = {scheme: f'socks5h://{config.TOR_SOCKS_ADDRESS}' for scheme in ('http', 'https')}
+    config.TOR_CONTROL_PORT = control_port
+    if options.rate is not None:
+        config.RATE_INITIAL = options.rate
+        config.RATE_MAX = max(config.RATE_MAX, options.rate)
+    from download_webpage_data.lib.downloader import TorDownloader
+    
+    kwargs = {
+        name: value for name, value in options._asdict().items()
+        if value is not None and name != 'rate'
+    }
+    with open('crawl.log', 'w', encoding='utf-8') as log, redirect_stdout(log):
+        downloader = TorDownloader(**kwargs)
+        
+        def run() -> Tuple[int, int]:
+            if not downloader.download_website(f'http://{SITE_HOST}/'):
+                raise RuntimeError(f"Crawl failed, see {Path(workdir) / 'crawl.log'}")
+            metrics = downloader.metrics.snapshot()
+            return metrics.get('pages_total', {}).get('result=downloaded', 0), metrics.get('bytes_total', 0)
+        
+        try:
+            result = _measure(CRAWL, 'URLs', run)
+        finally:
+            downloader.close()
+    metrics = downloader.metrics.snapshot()
+    result['retries'] = metrics.get('retries_total', {})
+    result['newnym'] = metrics.get('newnym_total', 0)
+    result['timings'] = downloader.metrics.summary()
+    return result
+
+
+def _extract(workdir: str, name: str) -> Dict[str, object]:
+    """Extract the images of the crawled site; runs in its own process."""
+    os.chdir(workdir)
+    from download_webpage_data.lib.image_extractor import ImageExtractor
+    
+    def run() -> Tuple[int, int]:
+        ImageExtractor().extract_images(SITE_HOST)
+        images = [
+            entry for entry in os.scandir(Path('images') / SITE_HOST)
+            if not entry.name.startswith('.') and not entry.name.endswith('.json')
+        ]
+        return len(images), sum(entry.stat().st_size for entry in images)
+    
+    with open(f'{name}.log', 'w', encoding='utf-8') as log, redirect_stdout(log):
+        return _measure(name, 'images', run)
+
+
+def run_suite(spec: SiteSpec, options: CrawlOptions, workdir: Path,
+              benchmarks: Tuple[str, ...] = BENCHMARKS) -> List[Dict[str, object]]:
+    """Start the stand-ins, run ``benchmarks`` in ``workdir`` and return their results.
+    
+    The extraction benchmarks work on the pages the crawl downloaded, so
+    they need a crawl in the same run or an earlier one in ``workdir``.
+    """
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    stop = context.Event()
+    stand_ins = context.Process(target=serve, args=(spec, ready, stop), daemon=True)
+    stand_ins.start()
+    results = []
+    try:
+        ports = ready.get(timeout=60)
+        for name in benchmarks:
+            # A fresh process per benchmark, so peak RSS isn't carried over
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                if name == CRAWL:
+                    future = executor.submit(_crawl, str(workdir), ports, options)
+                else:
+                    future = executor.submit(_extract, str(workdir), name)
+                results.append(future.result())
+    finally:
+        stop.set()
+        stand_ins.join(5)
+        if stand_ins.is_alive():
+            stand_ins.terminate()
+    return results
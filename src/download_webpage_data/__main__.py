@@ -3,8 +3,14 @@
 
 import sys
 import argparse
-from typing import Optional
+from pathlib import Path
+from typing import List, Optional
 
+from .lib import compression
+from .lib import config
+from .lib import link_extractor
+from .lib import profiling
+from .lib import visited
 from .lib.downloader import TorDownloader
 from .lib.exceptions import TorConnectionError, DownloadError
 
@@ -18,31 +24,221 @@ def parse_args() -> argparse.Namespace:
         help="URL to download (if not provided, will prompt)",
         type=str
     )
+    parser.add_argument(
+        "--seeds",
+        help="Download every site listed in this file, one URL per line ('-' reads standard input)",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        "--sites-at-once",
+        help=f"With --seeds, number of sites crawled at the same time (default: {config.BATCH_SITES})",
+        type=int,
+        default=config.BATCH_SITES
+    )
     parser.add_argument(
         "--verify-ssl",
         help="Verify SSL certificates",
         action="store_true",
         default=False
     )
+    parser.add_argument(
+        "--resume",
+        help="Continue the previous download of the site where it stopped",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Only download pages that changed since the previous download of the site",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        help=f"Number of concurrent requests (default: {config.MAX_WORKERS})",
+        type=int,
+        default=config.MAX_WORKERS
+    )
+    parser.add_argument(
+        "--circuits", "-c",
+        help=f"Number of isolated Tor circuits to spread requests over (default: {config.CIRCUIT_POOL_SIZE})",
+        type=int,
+        default=config.CIRCUIT_POOL_SIZE
+    )
+    parser.add_argument(
+        "--parser",
+        help=f"HTML link extraction backend (default: {config.LINK_EXTRACTOR})",
+        choices=[link_extractor.AUTO, *link_extractor.BACKENDS],
+        default=config.LINK_EXTRACTOR
+    )
+    parser.add_argument(
+        "--parse-processes",
+        help="Parse HTML in this many worker processes (0 = one per CPU core)",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--strip-tracking",
+        help="Remove tracking query parameters (utm_*, fbclid, ...) from links",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--visited-set",
+        help=f"How visited URLs are remembered; 'fingerprint' and 'bloom' use far less "
+             f"memory on huge sites (default: {config.VISITED_SET})",
+        choices=visited.KINDS,
+        default=config.VISITED_SET
+    )
+    parser.add_argument(
+        "--sitemaps",
+        help="Also queue the pages listed in the site's robots.txt sitemaps; with --incremental, "
+             "skip those whose lastmod is older than their last download",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--max-depth",
+        help="Do not follow links more than this many hops from the start URL",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--max-pages",
+        help="Stop after downloading this many URLs",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--max-bytes",
+        help="Stop after downloading this many bytes",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--monitor-circuits",
+        help="Watch circuit health through the Tor control port and close slow circuits",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--pool-size",
+        help="Keep-alive connections per host on each circuit (default: one per worker)",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--no-warm-up",
+        help="Do not open connections to the start URL before crawling",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--dedup",
+        help="Store identical files once and hardlink them to their URL paths",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--output",
+        help="Write one file per URL (default) or archive responses to WARC files",
+        choices=config.OUTPUT_FORMATS,
+        default=config.OUTPUT_FORMAT
+    )
+    parser.add_argument(
+        "--compress",
+        help="Store text files compressed; media is always stored as it is (default: none)",
+        choices=compression.CODECS,
+        default=config.COMPRESSION
+    )
+    parser.add_argument(
+        "--metrics-log",
+        help="Append a JSON line per downloaded URL and a metrics summary per crawl to this file",
+        type=Path,
+        default=None
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Keep crawl metrics in this file in the Prometheus text format "
+             "(for node_exporter's textfile collector)",
+        type=Path,
+        default=None
+    )
+    parser.add_argument(
+        "--metrics-port",
+        help=f"Serve crawl metrics for Prometheus on http://{config.METRICS_HOST}:PORT/metrics",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile the crawl, worker threads included, with cProfile or pyinstrument",
+        choices=profiling.KINDS,
+        default=None
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="Where to write the profile (default: crawl.prof or crawl-profile.html)",
+        type=Path,
+        default=None
+    )
     return parser.parse_args()
 
+def with_scheme(url: str) -> str:
+    """Add https:// to a URL given without a scheme."""
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
 def get_url(url: Optional[str] = None) -> str:
     """Get URL from argument or prompt."""
     if url:
-        return url
+        return with_scheme(url)
         
-    url = input("Enter the website URL to download: ").strip()
-    if not url.startswith(('http://', 'https://')):
-        url = 'https://' + url
-    return url
+    return with_scheme(input("Enter the website URL to download: ").strip())
+
+def read_seeds(path: str) -> List[str]:
+    """Read the URLs of a seed file, skipping blank lines and # comments."""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(path).read_text(encoding='utf-8').splitlines()
+    return [
+        with_scheme(line.strip()) for line in lines
+        if line.strip() and not line.strip().startswith('#')
+    ]
 
 def main() -> int:
     """Main entry point."""
     args = parse_args()
+    profiler = None
+    downloader = None
     
     try:
+        if args.profile:
+            profiler = profiling.Profiler(args.profile, args.profile_output)
+            
         print("Initializing Tor downloader...")
-        downloader = TorDownloader(verify_ssl=args.verify_ssl)
+        downloader = TorDownloader(
+            verify_ssl=args.verify_ssl,
+            workers=args.workers,
+            circuits=args.circuits,
+            link_backend=args.parser,
+            parse_processes=args.parse_processes,
+            strip_tracking=args.strip_tracking,
+            visited_set=args.visited_set,
+            max_depth=args.max_depth,
+            max_pages=args.max_pages,
+            max_bytes=args.max_bytes,
+            monitor_circuits=args.monitor_circuits,
+            pool_size=args.pool_size,
+            warm_up=not args.no_warm_up,
+            dedup=args.dedup,
+            output_format=args.output,
+            compress=args.compress,
+            metrics_log=args.metrics_log,
+            metrics_textfile=args.metrics_textfile,
+            metrics_port=args.metrics_port,
+            profiler=profiler,
+            sitemaps=args.sitemaps
+        )
         
         # Check Tor connection
         print("Checking Tor connection...")
@@ -51,17 +247,42 @@ def main() -> int:
             print("On Manjaro/Arch: sudo systemctl start tor")
             return 1
             
-        # Get and validate URL
-        url = get_url(args.url)
+        # Get and validate URLs
+        if args.seeds:
+            urls = read_seeds(args.seeds) + ([with_scheme(args.url)] if args.url else [])
+            if not urls:
+                print(f"ERROR: No URLs found in {args.seeds}")
+                return 1
+        else:
+            urls = [get_url(args.url)]
         
-        # Download website
-        success = downloader.download_website(url)
+        # Download websites
+        if profiler is not None:
+            profiler.start()
+        try:
+            results = downloader.download_websites(
+                urls,
+                resume=args.resume,
+                incremental=args.incremental,
+                sites_at_once=args.sites_at_once
+            )
+            success = bool(results) and all(results.values())
+        finally:
+            if profiler is not None:
+                profiler.stop()
         
         if success:
-            print("\nWebsite downloaded successfully!")
+            if len(results) > 1:
+                print(f"\nAll {len(results)} websites downloaded successfully!")
+            else:
+                print("\nWebsite downloaded successfully!")
             return 0
         else:
-            print("\nFailed to download website.")
+            failed = [site for site, downloaded in results.items() if not downloaded]
+            if len(results) > 1:
+                print(f"\nFailed to download {len(failed)} of {len(results)} websites: {', '.join(failed)}")
+            else:
+                print("\nFailed to download website.")
             return 1
             
     except KeyboardInterrupt:
@@ -76,6 +297,9 @@ def main() -> int:
     except Exception as e:
         print(f"\nAn unexpected error occurred: {e}")
         return 1
+    finally:
+        if downloader is not None:
+            downloader.close()
 
 if __name__ == "__main__":
     sys.exit(main()) 
\ No newline at end of file
@@ -2,11 +2,34 @@
 """Command-line script to extract images from downloaded websites."""
 
 import sys
+import argparse
 from pathlib import Path
 
+from .lib import config
+from .lib import export
 from .lib.image_extractor import ImageExtractor
 from .lib.exceptions import FileSystemError
 
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Extract images from websites downloaded with download-webpage"
+    )
+    parser.add_argument(
+        "--mode",
+        help="How images are placed in images/<website>: copies, or links to the downloaded "
+             f"files where the filesystem allows (default: {config.IMAGE_EXPORT_MODE})",
+        choices=export.MODES,
+        default=config.IMAGE_EXPORT_MODE
+    )
+    parser.add_argument(
+        "--similar",
+        help="Also group near-duplicate images (resized, recompressed) by perceptual hash and "
+             f"list the groups in images/<website>/{config.SIMILAR_IMAGES_FILENAME} (needs Pillow)",
+        action="store_true"
+    )
+    return parser.parse_args()
+
 def select_website(websites: list) -> str:
     """Let user select a website from the list."""
     if not websites:
@@ -33,9 +56,11 @@ def select_website(websites: list) -> str:
 
 def main() -> int:
     """Main entry point."""
+    args = parse_args()
+    
     try:
         # Initialize image extractor
-        extractor = ImageExtractor()
+        extractor = ImageExtractor(mode=args.mode, similar=args.similar)
         
         # Get list of websites
         websites = extractor.list_websites()
@@ -48,7 +73,7 @@ def main() -> int:
         # Extract images
         count = extractor.extract_images(website)
         
-        print(f"\nExtracted {count} images to images/{website}/")
+        print(f"\nExtracted {count} new images to images/{website}/")
         return 0
         
     except KeyboardInterrupt:
@@ -0,0 +1,115 @@
+"""Content-addressed storage of downloaded bodies."""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Set
+
+from . import config
+from .exceptions import FileSystemError
+
+
+class BlobStore:
+    """Keep each distinct body once, named by its SHA-256 digest.
+
+    Files under the site's directory are hardlinks to their blob, so the
+    directory looks the same as without deduplication. Where hardlinks are
+    not possible (e.g. the filesystem lacks them, or a blob has reached the
+    link limit) the file is written as a separate copy instead, and the blob
+    is listed in ``BLOB_COPIES_FILENAME`` so it is never pruned.
+    """
+
+    def __init__(self, root: Path):
+        """Use ``root`` as the blob directory."""
+        self.root = root
+        self.copies_path = root / config.BLOB_COPIES_FILENAME
+        self._copies = self._load_copies()
+        self._lock = threading.Lock()
+        self.files = 0
+        self.unique_bytes = 0
+        self.saved_bytes = 0
+
+    def blob_path(self, digest: str) -> Path:
+        """Path of the blob with the given SHA-256 hex digest."""
+        return self.root / digest[:2] / digest
+
+    def _link(self, blob: Path, filepath: Path) -> bool:
+        """Point ``filepath`` at ``blob``; returns False if a copy had to be made."""
+        temp_path = filepath.with_name(filepath.name + '.link')
+        temp_path.unlink(missing_ok=True)
+        try:
+            os.link(blob, temp_path)
+            linked = True
+        except OSError:
+            shutil.copyfile(blob, temp_path)
+            linked = False
+            if blob.name not in self._copies:
+                with open(self.copies_path, 'a', encoding='utf-8') as f:
+                    f.write(f"{blob.name}\n")
+                self._copies.add(blob.name)
+        os.replace(temp_path, filepath)
+        return linked
+
+    def _load_copies(self) -> Set[str]:
+        """Names of the blobs some file is a copy of rather than a link to."""
+        try:
+            return set(self.copies_path.read_text(encoding='utf-8').split())
+        except FileNotFoundError:
+            return set()
+        except OSError as e:
+            raise FileSystemError(f"Error reading {self.copies_path}: {e}")
+
+    def commit(self, partial_path: Path, filepath: Path, digest: str) -> None:
+        """Move a finished download into the store and link ``filepath`` to it.
+
+        If the blob already exists the download is dropped and the bytes
+        count as saved.
+        """
+        blob = self.blob_path(digest)
+        try:
+            with self._lock:
+                self.files += 1
+                if blob.exists():
+                    size = blob.stat().st_size
+                    partial_path.unlink()
+                    if filepath.exists() and os.path.samefile(blob, filepath):
+                        self.saved_bytes += size
+                        return
+                else:
+                    size = partial_path.stat().st_size
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(partial_path, blob)
+                    self.unique_bytes += size
+                    size = 0
+                if self._link(blob, filepath):
+                    self.saved_bytes += size
+        except OSError as e:
+            raise FileSystemError(f"Error saving file {filepath}: {e}")
+
+    def prune(self) -> int:
+        """Delete blobs no file links to any more and return the bytes freed.
+
+        Blobs lose their last link when a page changes and its file is
+        replaced by a link to the new body. Blobs that were copied are kept,
+        as their link count doesn't show whether the copies still exist.
+        """
+        freed = 0
+        with self._lock:
+            for blob in self.root.glob('*/*'):
+                if blob.name in self._copies:
+                    continue
+                try:
+                    stat = blob.stat()
+                    if stat.st_nlink == 1:
+                        blob.unlink()
+                        freed += stat.st_size
+                except OSError:
+                    continue
+        return freed
+
+    def summary(self) -> str:
+        """Describe how much deduplication saved."""
+        with self._lock:
+            return (f"{self.files} files stored, {self.unique_bytes} bytes of new content, "
+                    f"{self.saved_bytes} bytes saved by deduplication")
@@ -0,0 +1,94 @@
+"""Feed Tor's own circuit measurements into a ``CircuitPool``."""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from stem import CircStatus, StreamStatus
+from stem.control import EventType
+
+from . import config
+from .circuits import Circuit, CircuitPool
+from .tor_control import TorController
+
+
+class CircuitMonitor:
+    """Watch CIRC, CIRC_BW and STREAM events on the control port.
+    
+    CIRC events tell which Tor circuits belong to which pool circuit, since
+    Tor reports the SOCKS credentials that caused a circuit to be built.
+    CIRC_BW reports bytes moved per circuit about once a second, which gives
+    throughput without timing responses ourselves. Streams Tor has to detach
+    and retry elsewhere count as errors of the circuit they were on. Evicted
+    circuits are closed in Tor so no stream lingers on them.
+    """
+    
+    def __init__(self, tor_control: TorController, pool: CircuitPool):
+        """Subscribe to events; raises ``TorIdentityError`` without a control port."""
+        self.tor_control = tor_control
+        self.pool = pool
+        self._lock = threading.Lock()
+        # Tor circuit ID -> (pool circuit, renew generation it was built for)
+        self._owners: Dict[str, Tuple[Circuit, int]] = {}
+        self._last_bandwidth: Dict[str, float] = {}
+        pool.on_evict = self._close_circuits
+        tor_control.add_event_listener(
+            self._on_event, EventType.CIRC, EventType.CIRC_BW, EventType.STREAM
+        )
+    
+    def _owner(self, circuit_id: str) -> Optional[Circuit]:
+        owner = self._owners.get(circuit_id)
+        if owner is None:
+            return None
+        circuit, generation = owner
+        # Circuits built for credentials we have since replaced don't count
+        return circuit if circuit.generation == generation else None
+    
+    def _on_event(self, event) -> None:
+        # Called from stem's event thread
+        try:
+            if event.type == 'CIRC':
+                self._on_circuit(event)
+            elif event.type == 'CIRC_BW':
+                self._on_bandwidth(event)
+            elif event.type == 'STREAM':
+                self._on_stream(event)
+        except Exception as e:
+            print(f"Error handling Tor {event.type} event: {e}")
+    
+    def _on_circuit(self, event) -> None:
+        with self._lock:
+            if event.status == CircStatus.BUILT:
+                circuit = self.pool.by_username(event.socks_username)
+                if circuit is None or event.socks_password != circuit.password:
+                    return
+                self._owners[event.id] = (circuit, circuit.generation)
+                circuit.tor_circuits.append(event.id)
+            elif event.status in (CircStatus.CLOSED, CircStatus.FAILED):
+                owner = self._owners.pop(event.id, None)
+                self._last_bandwidth.pop(event.id, None)
+                if owner is not None and event.id in owner[0].tor_circuits:
+                    owner[0].tor_circuits.remove(event.id)
+    
+    def _on_bandwidth(self, event) -> None:
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._owner(event.id)
+            last = self._last_bandwidth.get(event.id)
+            self._last_bandwidth[event.id] = now
+        # Only busy intervals say something about what the circuit can carry
+        if circuit is None or last is None or event.read < config.CIRCUIT_MIN_SAMPLE_BYTES:
+            return
+        self.pool.record_throughput(circuit, event.read / max(now - last, 0.1))
+    
+    def _on_stream(self, event) -> None:
+        if event.status != StreamStatus.DETACHED or not event.circ_id:
+            return
+        with self._lock:
+            circuit = self._owner(event.circ_id)
+        if circuit is not None:
+            self.pool.record_error(circuit)
+    
+    def _close_circuits(self, circuit_ids: List[str]) -> None:
+        for circuit_id in list(circuit_ids):
+            self.tor_control.close_circuit(circuit_id)
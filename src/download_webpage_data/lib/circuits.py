@@ -0,0 +1,244 @@
+"""Pool of isolated Tor circuits backed by SOCKS username/password isolation."""
+
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import requests
+
+from . import config
+
+SessionFactory = Callable[[Dict[str, str]], requests.Session]
+
+
+def _ewma(average: Optional[float], sample: float, alpha: float) -> float:
+    return sample if average is None else average + alpha * (sample - average)
+
+
+class CircuitStats(NamedTuple):
+    """Snapshot of one circuit's health."""
+    
+    index: int
+    generation: int
+    workers: int
+    requests: int
+    # Bytes/s while transferring; None until measured
+    throughput: Optional[float]
+    # Seconds from sending a request to receiving the response headers
+    ttfb: Optional[float]
+    error_rate: float
+
+
+class Circuit:
+    """A logical Tor client; its SOCKS credentials select the circuit Tor uses.
+    
+    Throughput comes from Tor's CIRC_BW events when a ``CircuitMonitor`` is
+    running, and from the transfer time of large responses otherwise. Small
+    responses only count towards time-to-first-byte, since their duration is
+    all latency.
+    """
+    
+    # Weight of the newest sample in the moving averages
+    EWMA_ALPHA = 0.3
+    
+    def __init__(self, index: int, session_factory: SessionFactory):
+        """Initialize the circuit with fresh credentials."""
+        self.index = index
+        self.username = f"dld-{index}"
+        self.generation = 0
+        self._session_factory = session_factory
+        self.renew()
+    
+    @property
+    def proxies(self) -> Dict[str, str]:
+        """Proxy mapping carrying this circuit's isolation credentials."""
+        proxy = f"socks5h://{self.username}:{self.password}@{config.TOR_SOCKS_ADDRESS}"
+        return {'http': proxy, 'https': proxy}
+    
+    def renew(self) -> None:
+        """Switch to new credentials so Tor builds a new circuit for us."""
+        self.password = secrets.token_hex(8)
+        self.generation += 1
+        previous = getattr(self, 'session', None)
+        self.session = self._session_factory(self.proxies)
+        if previous is not None:
+            # Idle connections go now, busy ones once their response is closed
+            previous.close()
+        self.requests = 0
+        self.samples = 0
+        self.throughput: Optional[float] = None
+        self.ttfb: Optional[float] = None
+        self.error_rate = 0.0
+        self.slow_since: Optional[float] = None
+        # Tor circuit IDs currently carrying this client's streams
+        self.tor_circuits: List[str] = []
+    
+    def record(self, nbytes: int, ttfb: float, elapsed: float) -> None:
+        """Record a finished response."""
+        self.requests += 1
+        self.ttfb = _ewma(self.ttfb, ttfb, self.EWMA_ALPHA)
+        self.error_rate = _ewma(self.error_rate, 0.0, self.EWMA_ALPHA)
+        if nbytes >= config.CIRCUIT_MIN_SAMPLE_BYTES:
+            self.record_throughput(nbytes / max(elapsed - ttfb, 1e-3))
+    
+    def record_throughput(self, rate: float) -> None:
+        """Add a throughput measurement in bytes/s."""
+        self.throughput = _ewma(self.throughput, rate, self.EWMA_ALPHA)
+        self.samples += 1
+    
+    def record_error(self) -> None:
+        """Record a failed request or stream."""
+        self.requests += 1
+        self.error_rate = _ewma(self.error_rate, 1.0, self.EWMA_ALPHA)
+
+
+class CircuitPool:
+    """Assign worker threads to a fixed number of isolated circuits.
+    
+    Threads are moved every ``CIRCUIT_REBALANCE_EVERY`` requests to the
+    circuit with the most throughput per assigned worker, so fast circuits
+    get more of the work.
+    """
+    
+    def __init__(self, size: int, session_factory: SessionFactory):
+        """Create ``size`` circuits, each with its own session."""
+        self.circuits: List[Circuit] = [
+            Circuit(index, session_factory) for index in range(max(1, size))
+        ]
+        self._assignments: Dict[int, Circuit] = {}
+        self._requests: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        # Called with the Tor circuit IDs of each evicted circuit, e.g. to close them
+        self.on_evict: Optional[Callable[[List[str]], None]] = None
+    
+    def __len__(self) -> int:
+        return len(self.circuits)
+    
+    def _load(self) -> Dict[int, int]:
+        load = {c.index: 0 for c in self.circuits}
+        for assigned in self._assignments.values():
+            load[assigned.index] += 1
+        return load
+    
+    def _pick(self, thread_id: int) -> Circuit:
+        """Choose the circuit offering the most throughput per worker."""
+        load = self._load()
+        current = self._assignments.get(thread_id)
+        if current is not None:
+            load[current.index] -= 1
+        measured = [c.throughput for c in self.circuits if c.throughput is not None]
+        # Unmeasured circuits are assumed to be as good as the best one
+        default = max(measured, default=1.0)
+        return max(
+            self.circuits,
+            key=lambda c: ((c.throughput if c.throughput is not None else default)
+                           / (load[c.index] + 1), c is current)
+        )
+    
+    def current(self) -> Circuit:
+        """Return the circuit of the calling thread, picking a new one now and then."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            count = self._requests.get(thread_id, 0)
+            self._requests[thread_id] = count + 1
+            if thread_id not in self._assignments or count % config.CIRCUIT_REBALANCE_EVERY == 0:
+                self._assignments[thread_id] = self._pick(thread_id)
+            return self._assignments[thread_id]
+    
+    def by_username(self, username: Optional[str]) -> Optional[Circuit]:
+        """Find the circuit using a SOCKS username."""
+        for circuit in self.circuits:
+            if circuit.username == username:
+                return circuit
+        return None
+    
+    def renew_all(self) -> None:
+        """Give every circuit new credentials, dropping connections on old circuits."""
+        with self._lock:
+            for circuit in self.circuits:
+                circuit.renew()
+    
+    def record(self, circuit: Circuit, nbytes: int, ttfb: float, elapsed: float) -> None:
+        """Record a response on a circuit and check its health."""
+        with self._lock:
+            circuit.record(nbytes, ttfb, elapsed)
+            evicted = self._check(circuit)
+        self._evicted(evicted)
+    
+    def record_error(self, circuit: Circuit) -> None:
+        """Record a failed request on a circuit and check its health."""
+        with self._lock:
+            circuit.record_error()
+            evicted = self._check(circuit)
+        self._evicted(evicted)
+    
+    def record_throughput(self, circuit: Circuit, rate: float) -> None:
+        """Record throughput measured by Tor and check the circuit's health."""
+        with self._lock:
+            circuit.record_throughput(rate)
+            evicted = self._check(circuit)
+        self._evicted(evicted)
+    
+    def _unhealthy_reason(self, circuit: Circuit) -> Optional[str]:
+        """Explain why a circuit should be replaced, or return None if it is fine."""
+        if circuit.requests >= config.CIRCUIT_MIN_SAMPLES and \
+                circuit.error_rate > config.CIRCUIT_MAX_ERROR_RATE:
+            return f"error rate {circuit.error_rate:.0%}"
+        if circuit.samples < config.CIRCUIT_MIN_SAMPLES or circuit.throughput is None:
+            return None
+        
+        fastest = max(
+            (c.throughput for c in self.circuits
+             if c is not circuit and c.throughput is not None and
+             c.samples >= config.CIRCUIT_MIN_SAMPLES),
+            default=0.0
+        )
+        if fastest and circuit.throughput < fastest * config.SLOW_CIRCUIT_RATIO:
+            return f"{circuit.throughput / 1024:.1f} KB/s, fastest is {fastest / 1024:.1f} KB/s"
+        
+        if circuit.throughput < config.CIRCUIT_MIN_THROUGHPUT:
+            now = time.monotonic()
+            if circuit.slow_since is None:
+                circuit.slow_since = now
+            elif now - circuit.slow_since >= config.CIRCUIT_EVICT_AFTER:
+                return f"below {config.CIRCUIT_MIN_THROUGHPUT / 1024:.0f} KB/s for " \
+                       f"{now - circuit.slow_since:.0f}s"
+        else:
+            circuit.slow_since = None
+        return None
+    
+    def _check(self, circuit: Circuit) -> Optional[List[str]]:
+        """Rotate the circuit if it is unhealthy and return its old Tor circuit IDs.
+        
+        Workers stay bound to the circuit slot, so rotating its credentials
+        moves all of them onto a freshly built circuit.
+        """
+        reason = self._unhealthy_reason(circuit)
+        if reason is None:
+            return None
+        print(f"Circuit {circuit.index} is unhealthy ({reason}), switching to a new one")
+        evicted = circuit.tor_circuits
+        circuit.renew()
+        return evicted
+    
+    def _evicted(self, tor_circuits: Optional[List[str]]) -> None:
+        if tor_circuits is not None and self.on_evict is not None:
+            self.on_evict(tor_circuits)
+    
+    def stats(self) -> List[CircuitStats]:
+        """Return a health snapshot of every circuit."""
+        with self._lock:
+            load = self._load()
+            return [
+                CircuitStats(
+                    c.index,
+                    c.generation,
+                    load[c.index],
+                    c.requests,
+                    c.throughput,
+                    c.ttfb,
+                    c.error_rate
+                )
+                for c in self.circuits
+            ]
@@ -0,0 +1,94 @@
+"""Compressed-at-rest storage of downloaded files.
+
+A compressed file is stored next to where the plain file would be, with
+``#`` and the codec's suffix appended (``index.html#.gz``,
+``app.js#.zst``). A URL path never contains ``#``, so no download is saved
+under that name: a site's own ``app.js.gz`` stays a file of its own. Which
+codec each URL was stored with is recorded in the crawl state
+(``Resource.codec``). Code that reads downloaded files goes through
+``find_stored``, ``open_content`` and ``read_content`` with that codec,
+which work the same for compressed and plain files.
+"""
+
+import gzip
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from . import config
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+NONE = 'none'
+SUFFIXES: Dict[str, str] = {'gzip': '#.gz', 'zstd': '#.zst'}
+CODECS = (NONE, *SUFFIXES)
+
+
+def resolve_codec(name: str = NONE) -> Optional[str]:
+    """Check a codec name; returns None for no compression."""
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression: {name}")
+    if name == 'zstd' and zstandard is None:
+        raise ValueError("zstd compression needs the 'zstandard' package")
+    return None if name == NONE else name
+
+
+def should_compress(content_type: Optional[str], filepath: Path) -> bool:
+    """Whether a body is worth compressing.
+
+    Textual content types compress well; images other than SVG, audio,
+    video and archives are already compressed and are stored as they are.
+    Without a content type the file extension decides.
+    """
+    if content_type:
+        mime = content_type.split(';')[0].strip().lower()
+        return mime.startswith(config.COMPRESSIBLE_TYPES)
+    return filepath.suffix.lower() in config.COMPRESSIBLE_EXTENSIONS
+
+
+def compressed_path(filepath: Path, codec: Optional[str]) -> Path:
+    """Path a file is stored at with ``codec``."""
+    if codec is None:
+        return filepath
+    return filepath.with_name(filepath.name + SUFFIXES[codec])
+
+
+def open_writer(fileobj: BinaryIO, codec: str) -> BinaryIO:
+    """Wrap ``fileobj`` so data written to the wrapper is compressed.
+
+    Closing the wrapper finishes the compressed stream but leaves
+    ``fileobj`` open.
+    """
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=config.GZIP_LEVEL)
+    return zstandard.ZstdCompressor(level=config.ZSTD_LEVEL).stream_writer(
+        fileobj, closefd=False
+    )
+
+
+def find_stored(filepath: Path, codec: Optional[str] = None) -> Optional[Path]:
+    """Find the file downloaded to ``filepath`` and stored with ``codec``, if it exists."""
+    path = compressed_path(filepath, codec)
+    return path if path.is_file() else None
+
+
+def open_content(filepath: Path, codec: Optional[str] = None) -> BinaryIO:
+    """Open the file downloaded to ``filepath`` for reading its original bytes."""
+    path = find_stored(filepath, codec)
+    if path is None:
+        raise FileNotFoundError(f"No downloaded file at {filepath}")
+    if codec is None:
+        return open(path, 'rb')
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    if zstandard is None:
+        raise ValueError(f"Reading {path} needs the 'zstandard' package")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def read_content(filepath: Path, codec: Optional[str] = None) -> bytes:
+    """Read the original bytes of the file downloaded to ``filepath``."""
+    with open_content(filepath, codec) as f:
+        return f.read()
@@ -10,20 +10,213 @@ DEFAULT_HEADERS = {
 }
 
 # Tor proxy configuration
+TOR_SOCKS_ADDRESS = '127.0.0.1:9050'
 TOR_PROXY = {
-    'http': 'socks5h://127.0.0.1:9050',
-    'https': 'socks5h://127.0.0.1:9050'
+    'http': f'socks5h://{TOR_SOCKS_ADDRESS}',
+    'https': f'socks5h://{TOR_SOCKS_ADDRESS}'
 }
 
+# Tor control port, used to request new identities (NEWNYM)
+TOR_CONTROL_PORT = 9051
+# None authenticates with the cookie file or no authentication
+TOR_CONTROL_PASSWORD = None
+# Tor ignores NEWNYM sent within this many seconds of the previous one
+NEWNYM_MIN_INTERVAL = 10.0
+# How long requests wait for a new circuit after NEWNYM, in seconds, and
+# how often that wait checks whether the crawl was interrupted
+NEWNYM_CIRCUIT_TIMEOUT = 15.0
+NEWNYM_STOP_CHECK_INTERVAL = 0.1
+
+# Circuit pool settings. Tor's SocksPort isolates streams by SOCKS
+# username/password by default (IsolateSOCKSAuth), so each set of
+# credentials gets its own circuit and exit relay.
+CIRCUIT_POOL_SIZE = 4
+# A circuit is rotated when its throughput drops below this fraction
+# of the fastest circuit in the pool
+SLOW_CIRCUIT_RATIO = 0.25
+# Measurements a circuit needs before its throughput or error rate is judged
+CIRCUIT_MIN_SAMPLES = 5
+# Responses (or CIRC_BW intervals) smaller than this are all latency and
+# don't count towards throughput
+CIRCUIT_MIN_SAMPLE_BYTES = 32 * 1024
+# A circuit is also rotated when it stays below this many bytes/s for
+# CIRCUIT_EVICT_AFTER seconds, or when its error rate exceeds the maximum
+CIRCUIT_MIN_THROUGHPUT = 20 * 1024
+CIRCUIT_EVICT_AFTER = 30.0
+CIRCUIT_MAX_ERROR_RATE = 0.5
+# Requests after which a worker may move to a faster circuit
+CIRCUIT_REBALANCE_EVERY = 10
+
 # Download settings
 DOWNLOAD_TIMEOUT = 30
 MAX_RETRIES = 3
 DOWNLOAD_DIR = "downloads"
+# Bodies that are not parsed for links are streamed to disk in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Suffix of files that are still being written
+PARTIAL_SUFFIX = '.part'
+# Suffix of the file next to a partial download holding the validator
+# (ETag or Last-Modified) used to resume it with an If-Range request
+VALIDATOR_SUFFIX = '.validator'
+# Content-addressed store in each site's download directory used with --dedup;
+# bodies are kept once under their SHA-256 and hardlinked to their URL paths
+BLOB_DIRNAME = '.blobs'
+# File in the blob directory listing blobs that had to be copied instead of
+# hardlinked; their link count says nothing about whether they are in use
+BLOB_COPIES_FILENAME = 'copied'
+
+# Output backends: 'files' writes one file per URL under downloads/<domain>,
+# 'warc' appends responses to WARC files in downloads/<domain>/WARC_DIRNAME
+OUTPUT_FORMATS = ('files', 'warc')
+OUTPUT_FORMAT = 'files'
+WARC_DIRNAME = 'warc'
+# A new WARC file is started once the current one reaches this size
+WARC_MAX_SIZE = 1024 * 1024 * 1024
+WARC_INDEX_FILENAME = 'index.cdxj'
+# Bodies larger than this are spooled to a temporary file before being archived
+WARC_SPOOL_SIZE = 4 * 1024 * 1024
+
+# Compressed-at-rest storage used with --compress. Only bodies with these
+# content types (or, without one, these extensions) are compressed; media
+# formats are compressed already and stored as they are.
+COMPRESSIBLE_TYPES = (
+    'text/', 'image/svg+xml', 'application/javascript', 'application/x-javascript',
+    'application/ecmascript', 'application/json', 'application/ld+json',
+    'application/manifest+json', 'application/xml', 'application/xhtml+xml',
+    'application/rss+xml', 'application/atom+xml', 'application/x-font-ttf',
+    'font/ttf', 'font/otf', 'application/vnd.ms-fontobject', 'application/wasm',
+)
+COMPRESSIBLE_EXTENSIONS = frozenset({
+    '.html', '.htm', '.xhtml', '.css', '.js', '.mjs', '.json', '.xml', '.svg', '.txt',
+    '.csv', '.md', '.rss', '.atom', '.map', '.ttf', '.otf', '.eot', '.wasm',
+})
+COMPRESSION = 'none'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# Retries wait a random time between 0 and BACKOFF_BASE * 2**attempt
+# seconds, capped at BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Longest Retry-After we honour, in seconds
+MAX_RETRY_AFTER = 300.0
+
+# Per-host request rate (requests/s), adapted with additive increase on
+# success and multiplicative decrease on throttling, errors and latency
+# spikes
+RATE_INITIAL = 8.0
+RATE_MIN = 0.1
+RATE_MAX = 50.0
+RATE_INCREASE = 0.5
+RATE_DECREASE = 0.5
+# Latency above this multiple of the host's best latency counts as congestion
+LATENCY_BACKOFF_FACTOR = 4.0
+LATENCY_DECREASE = 0.9
+# Status codes that mean the host wants us to slow down
+THROTTLE_STATUS_CODES = (403, 429, 503)
+# Server errors that are usually transient and retried with backoff
+RETRY_STATUS_CODES = (500, 502, 504)
+
+# Number of requests kept in flight at once during a crawl
+MAX_WORKERS = 8
+# Sites crawled at the same time, sharing the workers, when downloading a seed list
+BATCH_SITES = 8
+
+# Connection pool settings, per circuit. Each circuit keeps up to POOL_SIZE
+# keep-alive connections per host (None means one per worker) for up to
+# POOL_HOSTS hosts. With POOL_BLOCK requests wait for a pooled connection
+# instead of opening an extra one that is closed right after.
+POOL_SIZE = None
+POOL_HOSTS = 10
+POOL_BLOCK = True
+# Open each circuit's connections to the start URL's host before crawling
+POOL_WARM_UP = True
+
+# How visited URLs are remembered: 'exact' (set of URLs), 'fingerprint'
+# (64-bit hashes) or 'bloom' (Bloom filter); see lib/visited.py
+VISITED_SET = 'exact'
+BLOOM_CAPACITY = 10_000_000
+BLOOM_ERROR_RATE = 0.001
+# File next to the downloads the Bloom filter is memory-mapped from
+BLOOM_FILENAME = '.visited.bloom'
+
+# File extensions the crawl scheduler uses to order downloads: pages
+# first, then the assets they need, then anything else, large media last
+PAGE_EXTENSIONS = frozenset({
+    '.html', '.htm', '.xhtml', '.shtml', '.php', '.asp', '.aspx', '.jsp', '.cgi',
+})
+ASSET_EXTENSIONS = frozenset({
+    '.css', '.js', '.mjs', '.json', '.xml', '.txt',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico', '.avif', '.bmp',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot',
+})
+MEDIA_EXTENSIONS = frozenset({
+    '.mp4', '.webm', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.m4v',
+    '.mp3', '.ogg', '.wav', '.flac', '.m4a', '.aac',
+    '.zip', '.tar', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.iso', '.dmg', '.exe',
+})
+
+# Crawl state database kept in each site's download directory
+STATE_FILENAME = '.crawl-state.sqlite'
+# Status changes are written to the state database once this many are
+# buffered, or after this many seconds, whichever comes first
+STATE_CHECKPOINT_SIZE = 200
+STATE_CHECKPOINT_INTERVAL = 5.0
+
+# Sitemap discovery used with --sitemaps (see lib/sitemaps.py): levels of
+# sitemap indexes followed, sitemap files read and URLs queued at most, and
+# the largest (decompressed) sitemap read; the protocol allows 50 MB
+SITEMAP_MAX_DEPTH = 3
+SITEMAP_MAX_FILES = 1000
+SITEMAP_MAX_URLS = 1_000_000
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
 
 # File types and extensions
 HTML_CONTENT_TYPE = 'text/html'
 DEFAULT_INDEX = 'index.html'
 
 # Tags to search for when parsing HTML
-LINK_TAGS = ['a', 'link', 'script', 'img']
-LINK_ATTRS = ['href', 'src'] 
\ No newline at end of file
+LINK_TAGS = ['a', 'link', 'script', 'img', 'source']
+LINK_ATTRS = ['href', 'src', 'srcset']
+# Query parameters dropped from URLs when tracking parameters are stripped
+TRACKING_PARAMS = frozenset({
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', 'igshid', 'ref_src',
+})
+TRACKING_PARAM_PREFIXES = ('utm_',)
+# Link extraction backend: 'auto' (lxml if installed, else 'tokenizer'),
+# 'lxml', 'tokenizer', 'strainer' or 'html.parser'
+LINK_EXTRACTOR = 'auto' 
+
+# Image extraction: threads copying images, HTML files needed before parsing
+# is spread over processes, files handed to a process at once, and seconds
+# between progress reports
+IMAGE_COPY_THREADS = 8
+IMAGE_PARALLEL_MIN_HTML = 50
+IMAGE_PARSE_CHUNK_SIZE = 64
+IMAGE_PROGRESS_INTERVAL = 1.0
+# How images are placed in images/<website>: 'copy', 'hardlink', 'reflink',
+# 'symlink' or 'auto' (hardlink, then reflink); all fall back to copying
+IMAGE_EXPORT_MODE = 'copy'
+# Index kept in images/<website> so reruns only process new or changed files
+IMAGE_INDEX_FILENAME = '.image-index.sqlite'
+# With --similar, images whose perceptual hashes differ in at most this many
+# of 64 bits are grouped; must stay below 4 for the banded lookup in phash.py
+PHASH_MAX_DISTANCE = 3
+SIMILAR_IMAGES_FILENAME = 'similar-images.json'
+
+# Crawl metrics (see lib/metrics.py). Metric names get this prefix in the
+# Prometheus output; histogram bucket upper bounds are in seconds and bytes
+METRICS_PREFIX = 'dld_'
+METRICS_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+# The /metrics endpoint only listens locally
+METRICS_HOST = '127.0.0.1'
+# Seconds between rewrites of the Prometheus textfile during a crawl
+METRICS_TEXTFILE_INTERVAL = 10.0
+
+# Profiling (see lib/profiling.py): default output files, pyinstrument's
+# sampling interval in seconds and the functions printed from a cProfile run
+PROFILE_OUTPUTS = {'cprofile': 'crawl.prof', 'pyinstrument': 'crawl-profile.html'}
+PROFILE_INTERVAL = 0.001
+PROFILE_TOP = 25
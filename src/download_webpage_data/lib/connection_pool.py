@@ -0,0 +1,105 @@
+"""HTTP connection pooling over Tor with connection setup timing."""
+
+import threading
+import time
+from typing import Dict, Optional, Type
+
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+
+from .metrics import Metrics
+
+
+class ConnectionStats:
+    """Thread-safe totals of connection setup versus request time.
+    
+    Over Tor, opening a connection means a SOCKS handshake with the local
+    Tor client, Tor extending the stream to the exit, and for HTTPS a TLS
+    handshake through three relays. Comparing ``connections`` with
+    ``requests`` shows how well keep-alive spreads that cost. Handshake
+    times also go to ``metrics``, if given.
+    """
+    
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.handshake_time = 0.0
+        self.requests = 0
+        self.ttfb_time = 0.0
+        self.transfer_time = 0.0
+    
+    def record_handshake(self, elapsed: float) -> None:
+        """Record a new connection and the time its SOCKS and TLS setup took."""
+        with self._lock:
+            self.connections += 1
+            self.handshake_time += elapsed
+        if self.metrics is not None:
+            self.metrics.observe('connect_seconds', elapsed)
+    
+    def record_request(self, ttfb: float, elapsed: float) -> None:
+        """Record a request's time to first byte and total duration."""
+        with self._lock:
+            self.requests += 1
+            self.ttfb_time += ttfb
+            self.transfer_time += elapsed - ttfb
+    
+    def summary(self) -> str:
+        """Describe connection reuse and where request time went."""
+        with self._lock:
+            if not self.connections or not self.requests:
+                return f"{self.connections} connections opened for {self.requests} requests"
+            return (
+                f"{self.connections} connections opened for {self.requests} requests "
+                f"({self.requests / self.connections:.1f} requests per connection); "
+                f"handshake {self.handshake_time / self.connections * 1000:.0f} ms per connection, "
+                f"first byte {self.ttfb_time / self.requests * 1000:.0f} ms and "
+                f"transfer {self.transfer_time / self.requests * 1000:.0f} ms per request"
+            )
+
+
+class PooledAdapter(HTTPAdapter):
+    """``HTTPAdapter`` whose connections report their setup time to ``stats``.
+    
+    ``pool_maxsize`` connections are kept alive per host; with ``pool_block``
+    callers wait for a free connection rather than opening one that is
+    thrown away afterwards.
+    """
+    
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        """Create the adapter; ``kwargs`` are passed to ``HTTPAdapter``."""
+        self.stats = stats
+        self._pool_classes: Dict[Type, Type] = {}
+        super().__init__(**kwargs)
+    
+    def _timed_pool_class(self, pool_cls: Type) -> Type:
+        """Subclass ``pool_cls`` so its connections time ``connect()``."""
+        if pool_cls not in self._pool_classes:
+            stats = self.stats
+            
+            class TimedConnection(pool_cls.ConnectionCls):
+                def connect(self):
+                    started = time.monotonic()
+                    super().connect()
+                    stats.record_handshake(time.monotonic() - started)
+            
+            self._pool_classes[pool_cls] = type(
+                pool_cls.__name__, (pool_cls,), {'ConnectionCls': TimedConnection}
+            )
+        return self._pool_classes[pool_cls]
+    
+    def _instrument(self, manager: PoolManager) -> PoolManager:
+        manager.pool_classes_by_scheme = {
+            scheme: self._timed_pool_class(pool_cls)
+            for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+        }
+        return manager
+    
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self._instrument(self.poolmanager)
+    
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        created = proxy not in self.proxy_manager
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        return self._instrument(manager) if created else manager
@@ -0,0 +1,202 @@
+"""Persistent crawl state so interrupted crawls can be resumed."""
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import config
+from .exceptions import FileSystemError
+
+if TYPE_CHECKING:
+    from .visited import VisitedSet
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Resource(NamedTuple):
+    """What the last download of a URL returned, for conditional re-crawls."""
+    
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # SHA-256 of the body; only kept for HTML
+    content_hash: Optional[str] = None
+    # Links found in the page; None for anything that isn't HTML
+    outlinks: Optional[List[str]] = None
+    # Unix time the content was last downloaded or confirmed unchanged
+    fetched: Optional[float] = None
+    # Codec the file was stored compressed with (see lib/compression.py); None if plain
+    codec: Optional[str] = None
+
+
+def stored_codecs(output_dir: Path) -> Dict[str, str]:
+    """Return the URLs of a site that were stored compressed, with their codec.
+    
+    Reads the crawl state without changing it; a site without one has no
+    compressed files.
+    """
+    path = output_dir / config.STATE_FILENAME
+    if not path.is_file():
+        return {}
+    try:
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute('SELECT url, codec FROM resources WHERE codec IS NOT NULL'))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # A state from before codecs were recorded
+        return {}
+
+
+class CrawlState:
+    """SQLite-backed record of the frontier, visited URLs and their status.
+    
+    Status changes are buffered and written in batches. Each batch is committed
+    in one transaction, in the order the changes were made, so links found on a
+    page are always stored before the page is marked done.
+    
+    The validators of each downloaded resource are kept in a separate table
+    that survives fresh crawls, so later runs can re-crawl incrementally.
+    """
+    
+    def __init__(self, output_dir: Path, resume: bool = False):
+        """Open the state database of a site, clearing it unless resuming."""
+        self.path = output_dir / config.STATE_FILENAME
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path))
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS urls ('
+                'url TEXT PRIMARY KEY, '
+                'status TEXT NOT NULL, '
+                'depth INTEGER)'
+            )
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(urls)')}
+            if 'depth' not in columns:
+                self._conn.execute('ALTER TABLE urls ADD COLUMN depth INTEGER')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS resources ('
+                'url TEXT PRIMARY KEY, '
+                'etag TEXT, '
+                'last_modified TEXT, '
+                'content_hash TEXT, '
+                'outlinks TEXT, '
+                'fetched REAL, '
+                'codec TEXT)'
+            )
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(resources)')}
+            for column, kind in (('fetched', 'REAL'), ('codec', 'TEXT')):
+                if column not in columns:
+                    self._conn.execute(f'ALTER TABLE resources ADD COLUMN {column} {kind}')
+            if not resume:
+                self._conn.execute('DELETE FROM urls')
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise FileSystemError(f"Error opening crawl state {self.path}: {e}")
+            
+        # url -> (status, depth); depth is None for status-only changes
+        self._changes: Dict[str, Tuple[str, Optional[int]]] = {}
+        self._resources: Dict[str, Resource] = {}
+        self._last_checkpoint = time.monotonic()
+        
+    def load(self, visited: 'VisitedSet') -> Dict[str, int]:
+        """Return the URLs still to download with their depth, and add the visited ones to ``visited``.
+        
+        Downloads that were in progress when the last run stopped are
+        returned as pending.
+        """
+        pending: Dict[str, int] = {}
+        for url, status, depth in self._conn.execute('SELECT url, status, depth FROM urls'):
+            if status in (PENDING, IN_PROGRESS):
+                pending[url] = depth or 0
+            else:
+                visited.add(url)
+        return pending
+        
+    def add_pending(self, urls: Iterable[str], depth: int = 0) -> None:
+        """Record newly discovered URLs found at ``depth``."""
+        for url in urls:
+            self._set(url, PENDING, depth)
+            
+    def mark(self, url: str, status: str) -> None:
+        """Record a status change of a URL."""
+        self._set(url, status)
+        
+    def get_resource(self, url: str) -> Optional[Resource]:
+        """Return what the last download of a URL returned, if it was downloaded before."""
+        if url in self._resources:
+            return self._resources[url]
+        row = self._conn.execute(
+            'SELECT etag, last_modified, content_hash, outlinks, fetched, codec '
+            'FROM resources WHERE url = ?',
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, outlinks, fetched, codec = row
+        return Resource(
+            etag,
+            last_modified,
+            content_hash,
+            json.loads(outlinks) if outlinks is not None else None,
+            fetched,
+            codec
+        )
+        
+    def save_resource(self, url: str, resource: Resource) -> None:
+        """Record the validators and links of a downloaded URL."""
+        self._resources[url] = resource
+        self._maybe_checkpoint()
+        
+    def _set(self, url: str, status: str, depth: Optional[int] = None) -> None:
+        # Re-insert so the dict keeps the order of the latest change
+        _, previous_depth = self._changes.pop(url, (None, None))
+        self._changes[url] = (status, depth if depth is not None else previous_depth)
+        self._maybe_checkpoint()
+        
+    def _maybe_checkpoint(self) -> None:
+        if (len(self._changes) + len(self._resources) >= config.STATE_CHECKPOINT_SIZE or
+                time.monotonic() - self._last_checkpoint >= config.STATE_CHECKPOINT_INTERVAL):
+            self.checkpoint()
+            
+    def checkpoint(self) -> None:
+        """Write buffered changes to disk in a single transaction."""
+        self._last_checkpoint = time.monotonic()
+        if not self._changes and not self._resources:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO urls (url, status, depth) VALUES (?, ?, ?) '
+                    'ON CONFLICT(url) DO UPDATE SET status = excluded.status, '
+                    'depth = COALESCE(excluded.depth, urls.depth)',
+                    ((url, status, depth) for url, (status, depth) in self._changes.items())
+                )
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO resources '
+                    '(url, etag, last_modified, content_hash, outlinks, fetched, codec) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        (url, r.etag, r.last_modified, r.content_hash,
+                         json.dumps(r.outlinks) if r.outlinks is not None else None, r.fetched, r.codec)
+                        for url, r in self._resources.items()
+                    )
+                )
+        except sqlite3.Error as e:
+            raise FileSystemError(f"Error saving crawl state {self.path}: {e}")
+        self._changes.clear()
+        self._resources.clear()
+        
+    def close(self) -> None:
+        """Flush buffered changes and close the database."""
+        try:
+            self.checkpoint()
+        finally:
+            self._conn.close()
@@ -1,29 +1,198 @@
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+import multiprocessing
+import os
 from pathlib import Path
-from typing import Optional, Set
+import threading
+import time
+from typing import AbstractSet, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 import urllib3
 
 import requests
-from bs4 import BeautifulSoup
-from stem import Signal
-from stem.control import Controller
 
+from . import compression
 from . import config
 from . import utils
-from .exceptions import TorConnectionError, TorIdentityError, DownloadError
+from . import crawl_state
+from . import link_extractor
+from . import sitemaps
+from . import visited
+from .blob_store import BlobStore
+from .circuit_monitor import CircuitMonitor
+from .circuits import CircuitPool
+from .connection_pool import ConnectionStats, PooledAdapter
+from .crawl_state import CrawlState, Resource
+from .link_extractor import PageLinks
+from .metrics import Metrics, MetricsServer
+from .profiling import Profiler
+from .ratelimit import AdaptiveRateLimiter, backoff_delay, parse_retry_after
+from .scheduler import CrawlScheduler
+from .tor_control import TorController
+from .warc import WarcWriter
+from .exceptions import (
+    TorConnectionError, TorIdentityError, DownloadError, DownloadInterrupted, FileSystemError
+)
 
 # Disable SSL verification warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+
+class PageResult(NamedTuple):
+    """Outcome of downloading one URL, handed back to the crawl loop."""
+    
+    links: PageLinks
+    resource: Resource
+    # Bytes received over the network
+    nbytes: int = 0
+
+
+class _SiteCrawl:
+    """What the crawl of one site keeps to itself while sites share the workers."""
+    
+    def __init__(self, url: str, output_dir: Path, downloaded_urls: visited.VisitedSet,
+                 state: CrawlState, frontier: CrawlScheduler):
+        self.url = url
+        self.domain = utils.get_domain(url)
+        self.base_url = utils.get_base_url(url)
+        self.output_dir = output_dir
+        self.downloaded_urls = downloaded_urls
+        self.state = state
+        self.frontier = frontier
+        self.blob_store: Optional[BlobStore] = None
+        self.warc: Optional[WarcWriter] = None
+        # Whether the crawl continues an earlier one's frontier
+        self.resumed = False
+        # <lastmod> of sitemap URLs not downloaded yet, for incremental crawls
+        self.lastmod: Dict[str, float] = {}
+        # Files being downloaded to, and URLs held back until the file they
+        # map to is written, so two URLs never write the same partial file
+        self.writing: Set[Path] = set()
+        self.held: Dict[Path, List[Tuple[str, int]]] = {}
+        self.in_flight = 0
+        self.duplicates_removed = 0
+        
+    @property
+    def has_pending(self) -> bool:
+        """Whether the frontier has a URL to hand out."""
+        return bool(self.frontier) and not self.frontier.exhausted
+        
+    @property
+    def done(self) -> bool:
+        return not self.has_pending and not self.in_flight
+        
+    def close(self) -> None:
+        if self.warc is not None:
+            self.warc.close()
+        if isinstance(self.downloaded_urls, visited.BloomFilter):
+            self.downloaded_urls.close()
+        self.state.close()
+
+
 class TorDownloader:
-    def __init__(self, verify_ssl: bool = False):
-        """Initialize the downloader using system Tor service."""
+    def __init__(self, verify_ssl: bool = False, workers: int = config.MAX_WORKERS,
+                 circuits: int = config.CIRCUIT_POOL_SIZE,
+                 link_backend: str = config.LINK_EXTRACTOR,
+                 parse_processes: Optional[int] = None, strip_tracking: bool = False,
+                 visited_set: str = config.VISITED_SET, max_depth: Optional[int] = None,
+                 max_pages: Optional[int] = None, max_bytes: Optional[int] = None,
+                 monitor_circuits: bool = False, pool_size: Optional[int] = config.POOL_SIZE,
+                 warm_up: bool = config.POOL_WARM_UP, dedup: bool = False,
+                 output_format: str = config.OUTPUT_FORMAT,
+                 compress: str = config.COMPRESSION, metrics_log: Optional[Path] = None,
+                 metrics_textfile: Optional[Path] = None, metrics_port: Optional[int] = None,
+                 profiler: Optional[Profiler] = None, sitemaps: bool = False):
+        """Initialize the downloader using system Tor service.
+        
+        - ``verify_ssl``: check TLS certificates
+        - ``workers``: requests kept in flight at once
+        - ``circuits``: isolated Tor circuits the workers are spread over, at most one per worker
+        - ``link_backend``: how links are extracted from HTML, see ``lib/link_extractor.py``
+        - ``parse_processes``: parse HTML in this many processes instead of the fetching
+          threads; 0 means one per CPU core
+        - ``strip_tracking``: drop tracking query parameters from links before they are queued
+        - ``visited_set``: how visited URLs are remembered, see ``lib/visited.py``
+        - ``max_depth``, ``max_pages``, ``max_bytes``: limits of each crawl; None means unlimited
+        - ``monitor_circuits``: also judge circuit health by Tor's control port events, see
+          ``lib/circuit_monitor.py``
+        - ``pool_size``: keep-alive connections each circuit keeps per host; None means one per worker
+        - ``warm_up``: open those connections before crawling a single site
+        - ``dedup``: store identical bodies once, see ``lib/blob_store.py``
+        - ``output_format``: 'files' writes one file per URL, 'warc' archives responses to WARC
+          files instead, see ``lib/warc.py``
+        - ``compress``: codec text files are stored with, or 'none', see ``lib/compression.py``
+        - ``metrics_log``: JSON-lines file every page and crawl event is logged to
+        - ``metrics_textfile``: file kept up to date with the metrics in the Prometheus text format
+        - ``metrics_port``: local port the metrics are served on at ``/metrics``
+        - ``profiler``: profiles the tasks the worker threads run, see ``lib/profiling.py``
+        - ``sitemaps``: also queue the pages listed in each site's sitemaps, see ``lib/sitemaps.py``
+        
+        Crawl metrics (``lib/metrics.py``) are always collected; the ``metrics_*``
+        options only choose where else they go.
+        """
+        self.metrics = Metrics(metrics_log)
+        self.metrics_textfile = metrics_textfile
+        self.metrics_port = metrics_port
+        self._metrics_server: Optional[MetricsServer] = None
+        self._metrics_written = 0.0
+        self.profiler = profiler
+        self.sitemaps = sitemaps
         self.verify_ssl = verify_ssl
+        self.strip_tracking = strip_tracking
+        if visited_set not in visited.KINDS:
+            raise ValueError(f"Unknown visited set: {visited_set}")
+        self.visited_set = visited_set
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.workers = max(1, workers)
+        self.pool_size = max(1, pool_size) if pool_size else self.workers
+        self.warm_up = warm_up
+        self.connection_stats = ConnectionStats(self.metrics)
+        self.link_backend = link_extractor.resolve_backend(link_backend)
+        if parse_processes == 0:
+            parse_processes = self._available_cpus()
+        self.parse_processes = parse_processes
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        if output_format not in config.OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if dedup and output_format != 'files':
+            raise ValueError("Deduplication only applies to the 'files' output format")
+        self.codec = compression.resolve_codec(compress)
+        if self.codec is not None and output_format != 'files':
+            raise ValueError("Compression only applies to the 'files' output format")
+        self.output_format = output_format
+        self.dedup = dedup
         self.session = self._setup_session()
+        self.circuits = CircuitPool(min(circuits, self.workers), self._setup_session)
+        self.rate_limiter = AdaptiveRateLimiter()
+        self.tor_control = TorController()
+        self.monitor_circuits = monitor_circuits
+        self._circuit_monitor: Optional[CircuitMonitor] = None
+        # Set when the crawl is interrupted, so downloads in progress stop early
+        self._stopping = threading.Event()
         
-    def _setup_session(self) -> requests.Session:
+    @staticmethod
+    def _available_cpus() -> int:
+        """Count the CPU cores this process may run on."""
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+    def _setup_session(self, proxies: Dict[str, str] = config.TOR_PROXY) -> requests.Session:
         """Create requests session with Tor SOCKS proxy."""
         session = requests.Session()
-        session.proxies = config.TOR_PROXY
+        # Keep enough pooled connections per host that concurrent requests don't discard them
+        adapter = PooledAdapter(
+            self.connection_stats,
+            pool_connections=config.POOL_HOSTS,
+            pool_maxsize=self.pool_size,
+            pool_block=config.POOL_BLOCK
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.proxies = proxies
         session.verify = self.verify_ssl
         session.headers.update(config.DEFAULT_HEADERS)
         return session
@@ -37,102 +206,788 @@ class TorDownloader:
             raise TorConnectionError(f"Error checking Tor connection: {e}")
 
     def new_tor_identity(self) -> None:
-        """Request new Tor identity if needed."""
+        """Request new Tor identity if needed.
+        
+        Requests from several workers at once result in a single NEWNYM; all
+        of them return once a new circuit is built.
+        """
+        if self.tor_control.new_identity(self._stopping):
+            self.metrics.inc('newnym_total')
+            # Pooled keep-alive connections would otherwise stay on old circuits
+            self.circuits.renew_all()
+
+    def _start_circuit_monitor(self) -> None:
+        """Start feeding Tor's circuit events into the pool, if enabled."""
+        if not self.monitor_circuits or self._circuit_monitor is not None:
+            return
         try:
-            with Controller.from_port(port=9051) as controller:
-                controller.authenticate()
-                controller.signal(Signal.NEWNYM)
-                print("Successfully obtained new Tor identity")
-        except Exception as e:
-            raise TorIdentityError(f"Could not obtain new Tor identity: {e}")
+            self._circuit_monitor = CircuitMonitor(self.tor_control, self.circuits)
+            print("Monitoring circuit health through the Tor control port")
+        except TorIdentityError as e:
+            print(f"Circuit monitoring disabled: {e}")
+            
+    def _start_metrics_server(self) -> None:
+        """Serve metrics on ``self.metrics_port``, if enabled."""
+        if self.metrics_port is None or self._metrics_server is not None:
+            return
+        try:
+            self._metrics_server = MetricsServer(self.metrics, self.metrics_port)
+            print(f"Serving metrics on {self._metrics_server.address}")
+        except OSError as e:
+            print(f"Metrics endpoint disabled: {e}")
+            
+    def _write_metrics(self, force: bool = False) -> None:
+        """Rewrite the Prometheus textfile, at most every METRICS_TEXTFILE_INTERVAL seconds."""
+        now = time.monotonic()
+        if self.metrics_textfile is None or (
+                not force and now - self._metrics_written < config.METRICS_TEXTFILE_INTERVAL):
+            return
+        self._metrics_written = now
+        try:
+            self.metrics.write_textfile(self.metrics_textfile)
+        except FileSystemError as e:
+            print(e)
+            
+    def close(self) -> None:
+        """Stop serving metrics and close the metrics log and the Tor control connection."""
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+        self.metrics.close()
+        self.tor_control.close()
+            
+    def _warm_up_connections(self, url: str) -> None:
+        """Open pooled connections of every circuit to ``url``'s host before the crawl.
+        
+        Each circuit is sent a HEAD request for every worker that will use
+        it, so SOCKS and TLS handshakes happen up front instead of in front
+        of the first requests. The requests are paced by the rate limiter and
+        counted like any other request. A paced request may find an earlier
+        one's connection idle and reuse it, so fewer connections than
+        requests can be opened; the number actually opened is reported.
+        """
+        host = utils.get_domain(url)
+        per_circuit = min(self.pool_size, -(-self.workers // len(self.circuits)))
+        sessions = [
+            circuit.session for circuit in self.circuits.circuits
+            for _ in range(per_circuit)
+        ]
+        started = time.monotonic()
+        connections = self.connection_stats.connections
+        
+        def open_connection(session: requests.Session) -> bool:
+            with self.metrics.timer('rate_limit_wait_seconds'):
+                self.rate_limiter.acquire(host, self._stopping)
+            if self._stopping.is_set():
+                return False
+            try:
+                response = session.head(url, timeout=config.DOWNLOAD_TIMEOUT, verify=self.verify_ssl)
+            except requests.exceptions.RequestException:
+                self.rate_limiter.record_error(host)
+                return False
+            response.close()
+            self.metrics.inc('requests_total', status=str(response.status_code))
+            if response.status_code in config.THROTTLE_STATUS_CODES:
+                self.rate_limiter.record_throttle(host, parse_retry_after(response.headers.get('retry-after')))
+            return True
+                
+        with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+            try:
+                answered = sum(executor.map(open_connection, sessions))
+            except KeyboardInterrupt:
+                # Requests still waiting for the rate limiter give up, so
+                # leaving the executor doesn't wait for them
+                self._stopping.set()
+                raise
+        print(f"Warmed up {self.connection_stats.connections - connections} connections with "
+              f"{answered}/{len(sessions)} requests in {time.monotonic() - started:.1f}s")
+        
+    def _print_circuit_stats(self) -> None:
+        """Print a health summary of every circuit."""
+        print("\nCircuit  renewals  requests  throughput    TTFB     errors")
+        for stats in self.circuits.stats():
+            throughput = "-" if stats.throughput is None else f"{stats.throughput / 1024:.1f} KB/s"
+            ttfb = "-" if stats.ttfb is None else f"{stats.ttfb * 1000:.0f} ms"
+            print(f"{stats.index:<9}{stats.generation - 1:<10}{stats.requests:<10}"
+                  f"{throughput:<14}{ttfb:<9}{stats.error_rate:.0%}")
+
+    def _is_html(self, response: requests.Response) -> bool:
+        """Check whether the response body needs to be parsed for links."""
+        return config.HTML_CONTENT_TYPE in response.headers.get('content-type', '').lower()
+
+    def _resume_headers(self, url: str, file_path: Path) -> Dict[str, str]:
+        """Build headers that continue a partial download of ``url`` to ``file_path``, if any.
+
+        A partial file without a validator for ``url`` can't be resumed
+        safely and is dropped.
+        """
+        offset = utils.get_partial_size(file_path)
+        validator = utils.load_partial_validator(file_path, url)
+        if not offset or not validator:
+            utils.discard_partial(file_path)
+            return {}
+        return {
+            'Range': f'bytes={offset}-',
+            'If-Range': validator,
+            # Byte offsets only line up if the body isn't re-encoded
+            'Accept-Encoding': 'identity',
+        }
 
-    def _download_with_retry(self, url: str, referer: Optional[str] = None) -> requests.Response:
-        """Download URL with retry logic and proper headers."""
+    def _resume_validator(self, response: requests.Response) -> Optional[str]:
+        """Get the validator a partial copy of this response can be resumed with."""
+        encoding = response.headers.get('content-encoding', 'identity').lower()
+        if encoding not in ('', 'identity'):
+            return None
+        etag = response.headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return response.headers.get('last-modified')
+
+    def _has_copy(self, site: _SiteCrawl, url: str, file_path: Path, previous: Resource) -> bool:
+        """Whether the earlier download ``previous`` of ``url`` is still at hand.
+        
+        That is a file at ``file_path`` or, when archiving to WARC files, a
+        response in the site's WARC index; an earlier crawl may have saved
+        the URL with the other output format.
+        """
+        if site.warc is not None:
+            return site.warc.has_record(url)
+        return compression.find_stored(file_path, previous.codec) is not None
+        
+    def _remove_stale_copy(self, file_path: Path, stored: Optional[Resource], codec: Optional[str]) -> None:
+        """Delete the copy of ``file_path`` an earlier crawl stored with another codec than ``codec``.
+        
+        Only the file the crawl state records is removed; compressed copies
+        are named so that no other download, such as a ``.gz`` the site
+        serves, can be mistaken for one.
+        """
+        if stored is None or stored.codec == codec:
+            return
+        try:
+            compression.compressed_path(file_path, stored.codec).unlink(missing_ok=True)
+        except OSError as e:
+            raise FileSystemError(f"Error removing outdated copy of {file_path}: {e}")
+            
+
+    def _conditional_headers(self, site: _SiteCrawl, url: str, file_path: Path,
+                             previous: Optional[Resource]) -> Dict[str, str]:
+        """Build headers that let the server answer 304 if the copy of ``url`` is still current."""
+        if previous is None or not self._has_copy(site, url, file_path, previous):
+            return {}
+        headers = {}
+        if previous.etag:
+            headers['If-None-Match'] = previous.etag
+        if previous.last_modified:
+            headers['If-Modified-Since'] = previous.last_modified
+        return headers
+
+    def _codec_for(self, response: requests.Response, file_path: Path) -> Optional[str]:
+        """Codec to store the response body with, None to store it as it is."""
+        if self.codec is None:
+            return None
+        content_type = response.headers.get('content-type')
+        return self.codec if compression.should_compress(content_type, file_path) else None
+        
+    def _check_stopping(self, url: str) -> None:
+        if self._stopping.is_set():
+            raise DownloadInterrupted(f"Download of {url} interrupted")
+            
+    def _until_stopped(self, url: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield ``chunks`` of ``url``'s body, stopping between chunks if the crawl is interrupted."""
+        for chunk in chunks:
+            self._check_stopping(url)
+            yield chunk
+        
+    def _timed_writes(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield ``chunks``, observing the time the consumer spends on them as write time."""
+        spent = 0.0
+        for chunk in chunks:
+            started = time.monotonic()
+            yield chunk
+            spent += time.monotonic() - started
+        self.metrics.observe('write_seconds', spent)
+        
+    def _save_body(self, site: _SiteCrawl, url: str, response: requests.Response, file_path: Path) -> int:
+        """Write the body of the response to ``url`` to ``file_path`` of ``site`` and return the bytes received.
+        
+        A 206 response continues the partial file; a 200 replaces it, which is
+        how servers that ignore ``Range`` fall back to a full download. HTML is
+        only read into memory; ``_download_page`` decides whether to write it.
+        A 304 response has no body and leaves the existing file alone.
+        """
+        if response.status_code == 304:
+            return 0
+            
+        if response.status_code == 206:
+            offset = utils.get_partial_size(file_path)
+            content_range = response.headers.get('content-range', '')
+            if (self._is_html(response) or self._codec_for(response, file_path) is not None or
+                    not content_range.startswith(f'bytes {offset}-')):
+                utils.discard_partial(file_path)
+                raise DownloadError(f"Unusable partial response for {response.url}")
+                
+        if self._is_html(response):
+            return len(response.content)
+            
+        if site.warc is not None:
+            return site.warc.write_response(
+                response,
+                self._timed_writes(self._until_stopped(
+                    response.url, response.iter_content(config.DOWNLOAD_CHUNK_SIZE)
+                ))
+            )
+            
+        codec = self._codec_for(response, file_path)
+        # Compressed files can't be resumed, as offsets refer to the plain body
+        validator = self._resume_validator(response) if codec is None else None
+        utils.save_partial_validator(file_path, url, validator)
+        return utils.save_stream(
+            self._timed_writes(self._until_stopped(
+                response.url, response.iter_content(config.DOWNLOAD_CHUNK_SIZE)
+            )),
+            file_path,
+            append=response.status_code == 206,
+            keep_partial=validator is not None,
+            store=site.blob_store,
+            codec=codec
+        )
+
+    def _download_with_retry(self, site: _SiteCrawl, url: str, file_path: Path,
+                             previous: Optional[Resource] = None) -> Tuple[requests.Response, int]:
+        """Download URL of ``site`` to ``file_path`` with retry logic and proper headers.
+        
+        Requests go out over the circuit assigned to the calling worker. The
+        body is streamed to disk in chunks; only HTML is read into memory, and
+        stays available as ``response.content`` for link parsing. Interrupted
+        downloads are resumed from the last byte written, both on retry and on
+        a later run. With ``previous`` the request is conditional and may
+        return 304. Returns the response and the number of body bytes received.
+        
+        Requests to a host are paced by ``self.rate_limiter``. Throttling
+        responses slow the host down and honour ``Retry-After``; transient
+        server errors (``config.RETRY_STATUS_CODES``) are retried as well. All
+        retries wait with jittered exponential backoff. Waiting, time to first byte,
+        transfer time, response statuses and retries go to ``self.metrics``.
+        """
+        host = utils.get_domain(url)
         headers = self.session.headers.copy()
-        if referer:
-            headers['Referer'] = referer
+        headers['Referer'] = site.base_url
+        headers.update(self._conditional_headers(site, url, file_path, previous))
             
         for attempt in range(config.MAX_RETRIES):
+            if attempt:
+                self._stopping.wait(backoff_delay(attempt - 1))
+            self._check_stopping(url)
+            with self.metrics.timer('rate_limit_wait_seconds'):
+                self.rate_limiter.acquire(host, self._stopping)
+            self._check_stopping(url)
+            circuit = self.circuits.current()
             try:
-                response = self.session.get(
+                started = time.monotonic()
+                with circuit.session.get(
                     url, 
-                    headers=headers, 
+                    headers={**headers, **self._resume_headers(url, file_path)},
                     timeout=config.DOWNLOAD_TIMEOUT, 
-                    verify=self.verify_ssl
-                )
-                response.raise_for_status()
-                return response
+                    verify=self.verify_ssl,
+                    stream=True
+                ) as response:
+                    latency = time.monotonic() - started
+                    self.metrics.observe('ttfb_seconds', latency)
+                    self.metrics.inc('requests_total', status=str(response.status_code))
+                    response.raise_for_status()
+                    nbytes = self._save_body(site, url, response, file_path)
+                elapsed = time.monotonic() - started
+                self.metrics.observe('transfer_seconds', elapsed - latency)
+                self.rate_limiter.record_success(host, latency)
+                self.connection_stats.record_request(latency, elapsed)
+                self.circuits.record(circuit, nbytes, latency, elapsed)
+                return response, nbytes
             except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 403 and attempt < config.MAX_RETRIES - 1:
-                    print(f"Received 403 for {url}, retrying with new Tor identity...")
-                    self.new_tor_identity()
+                status = e.response.status_code
+                last_attempt = attempt == config.MAX_RETRIES - 1
+                if status == 416 and not last_attempt:
+                    print(f"Cannot resume {url}, restarting download...")
+                    utils.discard_partial(file_path)
+                    self.metrics.inc('retries_total', reason='range')
                     continue
+                if status in config.THROTTLE_STATUS_CODES:
+                    retry_after = parse_retry_after(e.response.headers.get('retry-after'))
+                    self.rate_limiter.record_throttle(host, retry_after)
+                    if status == 403 and not last_attempt:
+                        print(f"Received 403 for {url}, retrying with new Tor identity...")
+                        self.new_tor_identity()
+                        self.metrics.inc('retries_total', reason='forbidden')
+                        continue
+                    if not last_attempt:
+                        print(f"Received {status} for {url}, slowing down to "
+                              f"{self.rate_limiter.rate(host):.2f} requests/s...")
+                        self.metrics.inc('retries_total', reason='throttled')
+                        continue
+                elif status >= 500:
+                    self.rate_limiter.record_error(host)
+                    if status in config.RETRY_STATUS_CODES and not last_attempt:
+                        print(f"Received {status} for {url}, retrying...")
+                        self.metrics.inc('retries_total', reason='server_error')
+                        continue
                 raise DownloadError(f"HTTP error downloading {url}: {e}")
+            except (FileSystemError, DownloadInterrupted):
+                raise
             except Exception as e:
+                self.rate_limiter.record_error(host)
+                self.circuits.record_error(circuit)
                 if attempt < config.MAX_RETRIES - 1:
                     print(f"Error downloading {url}, retrying: {e}")
+                    self.metrics.inc('retries_total', reason='error')
                     continue
                 raise DownloadError(f"Error downloading {url}: {e}")
 
-    def _process_html(self, content: str, current_url: str, domain: str, downloaded_urls: Set[str]) -> Set[str]:
+    def _fetch(self, url: str) -> requests.Response:
+        """GET ``url`` over the calling worker's circuit and return the streamed response.
+        
+        Paced by the rate limiter like page downloads, but nothing is saved
+        and nothing retried; used for robots.txt and sitemaps.
+        """
+        self._check_stopping(url)
+        host = utils.get_domain(url)
+        with self.metrics.timer('rate_limit_wait_seconds'):
+            self.rate_limiter.acquire(host, self._stopping)
+        self._check_stopping(url)
+        circuit = self.circuits.current()
+        try:
+            response = circuit.session.get(
+                url,
+                timeout=config.DOWNLOAD_TIMEOUT,
+                verify=self.verify_ssl,
+                stream=True
+            )
+        except requests.exceptions.RequestException as e:
+            self.rate_limiter.record_error(host)
+            self.circuits.record_error(circuit)
+            raise DownloadError(f"Error downloading {url}: {e}")
+        self.metrics.inc('requests_total', status=str(response.status_code))
+        if response.status_code >= 400:
+            response.close()
+            raise DownloadError(f"HTTP error downloading {url}: {response.status_code}")
+        return response
+        
+    def _discover(self, site: _SiteCrawl) -> List[sitemaps.SitemapUrl]:
+        """Read the URLs listed by the robots.txt and sitemaps of ``site``."""
+        return list(sitemaps.discover(site.base_url, self._fetch, self.strip_tracking))
+        
+    def _process_html(self, content: str, current_url: str, domain: str,
+                      downloaded_urls: AbstractSet[str] = frozenset()) -> PageLinks:
         """Process HTML content and extract URLs to download."""
-        urls_to_download = set()
-        soup = BeautifulSoup(content, 'html.parser')
+        return link_extractor.find_urls(
+            content,
+            current_url,
+            domain,
+            self.link_backend,
+            downloaded_urls,
+            self.strip_tracking
+        )
+
+    def _find_links(self, response: requests.Response, url: str, domain: str) -> PageLinks:
+        """Extract links from an HTML response, in the parse pool if there is one."""
+        with self.metrics.timer('parse_seconds'):
+            if self._parse_pool is None:
+                return self._process_html(response.text, url, domain)
+            return self._parse_pool.submit(
+                link_extractor.parse_page,
+                response.content,
+                response.encoding,
+                url,
+                domain,
+                self.link_backend,
+                self.strip_tracking
+            ).result()
+            
+    def _record_page(self, url: str, result: str, nbytes: int, started: float) -> None:
+        """Count a processed URL and log it."""
+        self.metrics.inc('pages_total', result=result)
+        if nbytes:
+            self.metrics.inc('bytes_total', nbytes)
+            self.metrics.observe('response_bytes', nbytes)
+        self.metrics.log('page', url=url, result=result, bytes=nbytes,
+                         seconds=round(time.monotonic() - started, 4))
+
+    def _download_page(self, site: _SiteCrawl, url: str, previous: Optional[Resource] = None,
+                       stored: Optional[Resource] = None) -> PageResult:
+        """Download a single URL of ``site``, save it and return the links found in it.
         
-        for tag in soup.find_all(config.LINK_TAGS):
-            for attr in config.LINK_ATTRS:
-                href = tag.get(attr)
-                if not href:
-                    continue
-                    
-                absolute_url = utils.get_absolute_url(current_url, href)
-                if absolute_url and utils.should_download_url(absolute_url, domain, downloaded_urls):
-                    urls_to_download.add(absolute_url)
-                    
-        return urls_to_download
+        Also returns the resource record to keep for the next incremental
+        crawl. If ``previous`` shows the page is unchanged, nothing is written
+        and its previously found links are reused instead of parsing it again.
+        ``stored`` is the record of the last download, whether or not the
+        crawl is incremental; a file it left under another codec is removed.
+        """
+        started = time.monotonic()
+        file_path = utils.get_file_path(url, site.output_dir)
+        response, nbytes = self._download_with_retry(site, url, file_path, previous=previous)
+        
+        if response.status_code == 304 and previous is not None:
+            print(f"Not modified: {url}")
+            self._record_page(url, 'not_modified', nbytes, started)
+            return PageResult(PageLinks(set(previous.outlinks or ())), previous._replace(fetched=time.time()))
+            
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        codec = self._codec_for(response, file_path)
+        if not self._is_html(response):
+            if site.warc is None:
+                self._remove_stale_copy(file_path, stored, codec)
+            print(f"Downloaded: {url}")
+            self._record_page(url, 'downloaded', nbytes, started)
+            resource = Resource(etag, last_modified, fetched=time.time(), codec=codec)
+            return PageResult(PageLinks(set()), resource, nbytes)
+            
+        content_hash = utils.hash_content(response.content)
+        if (previous is not None and previous.content_hash == content_hash and
+                previous.outlinks is not None and self._has_copy(site, url, file_path, previous)):
+            print(f"Unchanged: {url}")
+            self._record_page(url, 'unchanged', nbytes, started)
+            links = PageLinks(set(previous.outlinks))
+            codec = previous.codec
+        else:
+            with self.metrics.timer('write_seconds'):
+                if site.warc is not None:
+                    site.warc.write_response(response, [response.content])
+                else:
+                    utils.save_content(response.content, file_path, store=site.blob_store, codec=codec)
+                    self._remove_stale_copy(file_path, stored, codec)
+            print(f"Downloaded: {url}")
+            links = self._find_links(response, url, site.domain)
+            self._record_page(url, 'downloaded', nbytes, started)
+        resource = Resource(etag, last_modified, content_hash, sorted(links.urls), time.time(), codec)
+        return PageResult(links, resource, nbytes)
 
-    def download_website(self, url: str) -> bool:
-        """Download complete website content."""
+    def _open_site(self, urls: List[str], resume: bool, announce: bool = True) -> Optional[_SiteCrawl]:
+        """Set up the crawl of the site ``urls`` belong to; None if that fails."""
+        url = urls[0]
+        output_dir = Path(config.DOWNLOAD_DIR) / utils.get_domain(url)
         try:
-            domain = utils.get_domain(url)
-            base_url = utils.get_base_url(url)
-            output_dir = Path(config.DOWNLOAD_DIR) / domain
+            downloaded_urls = visited.create(self.visited_set, output_dir / config.BLOOM_FILENAME)
+            state = CrawlState(output_dir, resume=resume)
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            return None
             
-            downloaded_urls = set()
-            urls_to_download = {url}
+        site = _SiteCrawl(
+            url, output_dir, downloaded_urls, state,
+            CrawlScheduler(self.max_depth, self.max_pages, self.max_bytes)
+        )
+        try:
+            pending = state.load(downloaded_urls)
+            if pending or downloaded_urls:
+                print(f"Resuming download of {url}: {len(pending)} pending, "
+                      f"{len(downloaded_urls)} already visited")
+                site.resumed = True
+                for pending_url, depth in pending.items():
+                    site.frontier.push(pending_url, depth)
+            else:
+                for start_url in urls:
+                    site.frontier.push(start_url)
+                state.add_pending(urls)
+            if self.dedup:
+                site.blob_store = BlobStore(output_dir / config.BLOB_DIRNAME)
+            if self.output_format == 'warc':
+                site.warc = WarcWriter(output_dir / config.WARC_DIRNAME, site.domain.replace(':', '_'))
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            site.close()
+            return None
+            
+        if announce:
+            print(f"Starting download of {url}")
+        self.metrics.log('crawl_started', url=url, workers=self.workers, circuits=len(self.circuits))
+        return site
+        
+    def _close_site(self, site: _SiteCrawl, completed: bool) -> None:
+        """Print the summary of a completed site and release its files."""
+        try:
+            if not completed:
+                return
+            if site.blob_store is not None:
+                freed = site.blob_store.prune()
+                print(f"Storage: {site.blob_store.summary()}; {freed} bytes of outdated content removed")
+            if site.warc is not None:
+                print(f"Archived {site.warc.records} responses to {len(site.warc.files)} WARC files "
+                      f"in {site.warc.directory}")
+            print(f"Skipped {site.duplicates_removed} duplicate URL spellings on {site.domain}")
+            if site.frontier.exhausted:
+                print(f"Crawl budget reached after {site.frontier.pages} URLs and "
+                      f"{site.frontier.bytes} bytes; {len(site.frontier)} URLs left "
+                      f"pending, use --resume to continue")
+            print(f"Download of {site.url} completed successfully!")
+        finally:
+            self.metrics.log('crawl_finished', url=site.url, metrics=self.metrics.snapshot())
+            site.close()
+            
+    def _next_site(self, sites: List[_SiteCrawl], fair_share: int) -> Optional[_SiteCrawl]:
+        """Pick the site the next free worker goes to, None if no site has URLs pending.
+        
+        Sites whose host the rate limiter lets through now come first, then
+        sites with fewer than ``fair_share`` requests in flight; ties go to
+        the site earliest in ``sites``.
+        """
+        def rank(site: _SiteCrawl) -> Tuple[bool, bool, float]:
+            delay = self.rate_limiter.delay(site.domain)
+            return delay > 0, site.in_flight >= fair_share, delay
+            
+        candidates = [site for site in sites if site.has_pending]
+        return min(candidates, key=rank) if candidates else None
+        
+    def _dispatch(self, executor: ThreadPoolExecutor, download_page: Callable[..., PageResult],
+                  sites: List[_SiteCrawl], in_flight: Dict[Future, Tuple[_SiteCrawl, Optional[str], int]],
+                  incremental: bool) -> None:
+        """Hand URLs of ``sites`` to free workers until all are busy or nothing is pending.
+        
+        A site that got a worker moves to the end of ``sites``, so sites
+        take turns. URLs their sitemap shows unchanged since they were last
+        downloaded are settled here without a request. A URL saved to the
+        same file as one in flight (``/page?x=1`` and ``/page?x=2``) is held
+        back until that download finishes.
+        """
+        fair_share = -(-self.workers // max(1, len(sites)))
+        while len(in_flight) < self.workers:
+            site = self._next_site(sites, fair_share)
+            if site is None:
+                return
+            sites.remove(site)
+            sites.append(site)
+            current_url, depth, waited = site.frontier.pop()
+            if current_url in site.downloaded_urls:
+                continue
+            file_path = utils.get_file_path(current_url, site.output_dir)
+            if file_path in site.writing:
+                site.held.setdefault(file_path, []).append((current_url, depth))
+                continue
+            site.downloaded_urls.add(current_url)
+            stored = site.state.get_resource(current_url)
+            previous = stored if incremental else None
+            if self._unchanged_since_lastmod(site, current_url, previous):
+                print(f"Unchanged since sitemap lastmod: {current_url}")
+                self._record_page(current_url, 'sitemap_unchanged', 0, time.monotonic())
+                self._save_page(site, current_url, depth,
+                                PageResult(PageLinks(set(previous.outlinks or ())), previous))
+                continue
+            self.metrics.observe('queue_wait_seconds', waited)
+            site.frontier.record_page()
+            site.state.mark(current_url, crawl_state.IN_PROGRESS)
+            future = executor.submit(download_page, site, current_url, previous, stored)
+            in_flight[future] = (site, current_url, depth)
+            site.in_flight += 1
+            site.writing.add(file_path)
             
-            print(f"Starting download of {url} through Tor...")
+    def _unchanged_since_lastmod(self, site: _SiteCrawl, url: str, previous: Optional[Resource]) -> bool:
+        """Whether ``url``'s sitemap ``lastmod`` is no later than its last download, still at hand."""
+        lastmod = site.lastmod.pop(url, None)
+        return (lastmod is not None and previous is not None and previous.fetched is not None and
+                lastmod <= previous.fetched and
+                self._has_copy(site, url, utils.get_file_path(url, site.output_dir), previous))
+                
+    def _queue_sitemap_urls(self, site: _SiteCrawl, future: Future, incremental: bool) -> None:
+        """Queue the URLs sitemap discovery found for ``site``, one hop from the start URL."""
+        site.in_flight -= 1
+        try:
+            entries = future.result()
+        except Exception as e:
+            print(f"Sitemap discovery failed for {site.domain}: {e}")
+            return
+        new_urls = [
+            entry.url for entry in entries
+            if entry.url not in site.downloaded_urls and site.frontier.push(entry.url, 1)
+        ]
+        site.state.add_pending(new_urls, 1)
+        if incremental:
+            site.lastmod.update((entry.url, entry.lastmod) for entry in entries if entry.lastmod is not None)
+        self.metrics.inc('sitemap_urls_total', len(entries))
+        print(f"Queued {len(new_urls)} of {len(entries)} URLs listed in the sitemaps of {site.domain}")
+        
+    def _handle_page(self, site: _SiteCrawl, url: str, depth: int, future: Future) -> None:
+        """Record the outcome of a download and queue the new links it found."""
+        site.in_flight -= 1
+        file_path = utils.get_file_path(url, site.output_dir)
+        site.writing.discard(file_path)
+        # URLs held back for the file go back to the frontier
+        for held_url, held_depth in site.held.pop(file_path, ()):
+            site.frontier.push(held_url, held_depth)
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            site.state.mark(url, crawl_state.FAILED)
+            self.metrics.inc('pages_total', result='failed')
+            self.metrics.log('page', url=url, result='failed', error=str(e))
+            return
+        self._save_page(site, url, depth, result)
+        
+    def _save_page(self, site: _SiteCrawl, url: str, depth: int, result: PageResult) -> None:
+        """Keep the resource record of a finished URL and queue the new links found in it."""
+        links, resource, nbytes = result
+        site.state.save_resource(url, resource)
+        site.frontier.record_bytes(nbytes)
+        duplicates = links.collapsed + sum(
+            1 for variant in links.variants
+            if variant in site.downloaded_urls or variant in site.frontier
+        )
+        site.duplicates_removed += duplicates
+        self.metrics.inc('duplicate_urls_total', duplicates)
+        new_urls = [
+            new_url for new_url in links.urls
+            if new_url not in site.downloaded_urls and
+            site.frontier.push(new_url, depth + 1)
+        ]
+        site.state.add_pending(new_urls, depth + 1)
+        site.state.mark(url, crawl_state.DONE)
+
+    def download_website(self, url: str, resume: bool = False, incremental: bool = False) -> bool:
+        """Download complete website content.
+        
+        Up to ``self.workers`` pages are fetched concurrently. The frontier and
+        the visited set are only touched from the calling thread; workers just
+        return the links they found. Progress is checkpointed to the site's
+        crawl state, and with ``resume`` the crawl continues from there. With
+        ``incremental`` pages downloaded by an earlier run are only fetched
+        again if they changed.
+        
+        URLs are canonicalized before they enter the frontier, and the number
+        of duplicate spellings this removed is reported at the end. The
+        frontier is a ``CrawlScheduler``, so pages close to the start URL are
+        fetched first and the crawl stops handing out URLs once a budget is
+        used up; what is left stays pending for ``resume``.
+        
+        With ``self.sitemaps`` the pages listed in the site's sitemaps are
+        queued in bulk while the first pages download, instead of being
+        found link by link. With ``incremental`` as well, pages whose
+        ``lastmod`` is no later than their last download aren't requested.
+        """
+        return all(self.download_websites([url], resume, incremental).values())
+        
+    def download_websites(self, urls: Iterable[str], resume: bool = False, incremental: bool = False,
+                          sites_at_once: int = config.BATCH_SITES) -> Dict[str, bool]:
+        """Download several websites in one crawl that shares ``self.workers``.
+        
+        The URLs are grouped by domain, and each site is crawled as by
+        ``download_website``, into its own directory with its own crawl state
+        and frontier. Up to ``sites_at_once`` sites are crawled at a time;
+        the next one starts when one finishes. A free worker goes to a site
+        whose host the rate limiter lets through, one with fewer requests in
+        flight than its share of the workers if there is one, and sites take
+        turns; so a slow or throttled site neither crowds out the others nor
+        leaves workers idle while they have work. Connections are only warmed
+        up for a single site. Returns whether each domain (or URL that could
+        not be parsed or has no host) was downloaded.
+        """
+        results: Dict[str, bool] = {}
+        seeds: Dict[str, List[str]] = {}
+        for url in urls:
+            try:
+                url = utils.canonicalize_url(url, self.strip_tracking)
+                if not utils.is_valid_url(url):
+                    raise ValueError("not an absolute URL with a host")
+            except Exception as e:
+                print(f"Error downloading {url}: {e}")
+                results[url] = False
+                continue
+            site_urls = seeds.setdefault(utils.get_domain(url), [])
+            if url not in site_urls:
+                site_urls.append(url)
+        waiting = deque(seeds.items())
+        sites: List[_SiteCrawl] = []
+        in_flight: Dict[Future, Tuple[_SiteCrawl, Optional[str], int]] = {}
+        if not waiting:
+            return results
+            
+        try:
+            if len(seeds) == 1:
+                print(f"Starting download of {waiting[0][1][0]} through Tor with {self.workers} workers...")
+            else:
+                print(f"Starting download of {len(seeds)} sites, {min(sites_at_once, len(seeds))} at "
+                      f"a time, through Tor with {self.workers} workers...")
             print("SSL verification is", "enabled" if self.verify_ssl else "disabled")
             
-            while urls_to_download:
-                current_url = urls_to_download.pop()
-                if current_url in downloaded_urls:
-                    continue
-                    
-                try:
-                    response = self._download_with_retry(current_url, referer=base_url)
-                    file_path = utils.get_file_path(current_url, output_dir)
-                    
-                    if utils.save_content(response.content, file_path):
-                        downloaded_urls.add(current_url)
-                        print(f"Downloaded: {current_url}")
-                        
-                        if config.HTML_CONTENT_TYPE in response.headers.get('content-type', '').lower():
-                            new_urls = self._process_html(
-                                response.text, 
-                                current_url, 
-                                domain, 
-                                downloaded_urls
-                            )
-                            urls_to_download.update(new_urls)
+            if self.parse_processes:
+                print(f"Parsing HTML in {self.parse_processes} processes")
+                # Spawn rather than fork: the fetching threads may hold locks
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_processes,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                
+            self._start_circuit_monitor()
+            self._start_metrics_server()
+            
+            download_page, discover = self._download_page, self._discover
+            if self.profiler is not None:
+                download_page, discover = self.profiler.wrap(download_page), self.profiler.wrap(discover)
+            self._stopping.clear()
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            try:
+                while waiting or sites:
+                    while waiting and len(sites) < max(1, sites_at_once):
+                        domain, site_urls = waiting.popleft()
+                        site = self._open_site(site_urls, resume, announce=len(seeds) > 1)
+                        if site is None:
+                            results[domain] = False
+                            continue
+                        sites.append(site)
+                        if self.warm_up and len(seeds) == 1:
+                            self._warm_up_connections(site.base_url)
+                        if self.sitemaps and not site.resumed:
+                            # Runs alongside the first pages; counts as a request in flight
+                            in_flight[executor.submit(discover, site)] = (site, None, 0)
+                            site.in_flight += 1
                             
-                except Exception as e:
-                    print(f"Error processing {current_url}: {e}")
-                    continue
+                    self._dispatch(executor, download_page, sites, in_flight, incremental)
+                    self.metrics.set('in_flight', len(in_flight))
+                    self.metrics.set('frontier', sum(len(site.frontier) for site in sites))
+                    for site in [site for site in sites if site.done]:
+                        sites.remove(site)
+                        self._close_site(site, completed=True)
+                        results[site.domain] = True
+                    if not in_flight:
+                        continue
+                        
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        site, current_url, depth = in_flight.pop(future)
+                        if current_url is None:
+                            self._queue_sitemap_urls(site, future, incremental)
+                        else:
+                            self._handle_page(site, current_url, depth, future)
+                    self._write_metrics()
+            except KeyboardInterrupt:
+                # Downloads in progress stop at their next chunk and keep their
+                # partial files, and workers waiting for the rate limiter, a
+                # retry or a new circuit give up; their URLs stay in progress,
+                # so --resume downloads them again
+                print("\nInterrupted, stopping downloads in progress...")
+                self._stopping.set()
+                for future in in_flight:
+                    future.cancel()
+                raise
+            finally:
+                executor.shutdown()
                     
-            print("\nDownload completed successfully!")
-            return True
+            self.metrics.set('in_flight', 0)
+            self._print_circuit_stats()
+            print(f"Timings: {self.metrics.summary()}")
+            print(f"Connections: {self.connection_stats.summary()}")
+            failed = [domain for domain, success in results.items() if not success]
+            if len(results) > 1:
+                print(f"\nDownloaded {len(results) - len(failed)} of {len(results)} sites")
+            return results
             
         except Exception as e:
             print(f"Error downloading website: {e}")
-            return False 
\ No newline at end of file
+            return results
+        finally:
+            for site in sites:
+                results[site.domain] = False
+                self._close_site(site, completed=False)
+            for domain, _ in waiting:
+                results[domain] = False
+            self._write_metrics(force=True)
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
@@ -10,6 +10,10 @@ class DownloadError(Exception):
     """Raised when there are issues downloading content."""
     pass
 
+class DownloadInterrupted(DownloadError):
+    """Raised in download threads when the crawl is being stopped."""
+    pass
+
 class FileSystemError(Exception):
     """Raised when there are issues with file operations."""
     pass 
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""Place files in an output directory without copying their data where possible."""
+
+import errno
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+COPY = 'copy'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+SYMLINK = 'symlink'
+AUTO = 'auto'
+MODES = (COPY, HARDLINK, REFLINK, SYMLINK, AUTO)
+
+# ioctl request cloning a whole file on Btrfs, XFS and other CoW filesystems
+_FICLONE = 0x40049409
+
+# Failures meaning "not possible here" rather than a real I/O problem
+_UNSUPPORTED = {
+    errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP,
+    errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EACCES,
+}
+
+
+def temp_path(dest: Path) -> Path:
+    """A unique temporary path next to ``dest``, so concurrent writers never share one."""
+    return dest.with_name(f"{dest.name}.{uuid.uuid4().hex[:12]}.tmp")
+
+
+def _unsupported(error: OSError) -> bool:
+    return error.errno in _UNSUPPORTED
+
+
+def _hardlink(src: Path, temp_path: Path) -> None:
+    os.link(src, temp_path)
+
+
+def _symlink(src: Path, temp_path: Path) -> None:
+    os.symlink(os.path.abspath(src), temp_path)
+
+
+def _reflink(src: Path, temp_path: Path) -> None:
+    """Clone ``src`` with FICLONE, or let the kernel copy it with ``copy_file_range``.
+
+    ``copy_file_range`` shares extents on filesystems that support it and
+    at least avoids moving data through user space elsewhere.
+    """
+    with open(src, 'rb') as fsrc, open(temp_path, 'wb') as fdst:
+        try:
+            if fcntl is None:
+                raise OSError(errno.ENOTSUP, "FICLONE is not available")
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError as e:
+            if not _unsupported(e) or not hasattr(os, 'copy_file_range'):
+                raise
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    shutil.copystat(src, temp_path)
+
+
+def _copy(src: Path, temp_path: Path) -> None:
+    shutil.copy2(src, temp_path)
+
+
+_METHODS = {HARDLINK: _hardlink, REFLINK: _reflink, SYMLINK: _symlink, COPY: _copy}
+
+
+def export_file(src: Path, dest: Path, mode: str = COPY) -> str:
+    """Make ``dest`` hold the contents of ``src`` and return the method used.
+
+    ``mode`` names the method to try first; ``auto`` tries a hardlink, then
+    a reflink. Whatever the filesystem can't do (e.g. links across devices)
+    falls back to a plain copy. ``dest`` is replaced atomically.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown export mode: {mode}")
+    attempts = [HARDLINK, REFLINK] if mode == AUTO else [mode]
+    if COPY not in attempts:
+        attempts.append(COPY)
+
+    temp = temp_path(dest)
+    for method in attempts:
+        try:
+            _METHODS[method](src, temp)
+            os.replace(temp, dest)
+            return method
+        except OSError as e:
+            temp.unlink(missing_ok=True)
+            if method == COPY or not _unsupported(e):
+                raise
+    return COPY
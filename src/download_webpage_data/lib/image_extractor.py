@@ -1,75 +1,335 @@
 """Module for extracting images from downloaded websites."""
 
+from collections import Counter
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 import shutil
-from typing import List, Set, Dict
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
 import mimetypes
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
+from . import compression
 from . import config
+from . import crawl_state
+from . import export
+from . import phash
+from . import utils
+from .image_index import ImageIndex, ImageRecord, PageRecord
 from .exceptions import FileSystemError
 
+try:
+    import lxml.html
+except ImportError:  # pragma: no cover - optional dependency
+    lxml = None
+
+# Size and modification time (ns) of a downloaded file
+Stat = Tuple[int, int]
+
+
+def _image_sources(html_file: str, codec: Optional[str] = None) -> List[str]:
+    """Read an HTML file stored with ``codec`` and return the ``src`` of each of its images.
+    
+    Runs in the parsing processes, so it takes and returns plain values.
+    """
+    try:
+        content = compression.read_content(Path(html_file), codec).decode('utf-8')
+        if lxml is not None and content.strip():
+            try:
+                return [str(src) for src in lxml.html.fromstring(content).xpath('//img/@src') if src]
+            except ValueError:
+                # e.g. an XML encoding declaration, which lxml rejects in str input
+                pass
+        soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer('img'))
+        return [img.get('src') for img in soup.find_all('img') if img.get('src')]
+    except Exception as e:
+        print(f"Error processing {html_file}: {e}")
+        return []
+
+
+class _Progress:
+    """Thread-safe counter that prints progress at most once per interval."""
+    
+    def __init__(self, total: int, verb: str = 'Copied'):
+        self.total = total
+        self.verb = verb
+        self.done = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+    
+    def add(self, nbytes: int) -> None:
+        with self._lock:
+            self.done += 1
+            self.bytes += nbytes
+            now = time.monotonic()
+            if now - self._last_report >= config.IMAGE_PROGRESS_INTERVAL:
+                self._last_report = now
+                print(f"{self.verb} {self.done}/{self.total} images ({self.summary()})")
+    
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f"{self.bytes / 1024 / 1024:.1f} MB in {elapsed:.1f}s, "
+                f"{self.done / elapsed:.0f} files/s, {self.bytes / 1024 / 1024 / elapsed:.1f} MB/s")
+
+
 class ImageExtractor:
-    """Extract images from downloaded websites."""
+    """Extract images from downloaded websites.
+    
+    The site directory is walked once with ``os.scandir``, classifying files
+    by extension. HTML files are parsed for image references in a process
+    pool and images are exported by a thread pool, as copies or, depending
+    on ``mode``, as links to the downloaded files (see ``lib/export.py``).
+    
+    An index in the output directory (see ``lib/image_index.py``) remembers
+    what earlier runs did, so reruns only read new or changed files.
+    """
     
     IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico'}
+    HTML_EXTENSIONS = {'.html', '.htm'}
     
-    def __init__(self, base_dir: Path = None):
-        """Initialize the image extractor."""
+    def __init__(self, base_dir: Path = None, processes: Optional[int] = None,
+                 copy_threads: int = config.IMAGE_COPY_THREADS,
+                 mode: str = config.IMAGE_EXPORT_MODE, similar: bool = False):
+        """Initialize the image extractor.
+        
+        ``processes`` is the number of HTML parsing processes, one per CPU
+        core by default; ``copy_threads`` the number of threads copying.
+        ``mode`` is how images are placed in the output directory, one of
+        ``export.MODES``. With ``similar`` near-duplicate images are grouped
+        by perceptual hash, which needs Pillow.
+        """
+        if mode not in export.MODES:
+            raise ValueError(f"Unknown export mode: {mode}")
+        if similar and phash.Image is None:
+            raise ValueError("Grouping similar images needs the 'Pillow' package")
         self.base_dir = Path(base_dir or config.DOWNLOAD_DIR)
         self.images_dir = Path('images')
-        
+        self.processes = processes or os.cpu_count() or 1
+        self.copy_threads = max(1, copy_threads)
+        self.mode = mode
+        self.similar = similar
+        # Decided once per extension instead of asking mimetypes per file
+        self._image_suffixes: Dict[str, bool] = {}
+    
     def list_websites(self) -> List[str]:
         """List all downloaded websites."""
         if not self.base_dir.exists():
             return []
-            
-        return [d.name for d in self.base_dir.iterdir() if d.is_dir()]
         
+        return [d.name for d in self.base_dir.iterdir() if d.is_dir()]
+    
+    def _is_image_suffix(self, suffix: str) -> bool:
+        suffix = suffix.lower()
+        if suffix not in self._image_suffixes:
+            mime_type, _ = mimetypes.guess_type(f"file{suffix}")
+            self._image_suffixes[suffix] = suffix in self.IMAGE_EXTENSIONS or bool(
+                mime_type and mime_type.startswith('image/')
+            )
+        return self._image_suffixes[suffix]
+    
     def _is_image_file(self, path: Path) -> bool:
         """Check if file is an image based on extension or mime type."""
-        ext = path.suffix.lower()
-        if ext in self.IMAGE_EXTENSIONS:
-            return True
-            
-        mime_type, _ = mimetypes.guess_type(str(path))
-        return mime_type and mime_type.startswith('image/')
+        return self._is_image_suffix(path.suffix)
+    
+    def _stored_codecs(self, website_dir: Path) -> Dict[str, str]:
+        """Return the files the crawl stored compressed, relative to ``website_dir``, with their codec."""
+        codecs = {}
+        for url, codec in crawl_state.stored_codecs(website_dir).items():
+            path = utils.get_file_path(url, website_dir)
+            codecs[path.relative_to(website_dir).as_posix()] = codec
+        return codecs
+    
+    def _scan(self, website_dir: Path, codecs: Dict[str, str]) -> Tuple[Dict[str, Stat], Dict[str, Stat]]:
+        """Walk the site once and return the size and mtime of its images and HTML files.
+        
+        Keys are paths relative to ``website_dir`` as files were downloaded;
+        files in ``codecs`` are listed without their compression suffix.
+        Hidden entries (crawl state, blob store) are skipped.
+        """
+        images: Dict[str, Stat] = {}
+        html_files: Dict[str, Stat] = {}
+        originals = {
+            compression.compressed_path(Path(rel), codec).as_posix(): rel
+            for rel, codec in codecs.items()
+        }
+        pending = [('', str(website_dir))]
+        while pending:
+            prefix, directory = pending.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((f"{prefix}{entry.name}/", entry.path))
+                        continue
+                    if not entry.is_file():
+                        continue
+                    rel = originals.get(prefix + entry.name, prefix + entry.name)
+                    suffix = os.path.splitext(rel)[1].lower()
+                    if suffix in self.HTML_EXTENSIONS:
+                        found = html_files
+                    elif self._is_image_suffix(suffix):
+                        found = images
+                    else:
+                        continue
+                    stat = entry.stat()
+                    found[rel] = (stat.st_size, stat.st_mtime_ns)
+        return images, html_files
+    
+    def _find_html_images(self, website_dir: Path, html_files: Dict[str, Stat],
+                          images: Dict[str, Stat], index: ImageIndex,
+                          codecs: Dict[str, str]) -> Dict[str, Stat]:
+        """Find images referenced in HTML files that the scan did not already find.
         
-    def _find_image_files(self, website_dir: Path) -> Set[Path]:
-        """Find all image files in the website directory."""
-        image_files = set()
+        Only pages that are new or changed since the last run are parsed;
+        the references of the others come from the index.
+        """
+        pages = index.load_pages()
+        changed = [
+            rel for rel, stat in html_files.items()
+            if rel not in pages or (pages[rel].size, pages[rel].mtime_ns) != stat
+        ]
+        started = time.monotonic()
+        paths = [str(website_dir / rel) for rel in changed]
+        if self.processes > 1 and len(paths) >= config.IMAGE_PARALLEL_MIN_HTML:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                results = list(executor.map(
+                    _image_sources,
+                    paths,
+                    [codecs.get(rel) for rel in changed],
+                    chunksize=config.IMAGE_PARSE_CHUNK_SIZE
+                ))
+        else:
+            results = [_image_sources(path, codecs.get(rel)) for rel, path in zip(changed, paths)]
+        parsed = {
+            rel: PageRecord(*html_files[rel], sources) for rel, sources in zip(changed, results)
+        }
+        index.update(pages=parsed.items(), removed_pages=[rel for rel in pages if rel not in html_files])
+        pages.update(parsed)
+        if changed:
+            print(f"Parsed {len(changed)} new or changed HTML files in "
+                  f"{time.monotonic() - started:.1f}s")
         
-        for path in website_dir.rglob('*'):
-            if path.is_file() and self._is_image_file(path):
-                image_files.add(path)
-                
-        return image_files
+        referenced: Dict[str, Stat] = {}
+        for rel in html_files:
+            for src in pages[rel].refs:
+                # Convert relative path to absolute
+                img_rel = os.path.normpath(src.lstrip('/'))
+                if img_rel in images or img_rel in referenced or img_rel.startswith('..'):
+                    continue
+                stored = compression.find_stored(website_dir / img_rel, codecs.get(img_rel))
+                if stored and self._is_image_file(website_dir / img_rel):
+                    stat = stored.stat()
+                    referenced[img_rel] = (stat.st_size, stat.st_mtime_ns)
+        return referenced
+    
+    def _fingerprint(self, img_path: Path, codec: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """Return an image's SHA-256 and, if grouping similar images, its perceptual hash.
         
-    def _find_html_images(self, website_dir: Path) -> Dict[str, Path]:
-        """Find all image references in HTML files."""
-        image_refs = {}
+        The perceptual hash is '' for images Pillow can't read.
+        """
+        digest = hashlib.sha256()
+        with compression.open_content(img_path, codec) as f:
+            for block in iter(lambda: f.read(config.DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(block)
+        if not self.similar:
+            return digest.hexdigest(), None
+        with compression.open_content(img_path, codec) as f:
+            return digest.hexdigest(), phash.difference_hash(f) or ''
+    
+    def _copy_image(self, img_path: Path, dest_path: Path, codec: Optional[str] = None) -> Tuple[str, int]:
+        """Export one image and return the method used and its size.
         
-        for html_file in website_dir.rglob('*.html'):
+        Images stored compressed are always decompressed into a copy.
+        """
+        if codec is None:
+            method = export.export_file(img_path, dest_path, self.mode)
+        else:
+            temp_path = export.temp_path(dest_path)
             try:
-                with open(html_file, 'r', encoding='utf-8') as f:
-                    soup = BeautifulSoup(f.read(), 'html.parser')
-                    
-                for img in soup.find_all('img'):
-                    src = img.get('src')
-                    if src:
-                        # Convert relative path to absolute
-                        img_path = website_dir / src.lstrip('/')
-                        if img_path.exists() and self._is_image_file(img_path):
-                            image_refs[src] = img_path
-            except Exception as e:
-                print(f"Error processing {html_file}: {e}")
-                continue
-                
-        return image_refs
+                with compression.open_content(img_path, codec) as src, open(temp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(temp_path, dest_path)
+            finally:
+                temp_path.unlink(missing_ok=True)
+            method = export.COPY
+        return method, dest_path.stat().st_size
+    
+    def _hash_changed(self, website_dir: Path, changed: List[str],
+                      codecs: Dict[str, str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Fingerprint new and changed images in the thread pool."""
+        progress = _Progress(len(changed), 'Hashed')
+        hashed = {}
+        with ThreadPoolExecutor(max_workers=self.copy_threads) as executor:
+            futures = {
+                executor.submit(self._fingerprint, website_dir / rel, codecs.get(rel)): rel
+                for rel in changed
+            }
+            for future in as_completed(futures):
+                try:
+                    hashed[futures[future]] = future.result()
+                    progress.add(0)
+                except Exception as e:
+                    print(f"Error reading {website_dir / futures[future]}: {e}")
+        return hashed
+    
+    @staticmethod
+    def _is_linked(dest: Path, src: Path) -> bool:
+        """Whether ``dest`` is a hardlink or symlink to ``src``, so it changes along with it."""
+        try:
+            return os.path.samefile(dest, src)
+        except OSError:
+            return False
+    
+    def _outdated_exports(self, website_dir: Path, images_dir: Path, records: Dict[str, ImageRecord],
+                          current: Dict[str, ImageRecord]) -> Tuple[Set[str], Dict[str, str]]:
+        """Find the exports of images whose contents changed since the last run.
         
+        ``records`` are the images indexed by the last run and ``current``
+        those found now, both keyed by source path. An export that no image
+        uses any more is returned for removal. An export other images still
+        use, but that is linked to the changed image and so holds its new
+        contents, is returned with one of those images to export it from.
+        """
+        users: Dict[str, str] = {}
+        for rel, record in current.items():
+            users.setdefault(record.dest, rel)
+        stale: Set[str] = set()
+        reexport: Dict[str, str] = {}
+        for rel, previous in records.items():
+            record = current.get(rel)
+            if record is None or record.content_hash == previous.content_hash:
+                continue
+            user = users.get(previous.dest)
+            if user is None:
+                stale.add(previous.dest)
+            elif user != rel and self._is_linked(images_dir / previous.dest, website_dir / rel):
+                reexport[user] = previous.dest
+        return stale, reexport
+    
+    def _write_similar_groups(self, images_dir: Path, records: Dict[str, ImageRecord]) -> None:
+        """Group exported images by perceptual hash and write the groups to a JSON file."""
+        hashes = {record.dest: record.phash for record in records.values() if record.phash}
+        groups = phash.group_similar(hashes)
+        path = images_dir / config.SIMILAR_IMAGES_FILENAME
+        path.write_text(json.dumps(groups, indent=2), encoding='utf-8')
+        print(f"Found {len(groups)} groups of similar images, listed in {path}")
+    
     def extract_images(self, website: str) -> int:
-        """Extract all images from a website directory."""
+        """Extract new and changed images from a website directory.
+        
+        Images whose size and mtime match the index are skipped without
+        being read. Images with the same contents are exported once; output
+        names are ``<stem>_<name>``, or ``<stem>_<hash><suffix>`` when that
+        name already holds a different image. Returns the number of images
+        exported.
+        """
         website_dir = self.base_dir / website
         if not website_dir.exists():
             raise FileSystemError(f"Website directory not found: {website}")
@@ -77,31 +337,105 @@ class ImageExtractor:
         # Create images directory
         images_dir = self.images_dir / website
         images_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Find all image files
-        image_files = self._find_image_files(website_dir)
-        
-        # Find images referenced in HTML
-        html_images = self._find_html_images(website_dir)
-        
-        # Combine all unique image paths
-        all_images = set(image_files) | set(html_images.values())
-        
-        # Copy images to output directory
-        copied_count = 0
-        for img_path in all_images:
-            try:
-                # Create a unique filename
-                new_name = f"{img_path.stem}_{img_path.name}"
-                dest_path = images_dir / new_name
-                
-                # Copy the file
-                shutil.copy2(img_path, dest_path)
-                copied_count += 1
-                print(f"Copied: {img_path.name}")
-                
-            except Exception as e:
-                print(f"Error copying {img_path}: {e}")
-                continue
-                
-        return copied_count 
\ No newline at end of file
+        index = ImageIndex(images_dir)
+        try:
+            # Find image and HTML files in one pass
+            started = time.monotonic()
+            codecs = self._stored_codecs(website_dir)
+            image_files, html_files = self._scan(website_dir, codecs)
+            print(f"Found {len(image_files)} images and {len(html_files)} HTML files "
+                  f"in {time.monotonic() - started:.1f}s")
+            
+            # Add images only found through references in HTML
+            image_files.update(self._find_html_images(website_dir, html_files, image_files, index, codecs))
+            
+            # Skip images the index says are unchanged and still exported
+            records = index.load_images()
+            exported = {entry.name for entry in os.scandir(images_dir)}
+            unchanged = {
+                rel: record for rel, record in records.items()
+                if image_files.get(rel) == (record.size, record.mtime_ns) and
+                record.dest in exported and (not self.similar or record.phash is not None)
+            }
+            changed = sorted(rel for rel in image_files if rel not in unchanged)
+            print(f"{len(unchanged)} images unchanged, {len(changed)} new or changed")
+            hashed = self._hash_changed(website_dir, changed, codecs)
+            
+            # Give each distinct content one output name
+            dest_of_hash = {record.content_hash: record.dest for record in unchanged.values()}
+            hash_of_dest = {record.dest: record.content_hash for record in unchanged.values()}
+            new_records: Dict[str, ImageRecord] = {}
+            to_export: Dict[str, str] = {}
+            kept = 0
+            for rel in changed:
+                if rel not in hashed:
+                    continue
+                content_hash, perceptual_hash = hashed[rel]
+                dest = dest_of_hash.get(content_hash)
+                previous = records.get(rel)
+                if dest is None and previous and previous.content_hash == content_hash and \
+                        previous.dest in exported and hash_of_dest.get(previous.dest, content_hash) == content_hash:
+                    # Touched or only missing a perceptual hash; the export is still current
+                    dest = previous.dest
+                    dest_of_hash[content_hash] = dest
+                    hash_of_dest[dest] = content_hash
+                    kept += 1
+                elif dest is None:
+                    path = Path(rel)
+                    dest = f"{path.stem}_{path.name}"
+                    if hash_of_dest.get(dest, content_hash) != content_hash:
+                        dest = f"{path.stem}_{content_hash[:12]}{path.suffix}"
+                    dest_of_hash[content_hash] = dest
+                    hash_of_dest[dest] = content_hash
+                    to_export[rel] = dest
+                new_records[rel] = ImageRecord(*image_files[rel], content_hash, dest, perceptual_hash)
+            duplicates = len(new_records) - len(to_export) - kept
+            
+            # Drop or refresh the exports of images whose contents changed
+            stale, reexport = self._outdated_exports(
+                website_dir, images_dir, records, {**unchanged, **new_records}
+            )
+            for dest in stale:
+                try:
+                    (images_dir / dest).unlink(missing_ok=True)
+                except OSError as e:
+                    print(f"Error removing outdated export {images_dir / dest}: {e}")
+            for rel, dest in reexport.items():
+                to_export.setdefault(rel, dest)
+            if stale:
+                print(f"Removed {len(stale)} outdated exports")
+            
+            # Export images to output directory
+            progress = _Progress(len(to_export))
+            methods: Counter = Counter()
+            copied_count = 0
+            failed: List[str] = []
+            with ThreadPoolExecutor(max_workers=self.copy_threads) as executor:
+                futures = {
+                    executor.submit(self._copy_image, website_dir / rel, images_dir / dest, codecs.get(rel)): rel
+                    for rel, dest in to_export.items()
+                }
+                for future in as_completed(futures):
+                    try:
+                        method, size = future.result()
+                        progress.add(size)
+                        methods[method] += 1
+                        copied_count += 1
+                    except Exception as e:
+                        print(f"Error copying {website_dir / futures[future]}: {e}")
+                        # Retried on the next run
+                        new_records.pop(futures[future], None)
+                        failed.append(futures[future])
+                        
+            index.update(
+                images=new_records.items(),
+                removed_images=[rel for rel in records if rel not in image_files or rel in failed]
+            )
+            print(f"Exported {copied_count} images ({progress.summary()}" +
+                  "".join(f"; {method}: {count}" for method, count in methods.most_common()) +
+                  f"), skipped {duplicates} duplicates")
+            if self.similar:
+                self._write_similar_groups(images_dir, {**unchanged, **new_records})
+            return copied_count
+        finally:
+            index.close()
@@ -0,0 +1,111 @@
+"""Persistent index that lets image extraction skip files it has already handled."""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import config
+from .exceptions import FileSystemError
+
+
+class ImageRecord(NamedTuple):
+    """What an earlier extraction learned about a downloaded image."""
+    
+    size: int
+    mtime_ns: int
+    # SHA-256 of the image's contents
+    content_hash: str
+    # File name in the output directory holding this content
+    dest: str
+    # 64-bit difference hash as hex, if perceptual hashing was enabled
+    phash: Optional[str] = None
+
+
+class PageRecord(NamedTuple):
+    """Image references found in a downloaded HTML file."""
+    
+    size: int
+    mtime_ns: int
+    refs: List[str]
+
+
+class ImageIndex:
+    """SQLite record of the images and pages of a site, keyed by their path.
+    
+    Paths are relative to the site's download directory. A file whose size
+    and modification time match its record is taken to be unchanged.
+    """
+    
+    def __init__(self, output_dir: Path):
+        """Open the index kept in the site's image output directory."""
+        self.path = output_dir / config.IMAGE_INDEX_FILENAME
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path))
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS images ('
+                'path TEXT PRIMARY KEY, '
+                'size INTEGER NOT NULL, '
+                'mtime_ns INTEGER NOT NULL, '
+                'content_hash TEXT NOT NULL, '
+                'dest TEXT NOT NULL, '
+                'phash TEXT)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'path TEXT PRIMARY KEY, '
+                'size INTEGER NOT NULL, '
+                'mtime_ns INTEGER NOT NULL, '
+                'refs TEXT NOT NULL)'
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise FileSystemError(f"Error opening image index {self.path}: {e}")
+    
+    def load_images(self) -> Dict[str, ImageRecord]:
+        """Return the record of every indexed image."""
+        return {
+            path: ImageRecord(*row)
+            for path, *row in self._conn.execute(
+                'SELECT path, size, mtime_ns, content_hash, dest, phash FROM images'
+            )
+        }
+    
+    def load_pages(self) -> Dict[str, PageRecord]:
+        """Return the record of every indexed page."""
+        return {
+            path: PageRecord(size, mtime_ns, json.loads(refs))
+            for path, size, mtime_ns, refs in self._conn.execute(
+                'SELECT path, size, mtime_ns, refs FROM pages'
+            )
+        }
+    
+    def update(self, images: Iterable[Tuple[str, ImageRecord]] = (),
+               pages: Iterable[Tuple[str, PageRecord]] = (),
+               removed_images: Iterable[str] = (), removed_pages: Iterable[str] = ()) -> None:
+        """Store new and changed records and drop removed ones in one transaction."""
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO images '
+                    '(path, size, mtime_ns, content_hash, dest, phash) VALUES (?, ?, ?, ?, ?, ?)',
+                    ((path, *record) for path, record in images)
+                )
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO pages (path, size, mtime_ns, refs) VALUES (?, ?, ?, ?)',
+                    ((path, r.size, r.mtime_ns, json.dumps(r.refs)) for path, r in pages)
+                )
+                self._conn.executemany(
+                    'DELETE FROM images WHERE path = ?', ((path,) for path in removed_images)
+                )
+                self._conn.executemany(
+                    'DELETE FROM pages WHERE path = ?', ((path,) for path in removed_pages)
+                )
+        except sqlite3.Error as e:
+            raise FileSystemError(f"Error updating image index {self.path}: {e}")
+    
+    def close(self) -> None:
+        """Close the database."""
+        self._conn.close()
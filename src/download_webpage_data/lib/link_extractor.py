@@ -0,0 +1,171 @@
+"""Backends that pull link targets out of HTML pages.
+
+All backends return the same links in the same order: for every tag in
+``config.LINK_TAGS`` in document order, the value of each attribute in
+``config.LINK_ATTRS``, with ``srcset`` split into its candidate URLs.
+A repeated attribute keeps its first value, as it does in browsers.
+"""
+
+from html.parser import HTMLParser
+from typing import AbstractSet, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.compat import chardet
+
+from . import config
+from . import utils
+
+try:
+    import lxml.html
+except ImportError:  # pragma: no cover - optional dependency
+    lxml = None
+
+AUTO = 'auto'
+
+
+class PageLinks(NamedTuple):
+    """Canonical URLs found in a page and how canonicalization affected them."""
+    
+    urls: Set[str]
+    # Canonical URLs the page only linked to through other spellings
+    variants: AbstractSet[str] = frozenset()
+    # Distinct spellings on the page that collapsed into another URL
+    collapsed: int = 0
+
+
+def _expand(attr: str, value: Optional[str]) -> Iterable[str]:
+    """Turn an attribute value into the link targets it holds."""
+    if not value:
+        return ()
+    if attr == 'srcset':
+        candidates = (candidate.strip().split() for candidate in value.split(','))
+        return [parts[0] for parts in candidates if parts]
+    return (value,)
+
+
+def _links_from_attrs(get: Callable[[str], Optional[str]]) -> List[str]:
+    links = []
+    for attr in config.LINK_ATTRS:
+        links.extend(_expand(attr, get(attr)))
+    return links
+
+
+def _extract_soup(content: str, parse_only: Optional[SoupStrainer] = None) -> List[str]:
+    soup = BeautifulSoup(content, 'html.parser', parse_only=parse_only,
+                         on_duplicate_attribute='ignore')
+    links = []
+    for tag in soup.find_all(config.LINK_TAGS):
+        links.extend(_links_from_attrs(tag.get))
+    return links
+
+
+def extract_with_html_parser(content: str) -> List[str]:
+    """Build a full BeautifulSoup tree; the slowest and most forgiving backend."""
+    return _extract_soup(content)
+
+
+def extract_with_strainer(content: str) -> List[str]:
+    """Let BeautifulSoup build only the link tags."""
+    return _extract_soup(content, SoupStrainer(config.LINK_TAGS))
+
+
+class _LinkTokenizer(HTMLParser):
+    """Collect link attributes from start tags without building a tree."""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags = frozenset(config.LINK_TAGS)
+        self.links: List[str] = []
+        
+    def handle_starttag(self, tag, attrs):
+        if tag in self.tags:
+            first: Dict[str, Optional[str]] = {}
+            for name, value in attrs:
+                first.setdefault(name, value)
+            self.links.extend(_links_from_attrs(first.get))
+
+
+def extract_with_tokenizer(content: str) -> List[str]:
+    """Scan start tags with the standard library tokenizer."""
+    tokenizer = _LinkTokenizer()
+    tokenizer.feed(content)
+    tokenizer.close()
+    return tokenizer.links
+
+
+def extract_with_lxml(content: str) -> List[str]:
+    """Parse with lxml's C parser (requires the optional ``lxml`` package)."""
+    if lxml is None:
+        raise ImportError("lxml is not installed")
+    if not content.strip():
+        return []
+    links = []
+    for element in lxml.html.document_fromstring(content).iter(*config.LINK_TAGS):
+        links.extend(_links_from_attrs(element.get))
+    return links
+
+
+BACKENDS: Dict[str, Callable[[str], List[str]]] = {
+    'lxml': extract_with_lxml,
+    'tokenizer': extract_with_tokenizer,
+    'strainer': extract_with_strainer,
+    'html.parser': extract_with_html_parser,
+}
+FALLBACK = 'html.parser'
+
+
+def resolve_backend(name: str = AUTO) -> str:
+    """Pick the backend to use, preferring lxml when it is installed."""
+    if name == AUTO:
+        return 'lxml' if lxml is not None else 'tokenizer'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown link extractor: {name}")
+    return name
+
+
+def extract_links(content: str, backend: str = AUTO) -> List[str]:
+    """Extract raw link targets from HTML, falling back to the full parser on errors."""
+    backend = resolve_backend(backend)
+    try:
+        return BACKENDS[backend](content)
+    except Exception:
+        if backend == FALLBACK:
+            raise
+        return BACKENDS[FALLBACK](content)
+
+
+def find_urls(content: str, page_url: str, domain: str, backend: str = AUTO,
+              downloaded_urls: AbstractSet[str] = frozenset(),
+              strip_tracking: bool = False) -> PageLinks:
+    """Return the canonical absolute URLs on ``domain`` that a page links to."""
+    spellings = set()
+    urls = set()
+    for href in extract_links(content, backend):
+        absolute_url = utils.get_absolute_url(page_url, href)
+        if not absolute_url or absolute_url in spellings:
+            continue
+        try:
+            url = utils.canonicalize_url(absolute_url, strip_tracking)
+        except ValueError:
+            continue
+        if utils.should_download_url(url, domain, downloaded_urls):
+            spellings.add(absolute_url)
+            urls.add(url)
+    return PageLinks(urls, urls - spellings, len(spellings) - len(urls))
+
+
+def parse_page(content: bytes, encoding: Optional[str], page_url: str, domain: str,
+               backend: str = AUTO, strip_tracking: bool = False) -> PageLinks:
+    """Decode raw page bytes and return the URLs it links to.
+    
+    Runs in parse worker processes, so it only takes picklable arguments.
+    Without an encoding from the response headers it is guessed the same way
+    ``requests.Response.text`` does.
+    """
+    if encoding is None:
+        encoding = chardet.detect(content)['encoding'] or 'utf-8'
+    try:
+        text = str(content, encoding, errors='replace')
+    except LookupError:
+        text = str(content, 'utf-8', errors='replace')
+    return find_urls(text, page_url, domain, backend, strip_tracking=strip_tracking)
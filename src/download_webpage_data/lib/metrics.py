@@ -0,0 +1,281 @@
+"""Crawl metrics: counters, gauges and histograms, logged as JSON lines or exported to Prometheus."""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import config
+from .exceptions import FileSystemError
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Label names and values of one series, sorted by name
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metric(NamedTuple):
+    """Definition of a metric: its type, help text and histogram buckets."""
+    
+    kind: str
+    help: str
+    buckets: Tuple[float, ...] = ()
+
+
+METRICS: Dict[str, Metric] = {
+    # Phases of a download, in the order they happen
+    'queue_wait_seconds': Metric(
+        HISTOGRAM, "Time a URL waited in the crawl frontier before a worker took it",
+        config.METRICS_TIME_BUCKETS
+    ),
+    'rate_limit_wait_seconds': Metric(
+        HISTOGRAM, "Time a request waited for the per-host rate limiter", config.METRICS_TIME_BUCKETS
+    ),
+    'connect_seconds': Metric(
+        HISTOGRAM, "SOCKS and TLS setup time of new connections", config.METRICS_TIME_BUCKETS
+    ),
+    'ttfb_seconds': Metric(
+        HISTOGRAM, "Time from sending a request to receiving its headers", config.METRICS_TIME_BUCKETS
+    ),
+    'transfer_seconds': Metric(
+        HISTOGRAM, "Time receiving a response body, including writing streamed bodies",
+        config.METRICS_TIME_BUCKETS
+    ),
+    'parse_seconds': Metric(
+        HISTOGRAM, "Time extracting links from an HTML page", config.METRICS_TIME_BUCKETS
+    ),
+    'write_seconds': Metric(
+        HISTOGRAM, "Time writing a response body to disk", config.METRICS_TIME_BUCKETS
+    ),
+    'response_bytes': Metric(
+        HISTOGRAM, "Size of response bodies received", config.METRICS_SIZE_BUCKETS
+    ),
+    'requests_total': Metric(COUNTER, "HTTP requests sent, by response status"),
+    'pages_total': Metric(COUNTER, "URLs processed, by result"),
+    'bytes_total': Metric(COUNTER, "Response body bytes received"),
+    'retries_total': Metric(COUNTER, "Requests retried, by reason"),
+    'newnym_total': Metric(COUNTER, "NEWNYM signals sent to Tor"),
+    'duplicate_urls_total': Metric(COUNTER, "Links skipped as another spelling of a known URL"),
+    'sitemap_urls_total': Metric(COUNTER, "URLs found in sitemaps"),
+    'in_flight': Metric(GAUGE, "URLs being downloaded"),
+    'frontier': Metric(GAUGE, "URLs waiting to be downloaded"),
+}
+
+# Histograms summarized in the line printed at the end of a crawl
+PHASES = (
+    'queue_wait_seconds', 'rate_limit_wait_seconds', 'connect_seconds', 'ttfb_seconds',
+    'transfer_seconds', 'parse_seconds', 'write_seconds',
+)
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum, as Prometheus keeps them."""
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One count per bucket plus one for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile, None if past the last bound."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+    
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': dict(zip(map(str, self.buckets), self.counts)),
+            'overflow': self.counts[-1],
+        }
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Metrics:
+    """Thread-safe registry of the metrics defined in ``METRICS``.
+    
+    Updating a metric takes one lock and no I/O, so it is cheap enough for
+    the download path. With ``log_path`` events are also appended to a
+    JSON-lines file, one object per line, flushed line by line so the log
+    can be followed during a crawl.
+    """
+    
+    def __init__(self, log_path: Optional[Path] = None):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._log = None
+        if log_path is not None:
+            try:
+                self._log = open(log_path, 'a', buffering=1, encoding='utf-8')
+            except OSError as e:
+                raise FileSystemError(f"Error opening metrics log {log_path}: {e}")
+    
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add ``value`` to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+    
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """Set a gauge."""
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name: str, value: float) -> None:
+        """Record a value in a histogram."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(METRICS[name].buckets)
+            histogram.observe(value)
+    
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Observe the time spent in the ``with`` block in histogram ``name``."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started)
+    
+    def log(self, event: str, **fields: object) -> None:
+        """Append an event to the JSON-lines log, if there is one."""
+        if self._log is None:
+            return
+        line = json.dumps({'time': round(time.time(), 3), 'event': event, **fields})
+        with self._lock:
+            self._log.write(line + '\n')
+    
+    def snapshot(self) -> Dict[str, object]:
+        """Current value of every metric as plain data."""
+        snapshot: Dict[str, object] = {}
+        with self._lock:
+            for (name, labels), value in sorted(self._values.items()):
+                if labels:
+                    key = ','.join(f"{label}={label_value}" for label, label_value in labels)
+                    snapshot.setdefault(name, {})[key] = value
+                else:
+                    snapshot[name] = value
+            for name, histogram in sorted(self._histograms.items()):
+                snapshot[name] = histogram.snapshot()
+        return snapshot
+    
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, metric in METRICS.items():
+                full_name = config.METRICS_PREFIX + name
+                series = sorted(
+                    (labels, value) for (key, labels), value in self._values.items() if key == name
+                )
+                histogram = self._histograms.get(name)
+                if not series and histogram is None:
+                    continue
+                lines.append(f"# HELP {full_name} {metric.help}")
+                lines.append(f"# TYPE {full_name} {metric.kind}")
+                for labels, value in series:
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+                if histogram is not None:
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{full_name}_bucket{{le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{full_name}_bucket{{le="+Inf"}} {histogram.count}')
+                    lines.append(f"{full_name}_sum {_format_value(histogram.sum)}")
+                    lines.append(f"{full_name}_count {histogram.count}")
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self, path: Path) -> None:
+        """Write the Prometheus output to ``path`` atomically, for node_exporter's textfile collector."""
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            temp_path.write_text(self.render(), encoding='utf-8')
+            os.replace(temp_path, path)
+        except OSError as e:
+            temp_path.unlink(missing_ok=True)
+            raise FileSystemError(f"Error writing metrics to {path}: {e}")
+    
+    def summary(self) -> str:
+        """Describe where request time went: mean and 90th percentile of each phase."""
+        parts = []
+        with self._lock:
+            for name in PHASES:
+                histogram = self._histograms.get(name)
+                if histogram is None or not histogram.count:
+                    continue
+                p90 = histogram.quantile(0.9)
+                p90_text = f"{p90 * 1000:.0f} ms" if p90 is not None else f"> {histogram.buckets[-1]:g} s"
+                parts.append(f"{name[:-len('_seconds')].replace('_', ' ')} "
+                             f"{histogram.sum / histogram.count * 1000:.0f} ms (p90 {p90_text})")
+        return "; ".join(parts) or "no requests timed"
+    
+    def close(self) -> None:
+        """Close the JSON-lines log."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+class MetricsServer:
+    """Serve ``metrics`` in the Prometheus format on ``http://<host>:<port>/metrics``.
+    
+    Runs in a daemon thread, so it never keeps the process alive.
+    """
+    
+    def __init__(self, metrics: Metrics, port: int, host: str = config.METRICS_HOST):
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = f"http://{host}:{self._server.server_address[1]}/metrics"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,71 @@
+"""Perceptual hashes for grouping near-duplicate images."""
+
+from typing import BinaryIO, Dict, List, Optional
+
+from . import config
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+# The 64-bit hash is split into this many bands for candidate lookup
+_BANDS = 4
+
+
+def difference_hash(f: BinaryIO) -> Optional[str]:
+    """64-bit difference hash (dHash) of an image as 16 hex digits.
+    
+    The image is shrunk to 9x8 grey pixels and each bit records whether a
+    pixel is brighter than its right neighbour, so resized, recompressed or
+    slightly edited copies get hashes a few bits apart. Returns None for
+    files Pillow can't read, such as SVG.
+    """
+    try:
+        with Image.open(f) as image:
+            pixels = list(image.convert('L').resize((9, 8)).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def group_similar(hashes: Dict[str, str],
+                  max_distance: int = config.PHASH_MAX_DISTANCE) -> List[List[str]]:
+    """Group keys whose hashes differ in at most ``max_distance`` bits.
+    
+    Hashes are compared only when they agree on one of ``_BANDS`` bit
+    ranges, which any two hashes within ``max_distance < _BANDS`` bits of
+    each other do, so this stays far from quadratic on large sets.
+    Returns groups of two or more keys.
+    """
+    values = {key: int(value, 16) for key, value in hashes.items()}
+    parent = {key: key for key in values}
+    
+    def find(key: str) -> str:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+    
+    band_bits = 64 // _BANDS
+    mask = (1 << band_bits) - 1
+    for band in range(_BANDS):
+        buckets: Dict[int, List[str]] = {}
+        for key, value in values.items():
+            buckets.setdefault((value >> (band * band_bits)) & mask, []).append(key)
+        for keys in buckets.values():
+            for i, key in enumerate(keys):
+                for other in keys[i + 1:]:
+                    if bin(values[key] ^ values[other]).count('1') <= max_distance:
+                        parent[find(key)] = find(other)
+    
+    groups: Dict[str, List[str]] = {}
+    for key in values:
+        groups.setdefault(find(key), []).append(key)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
@@ -0,0 +1,112 @@
+"""Optional profiling of a crawl with cProfile or pyinstrument, worker threads included."""
+
+import cProfile
+import functools
+from pathlib import Path
+import pstats
+import sys
+import threading
+from typing import Callable, List, Optional
+
+from . import config
+
+try:
+    import pyinstrument
+    from pyinstrument.renderers import HTMLRenderer
+    from pyinstrument.session import Session
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
+CPROFILE = 'cprofile'
+PYINSTRUMENT = 'pyinstrument'
+KINDS = (CPROFILE, PYINSTRUMENT)
+
+# From Python 3.12 cProfile hooks in through sys.monitoring, which sees every
+# thread and allows only one active profiler; before that it sees one thread
+_CPROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class Profiler:
+    """Profile the calling thread and every task run through ``wrap``.
+    
+    pyinstrument, and cProfile before Python 3.12, only watch the thread
+    they are started on, so each worker thread gets its own profiler,
+    switched on while it runs a task; the results are merged by ``stop``.
+    HTML parsed in worker processes is not profiled.
+    """
+    
+    def __init__(self, kind: str, output: Optional[Path] = None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown profiler: {kind}")
+        if kind == PYINSTRUMENT and pyinstrument is None:
+            raise ValueError("Profiling with pyinstrument needs the 'pyinstrument' package")
+        self.kind = kind
+        self.output = Path(output or config.PROFILE_OUTPUTS[kind])
+        self._main = None
+        self._local = threading.local()
+        self._profilers: List[object] = []
+        self._lock = threading.Lock()
+    
+    def _create(self):
+        if self.kind == CPROFILE:
+            return cProfile.Profile()
+        return pyinstrument.Profiler(interval=config.PROFILE_INTERVAL)
+    
+    def _enable(self, profiler) -> None:
+        if self.kind == CPROFILE:
+            profiler.enable()
+        else:
+            profiler.start()
+    
+    def _disable(self, profiler) -> None:
+        if self.kind == CPROFILE:
+            profiler.disable()
+        else:
+            profiler.stop()
+    
+    def start(self) -> None:
+        """Start profiling the calling thread."""
+        self._main = self._create()
+        self._enable(self._main)
+    
+    def wrap(self, task: Callable) -> Callable:
+        """Return ``task`` so that it is profiled in whichever thread runs it."""
+        if self.kind == CPROFILE and _CPROFILE_ALL_THREADS:
+            # The profiler started in the main thread already sees the workers
+            return task
+        
+        @functools.wraps(task)
+        def profiled(*args, **kwargs):
+            profiler = getattr(self._local, 'profiler', None)
+            if profiler is None:
+                profiler = self._local.profiler = self._create()
+                with self._lock:
+                    self._profilers.append(profiler)
+            self._enable(profiler)
+            try:
+                return task(*args, **kwargs)
+            finally:
+                self._disable(profiler)
+        
+        return profiled
+    
+    def stop(self) -> Path:
+        """Stop profiling, write the merged results to ``self.output`` and return its path.
+        
+        A cProfile run is saved in pstats format (view it with ``snakeviz`` or
+        ``python -m pstats``) and its most expensive functions are printed;
+        a pyinstrument run is saved as an HTML report.
+        """
+        self._disable(self._main)
+        with self._lock:
+            profilers = [self._main, *self._profilers]
+        if self.kind == CPROFILE:
+            stats = pstats.Stats(*profilers)
+            stats.dump_stats(str(self.output))
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(config.PROFILE_TOP)
+        else:
+            sessions = [profiler.last_session for profiler in profilers if profiler.last_session]
+            session = functools.reduce(Session.combine, sessions)
+            self.output.write_text(HTMLRenderer().render(session), encoding='utf-8')
+        print(f"Profile written to {self.output}")
+        return self.output
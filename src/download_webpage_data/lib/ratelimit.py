@@ -0,0 +1,117 @@
+"""Adaptive per-host request pacing and retry backoff."""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from . import config
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry number ``attempt`` (0-based), with full jitter."""
+    return random.uniform(0, min(config.BACKOFF_MAX, config.BACKOFF_BASE * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Turn a ``Retry-After`` header (seconds or HTTP date) into seconds to wait."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        delay = float(value)
+    else:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        delay = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), config.MAX_RETRY_AFTER)
+
+
+class _HostState:
+    """Pacing state of one host."""
+    
+    def __init__(self):
+        self.rate = config.RATE_INITIAL
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.min_latency: Optional[float] = None
+
+
+class AdaptiveRateLimiter:
+    """Space out requests per host and adapt the rate with AIMD.
+    
+    Every success adds ``RATE_INCREASE`` requests/s. Throttling (403, 429,
+    503), errors and latency well above the best seen for the host multiply
+    the rate by ``RATE_DECREASE``. ``Retry-After`` pauses the host entirely.
+    """
+    
+    def __init__(self):
+        """Create a limiter with no hosts seen yet."""
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+        
+    def _host(self, host: str) -> _HostState:
+        if host not in self._hosts:
+            self._hosts[host] = _HostState()
+        return self._hosts[host]
+        
+    def rate(self, host: str) -> float:
+        """Current request rate allowed for a host, in requests per second."""
+        with self._lock:
+            return self._host(host).rate
+            
+    def delay(self, host: str) -> float:
+        """Seconds until a request to ``host`` may be sent, 0 if it may go now."""
+        with self._lock:
+            state = self._host(host)
+            return max(0.0, max(state.next_slot, state.blocked_until) - time.monotonic())
+            
+    def acquire(self, host: str, stop: Optional[threading.Event] = None) -> None:
+        """Block until the next request to ``host`` may be sent.
+        
+        Returns early once ``stop`` is set; the caller checks it before
+        sending anything.
+        """
+        with self._lock:
+            state = self._host(host)
+            now = time.monotonic()
+            start = max(now, state.next_slot, state.blocked_until)
+            state.next_slot = start + 1.0 / state.rate
+        if start > now:
+            if stop is None:
+                time.sleep(start - now)
+            else:
+                stop.wait(start - now)
+            
+    def _decrease(self, state: _HostState, factor: float) -> None:
+        state.rate = max(config.RATE_MIN, state.rate * factor)
+        
+    def record_success(self, host: str, latency: float) -> None:
+        """Record a successful request that took ``latency`` seconds to answer."""
+        with self._lock:
+            state = self._host(host)
+            if state.min_latency is None or latency < state.min_latency:
+                state.min_latency = latency
+            if latency > state.min_latency * config.LATENCY_BACKOFF_FACTOR:
+                self._decrease(state, config.LATENCY_DECREASE)
+            else:
+                state.rate = min(config.RATE_MAX, state.rate + config.RATE_INCREASE)
+                
+    def record_throttle(self, host: str, retry_after: Optional[float] = None) -> None:
+        """Record that the host refused a request, optionally asking us to wait."""
+        with self._lock:
+            state = self._host(host)
+            self._decrease(state, config.RATE_DECREASE)
+            if retry_after:
+                state.blocked_until = max(state.blocked_until, time.monotonic() + retry_after)
+                
+    def record_error(self, host: str) -> None:
+        """Record a failed request (timeout, connection error, server error)."""
+        with self._lock:
+            self._decrease(self._host(host), config.RATE_DECREASE)
@@ -0,0 +1,93 @@
+"""Priority-ordered crawl frontier with depth, page and byte budgets."""
+
+import heapq
+import posixpath
+import time
+from typing import List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from . import config
+
+# Content classes, in the order they are downloaded
+PAGE = 0
+ASSET = 1
+OTHER = 2
+MEDIA = 3
+
+
+def content_class(url: str) -> int:
+    """Guess what a URL points to from its file extension."""
+    ext = posixpath.splitext(urlparse(url).path)[1].lower()
+    if not ext or ext in config.PAGE_EXTENSIONS:
+        return PAGE
+    if ext in config.ASSET_EXTENSIONS:
+        return ASSET
+    if ext in config.MEDIA_EXTENSIONS:
+        return MEDIA
+    return OTHER
+
+
+class QueuedUrl(NamedTuple):
+    """A URL taken from the frontier."""
+    
+    url: str
+    depth: int
+    # Seconds it spent in the frontier
+    waited: float
+
+
+class CrawlScheduler:
+    """Hand out queued URLs in order of usefulness until a budget runs out.
+    
+    URLs are ordered breadth-first by depth, pages before images, scripts and
+    styles, then discovery order. Large media (video, audio, archives) waits
+    until everything else is done, so it can't hold up discovery of pages.
+    """
+    
+    def __init__(self, max_depth: Optional[int] = None, max_pages: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """Create an empty frontier; budgets that are None are unlimited."""
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.pages = 0
+        self.bytes = 0
+        self._heap: List[Tuple[bool, int, int, int, str, float]] = []
+        self._queued: Set[str] = set()
+        self._counter = 0
+        
+    def push(self, url: str, depth: int = 0) -> bool:
+        """Queue a URL found at ``depth``; returns False if it is too deep or already queued."""
+        if url in self._queued or (self.max_depth is not None and depth > self.max_depth):
+            return False
+        kind = content_class(url)
+        heapq.heappush(self._heap, (kind == MEDIA, depth, kind, self._counter, url, time.monotonic()))
+        self._counter += 1
+        self._queued.add(url)
+        return True
+        
+    def pop(self) -> QueuedUrl:
+        """Remove and return the most useful queued URL, its depth and how long it waited."""
+        _, depth, _, _, url, queued_at = heapq.heappop(self._heap)
+        self._queued.discard(url)
+        return QueuedUrl(url, depth, time.monotonic() - queued_at)
+        
+    def record_page(self) -> None:
+        """Count a URL handed to a worker against the page budget."""
+        self.pages += 1
+        
+    def record_bytes(self, nbytes: int) -> None:
+        """Count downloaded bytes against the byte budget."""
+        self.bytes += nbytes
+        
+    @property
+    def exhausted(self) -> bool:
+        """Whether the page or byte budget has been used up."""
+        return ((self.max_pages is not None and self.pages >= self.max_pages) or
+                (self.max_bytes is not None and self.bytes >= self.max_bytes))
+        
+    def __contains__(self, url: object) -> bool:
+        return url in self._queued
+        
+    def __len__(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,190 @@
+"""Discover a site's pages from robots.txt and its XML sitemaps, read as streams."""
+
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import gzip
+import io
+import re
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from xml.etree import ElementTree
+
+import requests
+
+from . import config
+from . import utils
+from .exceptions import DownloadError
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# W3C datetime as used by <lastmod>: a date, optionally with a time and zone
+_W3C_DATETIME = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})'
+    r'(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$'
+)
+
+
+class SitemapUrl(NamedTuple):
+    """A page listed in a sitemap."""
+    
+    url: str
+    # <lastmod> as a Unix timestamp; None if missing or not understood
+    lastmod: Optional[float] = None
+
+
+def robots_sitemaps(text: str) -> List[str]:
+    """Return the sitemap URLs listed in a robots.txt."""
+    sitemaps = []
+    for line in text.splitlines():
+        name, _, value = line.split('#', 1)[0].partition(':')
+        if name.strip().lower() == 'sitemap' and value.strip():
+            sitemaps.append(value.strip())
+    return sitemaps
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """Turn a ``<lastmod>`` value into a Unix timestamp.
+    
+    A date without a time counts as the end of that day, so a page changed
+    later on the day it was downloaded isn't taken to be unchanged.
+    """
+    match = _W3C_DATETIME.match(value.strip()) if value else None
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, zone = match.groups()
+    tz = timezone.utc
+    if zone and zone != 'Z':
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+        tz = timezone(offset if zone[0] == '+' else -offset)
+    try:
+        when = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+                        int(second or 0), tzinfo=tz)
+    except ValueError:
+        return None
+    if hour is None:
+        when += timedelta(days=1)
+    return when.timestamp()
+
+
+class _LimitedReader(io.RawIOBase):
+    """Read ``stream``, failing once more than SITEMAP_MAX_BYTES come out of it.
+    
+    ``stream`` is anything with a ``read`` method. Wrapping urllib3 responses
+    also keeps ``io.BufferedReader`` off them, as they report themselves
+    closed as soon as their body is used up.
+    """
+    
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._left = config.SITEMAP_MAX_BYTES
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(min(len(buffer), self._left + 1))
+        if len(data) > self._left:
+            raise ValueError(f"Sitemap larger than {config.SITEMAP_MAX_BYTES} bytes")
+        self._left -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_sitemap(body: BinaryIO) -> io.BufferedReader:
+    """Wrap a sitemap body for reading, decompressing it if it is gzipped.
+    
+    Whether it is gzipped is told from its first bytes, not its name, as
+    ``sitemap.xml.gz`` is often served already decompressed.
+    """
+    stream = io.BufferedReader(_LimitedReader(body))
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = io.BufferedReader(_LimitedReader(gzip.GzipFile(fileobj=stream)))
+    return stream
+
+
+def iter_sitemap(stream: io.BufferedReader) -> Iterator[Tuple[bool, str, Optional[str]]]:
+    """Yield ``(is_index, loc, lastmod)`` for every entry of a sitemap.
+    
+    ``is_index`` is True for the ``<sitemap>`` entries of a sitemap index.
+    The XML is parsed incrementally and each entry is dropped once yielded,
+    so memory stays flat however large the sitemap is. Plain-text sitemaps,
+    one URL per line, are read as well.
+    """
+    if not stream.peek(64).lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<'):
+        for line in stream:
+            loc = line.strip().decode('utf-8', 'replace').lstrip('\ufeff')
+            if loc:
+                yield False, loc, None
+        return
+    
+    root = None
+    loc = lastmod = None
+    # Only <loc> and <lastmod> right inside an entry count; extensions such
+    # as image sitemaps nest their own <loc> deeper
+    depth = 0
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        tag = element.tag.rpartition('}')[2]
+        if depth == 2 and tag == 'loc':
+            loc = (element.text or '').strip()
+        elif depth == 2 and tag == 'lastmod':
+            lastmod = (element.text or '').strip()
+        elif depth == 1 and tag in ('url', 'sitemap'):
+            if loc:
+                yield tag == 'sitemap', loc, lastmod
+            loc = lastmod = None
+            root.clear()
+
+
+def discover(base_url: str, get: Callable[[str], requests.Response],
+             strip_tracking: bool = False) -> Iterator[SitemapUrl]:
+    """Yield the canonical URLs on ``base_url``'s host that its sitemaps list.
+    
+    The sitemaps are the ones robots.txt names, or ``/sitemap.xml`` if it
+    names none. Sitemap indexes are followed up to SITEMAP_MAX_DEPTH levels
+    deep, and reading stops after SITEMAP_MAX_FILES sitemaps or
+    SITEMAP_MAX_URLS URLs. ``get`` fetches a URL as a streamed response;
+    sitemaps that can't be downloaded or parsed are reported and skipped.
+    """
+    domain = utils.get_domain(base_url)
+    try:
+        with get(f"{base_url}/robots.txt") as response:
+            sitemaps = robots_sitemaps(response.text)
+    except (DownloadError, requests.exceptions.RequestException):
+        sitemaps = []
+    
+    queue = deque((url, 0) for url in sitemaps or [f"{base_url}/sitemap.xml"])
+    seen: Set[str] = set()
+    found = 0
+    while queue and len(seen) < config.SITEMAP_MAX_FILES and found < config.SITEMAP_MAX_URLS:
+        sitemap_url, level = queue.popleft()
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        try:
+            with get(sitemap_url) as response:
+                response.raw.decode_content = True
+                for is_index, loc, lastmod in iter_sitemap(open_sitemap(response.raw)):
+                    loc = utils.get_absolute_url(sitemap_url, loc)
+                    if not loc:
+                        continue
+                    if is_index:
+                        if level < config.SITEMAP_MAX_DEPTH:
+                            queue.append((loc, level + 1))
+                        continue
+                    try:
+                        url = utils.canonicalize_url(loc, strip_tracking)
+                    except ValueError:
+                        continue
+                    if utils.should_download_url(url, domain, frozenset()):
+                        found += 1
+                        yield SitemapUrl(url, parse_lastmod(lastmod))
+                        if found >= config.SITEMAP_MAX_URLS:
+                            break
+        except (DownloadError, requests.exceptions.RequestException, ElementTree.ParseError,
+                OSError, EOFError, ValueError) as e:
+            print(f"Skipping sitemap {sitemap_url}: {e}")
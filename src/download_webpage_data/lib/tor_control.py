@@ -0,0 +1,130 @@
+"""Shared connection to Tor's control port."""
+
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from stem import CircStatus, Signal
+from stem.control import Controller, EventType
+
+from . import config
+from .exceptions import TorIdentityError
+
+
+class TorController:
+    """Long-lived, thread-safe wrapper around a stem ``Controller``.
+    
+    Concurrent identity requests are merged: a caller whose request is
+    already covered by a NEWNYM sent after it asked, or by one Tor is still
+    rate limiting, just waits for that one to take effect.
+    """
+    
+    def __init__(self, port: int = config.TOR_CONTROL_PORT,
+                 password: Optional[str] = config.TOR_CONTROL_PASSWORD):
+        """Prepare the controller; the connection is opened on first use."""
+        self.port = port
+        self.password = password
+        self._controller: Optional[Controller] = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._last_newnym = 0.0
+        self._circuit_built = threading.Event()
+        self._listeners: List[Tuple[Callable, Tuple[EventType, ...]]] = []
+        
+    def _connect(self) -> Controller:
+        """Return a live controller, reconnecting if the old one went away."""
+        if self._controller is not None and self._controller.is_alive():
+            return self._controller
+        try:
+            controller = Controller.from_port(port=self.port)
+            controller.authenticate(password=self.password)
+            controller.add_event_listener(self._on_circuit, EventType.CIRC)
+            for listener, events in self._listeners:
+                controller.add_event_listener(listener, *events)
+        except Exception as e:
+            raise TorIdentityError(f"Could not connect to Tor control port {self.port}: {e}")
+        self._controller = controller
+        return controller
+        
+    def _on_circuit(self, event) -> None:
+        # Called from stem's event thread
+        if event.status == CircStatus.BUILT:
+            self._circuit_built.set()
+            
+    @property
+    def controller(self) -> Controller:
+        """The underlying stem controller, connected on first access."""
+        with self._lock:
+            return self._connect()
+            
+    def add_event_listener(self, listener: Callable, *events: EventType) -> None:
+        """Subscribe to control port events, also across reconnects."""
+        with self._lock:
+            self._listeners.append((listener, events))
+            if self._controller is not None and self._controller.is_alive():
+                self._controller.add_event_listener(listener, *events)
+            else:
+                self._connect()
+                
+    def close_circuit(self, circuit_id: str) -> None:
+        """Close a Tor circuit; streams on it are moved to other circuits."""
+        with self._lock:
+            try:
+                self._connect().close_circuit(circuit_id)
+            except Exception as e:
+                print(f"Could not close Tor circuit {circuit_id}: {e}")
+                
+    def _should_signal(self, controller: Controller, requested: int) -> bool:
+        """Whether a request made at generation ``requested`` still needs its own NEWNYM."""
+        if self._generation != requested:
+            return False
+        recent = time.monotonic() - self._last_newnym < config.NEWNYM_MIN_INTERVAL
+        return not (recent and not controller.is_newnym_available())
+        
+    @staticmethod
+    def _wait(event: threading.Event, timeout: float, stop: Optional[threading.Event]) -> None:
+        """Wait up to ``timeout`` seconds for ``event``, giving up once ``stop`` is set."""
+        deadline = time.monotonic() + timeout
+        while not event.is_set() and not (stop is not None and stop.is_set()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event.wait(min(remaining, config.NEWNYM_STOP_CHECK_INTERVAL))
+        
+    def new_identity(self, stop: Optional[threading.Event] = None) -> bool:
+        """Switch Tor to new circuits and wait until one is built.
+        
+        Returns True if this call sent NEWNYM, False if it was merged into
+        another request. Once ``stop`` is set, waiting for Tor is cut short.
+        """
+        requested = self._generation
+        sent = False
+        with self._lock:
+            controller = self._connect()
+            try:
+                if self._should_signal(controller, requested):
+                    if not controller.is_newnym_available():
+                        wait = controller.get_newnym_wait()
+                        if stop is None:
+                            time.sleep(wait)
+                        elif stop.wait(wait):
+                            return False
+                    self._circuit_built.clear()
+                    controller.signal(Signal.NEWNYM)
+                    self._generation += 1
+                    self._last_newnym = time.monotonic()
+                    sent = True
+                    print("Successfully obtained new Tor identity")
+            except Exception as e:
+                raise TorIdentityError(f"Could not obtain new Tor identity: {e}")
+            built = self._circuit_built
+            
+        self._wait(built, config.NEWNYM_CIRCUIT_TIMEOUT, stop)
+        return sent
+        
+    def close(self) -> None:
+        """Close the control connection."""
+        with self._lock:
+            if self._controller is not None:
+                self._controller.close()
+                self._controller = None
@@ -1,9 +1,19 @@
+import hashlib
+import os
+import re
+import string
+from contextlib import nullcontext
 from pathlib import Path
-from urllib.parse import urlparse, urljoin
-from typing import Optional, Set
+from urllib.parse import urlparse, urljoin, urlunsplit, urlsplit
+from typing import TYPE_CHECKING, AbstractSet, Iterable, Optional
 
+from . import compression
+from . import config
 from .exceptions import FileSystemError
 
+if TYPE_CHECKING:
+    from .blob_store import BlobStore
+
 def is_valid_url(url: str) -> bool:
     """Check if URL is valid and has proper scheme and netloc."""
     try:
@@ -31,18 +41,126 @@ def get_file_path(url: str, base_dir: Path, default_index: str = 'index.html') -
     
     return base_dir / rel_path.lstrip('/')
 
-def save_content(content: bytes, filepath: Path) -> bool:
+def get_partial_path(filepath: Path) -> Path:
+    """Get the temporary path a file is written to before it is complete."""
+    return filepath.with_name(filepath.name + config.PARTIAL_SUFFIX)
+
+def get_validator_path(filepath: Path) -> Path:
+    """Get the path storing the validator (ETag/Last-Modified) of a partial file."""
+    return filepath.with_name(filepath.name + config.PARTIAL_SUFFIX + config.VALIDATOR_SUFFIX)
+
+def get_partial_size(filepath: Path) -> int:
+    """Get the number of bytes already written to the partial file."""
+    try:
+        return get_partial_path(filepath).stat().st_size
+    except OSError:
+        return 0
+
+def load_partial_validator(filepath: Path, url: str) -> Optional[str]:
+    """Load the validator the partial file was downloaded from ``url`` with, if any.
+
+    Several URLs can map to one file; a partial file another of them left
+    behind has no validator for ``url``.
+    """
+    try:
+        saved_url, _, validator = get_validator_path(filepath).read_text(encoding='utf-8').partition('\n')
+    except OSError:
+        return None
+    if saved_url != url:
+        return None
+    return validator.strip() or None
+
+def save_partial_validator(filepath: Path, url: str, validator: Optional[str]) -> None:
+    """Store the validator of a partial file downloaded from ``url``, or remove it if there is none."""
+    validator_path = get_validator_path(filepath)
+    try:
+        if validator:
+            validator_path.parent.mkdir(parents=True, exist_ok=True)
+            validator_path.write_text(f"{url}\n{validator}", encoding='utf-8')
+        else:
+            validator_path.unlink(missing_ok=True)
+    except OSError as e:
+        raise FileSystemError(f"Error saving validator for {filepath}: {e}")
+
+def discard_partial(filepath: Path) -> None:
+    """Remove a partial file and its validator."""
+    get_partial_path(filepath).unlink(missing_ok=True)
+    get_validator_path(filepath).unlink(missing_ok=True)
+
+def hash_content(content: bytes) -> str:
+    """Get the SHA-256 hex digest of content."""
+    return hashlib.sha256(content).hexdigest()
+
+def save_content(content: bytes, filepath: Path, store: Optional['BlobStore'] = None,
+                 codec: Optional[str] = None) -> bool:
     """Save content to file, creating directories if needed."""
+    save_stream([content], filepath, store=store, codec=codec)
+    return True
+
+def _hash_file(filepath: Path) -> 'hashlib._Hash':
+    """Start a SHA-256 hash with the contents of ``filepath``."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(config.DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest
+
+def save_stream(chunks: Iterable[bytes], filepath: Path, append: bool = False,
+                keep_partial: bool = False, store: Optional['BlobStore'] = None,
+                codec: Optional[str] = None) -> int:
+    """Write chunks to a temporary file and atomically move it into place.
+    
+    With ``append`` the chunks continue an existing partial file. Returns the
+    number of bytes written. Errors raised by ``chunks`` (e.g. a dropped
+    connection) propagate unchanged; the partial file is kept for a later
+    resume only if ``keep_partial`` is set. With ``store`` the body is hashed
+    while it is written and ends up in the content-addressed store, with
+    ``filepath`` linked to it. With ``codec`` the file is stored compressed
+    under the codec's suffix (see ``lib/compression.py``); compressed files
+    can't be appended to.
+    """
+    target = compression.compressed_path(filepath, codec)
+    partial_path = get_partial_path(target)
     try:
         filepath.parent.mkdir(parents=True, exist_ok=True)
-        with open(filepath, 'wb') as f:
-            f.write(content)
-        return True
-    except Exception as e:
+        digest = None
+        if store is not None:
+            digest = _hash_file(partial_path) if append else hashlib.sha256()
+        f = open(partial_path, 'ab' if append else 'wb')
+    except OSError as e:
         raise FileSystemError(f"Error saving file {filepath}: {e}")
+        
+    written = 0
+    try:
+        with f, (compression.open_writer(f, codec) if codec else nullcontext(f)) as out:
+            for chunk in chunks:
+                try:
+                    out.write(chunk)
+                except OSError as e:
+                    raise FileSystemError(f"Error saving file {filepath}: {e}")
+                if digest is not None:
+                    digest.update(chunk)
+                written += len(chunk)
+    except BaseException:
+        if not keep_partial:
+            discard_partial(target)
+        raise
+        
+    if store is not None:
+        # Compressed and plain copies of the same body are different blobs
+        store.commit(partial_path, target, digest.hexdigest() + target.name[len(filepath.name):])
+    try:
+        if store is None:
+            os.replace(partial_path, target)
+        get_validator_path(filepath).unlink(missing_ok=True)
+    except OSError as e:
+        raise FileSystemError(f"Error saving file {filepath}: {e}")
+    return written
 
 def get_absolute_url(base_url: str, href: Optional[str]) -> Optional[str]:
     """Convert relative URL to absolute URL."""
+    # Browsers ignore whitespace around URLs in attributes
+    href = href.strip() if href else None
     if not href:
         return None
     try:
@@ -50,7 +168,69 @@ def get_absolute_url(base_url: str, href: Optional[str]) -> Optional[str]:
     except:
         return None
 
-def should_download_url(url: str, domain: str, downloaded_urls: Set[str]) -> bool:
+_UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def _normalize_escapes(part: str) -> str:
+    """Decode escaped unreserved characters and upper-case the remaining escapes."""
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in _UNRESERVED else f"%{match.group(1).upper()}"
+    return _ESCAPE.sub(replace, part)
+
+def _remove_dot_segments(path: str) -> str:
+    """Resolve ``.`` and ``..`` path segments (RFC 3986, section 5.2.4)."""
+    segments = path.split('/')
+    resolved = []
+    for segment in segments:
+        if segment == '.':
+            continue
+        if segment == '..':
+            if len(resolved) > 1:
+                resolved.pop()
+            continue
+        resolved.append(segment)
+    if segments[-1] in ('.', '..'):
+        resolved.append('')
+    return '/'.join(resolved)
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in config.TRACKING_PARAMS or name.startswith(config.TRACKING_PARAM_PREFIXES)
+
+def canonicalize_url(url: str, strip_tracking: bool = False) -> str:
+    """Normalize a URL so that spellings of the same resource compare equal.
+    
+    Drops the fragment and default port, lower-cases scheme and host, resolves
+    dot segments, normalizes percent-encoding and sorts query parameters. With
+    ``strip_tracking`` parameters listed in ``config.TRACKING_PARAMS`` are
+    removed as well.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    
+    netloc = (parts.hostname or '').lower()
+    if ':' in netloc:
+        netloc = f"[{netloc}]"
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc += f":{parts.port}"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += f":{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+        
+    path = _remove_dot_segments(_normalize_escapes(parts.path)) or '/'
+    
+    params = [_normalize_escapes(param) for param in parts.query.split('&') if param]
+    if strip_tracking:
+        params = [param for param in params if not _is_tracking_param(param.split('=', 1)[0])]
+    query = '&'.join(sorted(params))
+    
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+def should_download_url(url: str, domain: str, downloaded_urls: AbstractSet[str]) -> bool:
     """Check if URL should be downloaded."""
     return (is_valid_url(url) and 
             urlparse(url).netloc == domain and 
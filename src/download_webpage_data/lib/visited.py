@@ -0,0 +1,175 @@
+"""Visited-URL sets that stay small on sites with millions of URLs.
+
+Memory per URL, roughly:
+
+- ``exact``: a Python ``set`` of the URL strings, about 100-200 bytes.
+- ``fingerprint``: 64-bit hashes in an open-addressing ``array``, 16-32
+  bytes (8 bytes per slot at a load factor between 1/4 and 1/2). Two URLs
+  share a fingerprint with probability about n^2 / 2^65, i.e. under 1 in
+  300,000 for ten million URLs.
+- ``bloom``: a Bloom filter, ``-ln(p) / ln(2)^2`` bits for error rate ``p``,
+  e.g. 2.4 bytes at 0.1%. The bit array can live in a memory-mapped file so
+  the OS spills it to disk. Its error rate only holds up to its capacity.
+
+A false positive makes the crawler skip a URL it has not downloaded.
+"""
+
+import hashlib
+import math
+import mmap
+from array import array
+from pathlib import Path
+from typing import Iterable, Optional, Set, Union
+
+from . import config
+from .exceptions import FileSystemError
+
+EXACT = 'exact'
+FINGERPRINT = 'fingerprint'
+BLOOM = 'bloom'
+KINDS = (EXACT, FINGERPRINT, BLOOM)
+
+
+def _digest(url: str, size: int) -> bytes:
+    return hashlib.blake2b(url.encode('utf-8', 'surrogatepass'), digest_size=size).digest()
+
+
+class FingerprintSet:
+    """Set of 64-bit URL fingerprints with linear probing in an ``array('Q')``."""
+    
+    def __init__(self, capacity: int = 1024):
+        """Create a table with room for ``capacity`` URLs before it grows."""
+        size = 1
+        while size < capacity * 2:
+            size *= 2
+        self._slots = array('Q', [0]) * size
+        self._mask = size - 1
+        self._len = 0
+        
+    @staticmethod
+    def _fingerprint(url: str) -> int:
+        # 0 marks an empty slot
+        return int.from_bytes(_digest(url, 8), 'little') or 1
+        
+    def _find(self, fingerprint: int) -> int:
+        slots = self._slots
+        index = fingerprint & self._mask
+        while slots[index] and slots[index] != fingerprint:
+            index = (index + 1) & self._mask
+        return index
+        
+    def _grow(self) -> None:
+        old = self._slots
+        self._slots = array('Q', [0]) * (len(old) * 2)
+        self._mask = len(self._slots) - 1
+        for fingerprint in old:
+            if fingerprint:
+                self._slots[self._find(fingerprint)] = fingerprint
+                
+    def add(self, url: str) -> None:
+        """Add a URL."""
+        fingerprint = self._fingerprint(url)
+        index = self._find(fingerprint)
+        if not self._slots[index]:
+            self._slots[index] = fingerprint
+            self._len += 1
+            if self._len * 2 > len(self._slots):
+                self._grow()
+                
+    def update(self, urls: Iterable[str]) -> None:
+        """Add several URLs."""
+        for url in urls:
+            self.add(url)
+            
+    def __contains__(self, url: object) -> bool:
+        if not isinstance(url, str):
+            return False
+        fingerprint = self._fingerprint(url)
+        return self._slots[self._find(fingerprint)] == fingerprint
+        
+    def __len__(self) -> int:
+        return self._len
+
+
+class BloomFilter:
+    """Bloom filter sized for ``capacity`` URLs at the given false-positive rate."""
+    
+    def __init__(self, capacity: int, error_rate: float, path: Optional[Path] = None):
+        """Create the bit array, memory-mapped from ``path`` if one is given."""
+        if not 0 < error_rate < 1:
+            raise ValueError(f"Bloom filter error rate must be between 0 and 1: {error_rate}")
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._len = 0
+        self._file = None
+        size = (self.num_bits + 7) // 8
+        
+        if path is None:
+            self._bits = bytearray(size)
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self._bits = mmap.mmap(self._file.fileno(), size)
+        except OSError as e:
+            raise FileSystemError(f"Error creating visited set file {path}: {e}")
+            
+    def _positions(self, url: str) -> Iterable[int]:
+        digest = _digest(url, 16)
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.num_bits for i in range(self.num_hashes))
+        
+    def add(self, url: str) -> None:
+        """Add a URL."""
+        bits = self._bits
+        new = False
+        for position in self._positions(url):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        if new:
+            self._len += 1
+            
+    def update(self, urls: Iterable[str]) -> None:
+        """Add several URLs."""
+        for url in urls:
+            self.add(url)
+            
+    def __contains__(self, url: object) -> bool:
+        if not isinstance(url, str):
+            return False
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(url))
+        
+    def __len__(self) -> int:
+        # URLs whose bits were all set already are not counted
+        return self._len
+        
+    def close(self) -> None:
+        """Release the memory-mapped file, if any."""
+        if self._file is not None:
+            self._bits.close()
+            self._file.close()
+            self._file = None
+
+
+VisitedSet = Union[Set[str], FingerprintSet, BloomFilter]
+
+
+def create(kind: str = config.VISITED_SET, spill_path: Optional[Path] = None) -> VisitedSet:
+    """Create an empty visited set of the given kind.
+    
+    ``spill_path`` is only used by the Bloom filter, to keep its bits in a
+    memory-mapped file instead of process memory.
+    """
+    if kind == EXACT:
+        return set()
+    if kind == FINGERPRINT:
+        return FingerprintSet()
+    if kind == BLOOM:
+        return BloomFilter(config.BLOOM_CAPACITY, config.BLOOM_ERROR_RATE, spill_path)
+    raise ValueError(f"Unknown visited set: {kind}")
@@ -0,0 +1,222 @@
+"""Write responses to rolling, gzip-compressed WARC files with a CDXJ index."""
+
+import base64
+import gzip
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional, Set, TextIO, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+
+from . import config
+from .exceptions import FileSystemError
+
+# Headers that describe the transfer rather than the body we store: requests
+# has already removed the content and transfer encodings from the body
+_TRANSFER_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+
+
+def surt(url: str) -> str:
+    """Sort-friendly form of a URL used as the CDX key, e.g. ``com,example)/a?b=1``."""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    key = ','.join(reversed(host.split('.')))
+    if parts.port and parts.port not in (80, 443):
+        key += f':{parts.port}'
+    key += ')' + (parts.path or '/').lower()
+    if parts.query:
+        key += '?' + '&'.join(sorted(parts.query.lower().split('&')))
+    return key
+
+
+def _digest(data: 'hashlib._Hash') -> str:
+    return 'sha1:' + base64.b32encode(data.digest()).decode('ascii')
+
+
+def _http_block(start_line: str, headers: Iterable[Tuple[str, str]]) -> bytes:
+    lines = [start_line] + [f"{name}: {value}" for name, value in headers]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'replace')
+
+
+class WarcWriter:
+    """Append WARC records to ``<prefix>-<timestamp>-<serial>.warc.gz`` files.
+    
+    Every record is its own gzip member, so readers can seek straight to a
+    record using the offset in the index. A new file is started once the
+    current one exceeds ``max_size`` bytes. Bodies are spooled to a
+    temporary file while they download, since the record header needs their
+    length, and then appended under a lock so writes stay sequential.
+    """
+    
+    def __init__(self, directory: Path, prefix: str, max_size: int = config.WARC_MAX_SIZE):
+        """Prepare the writer; the first file is opened on the first record."""
+        self.directory = directory
+        self.prefix = prefix
+        self.max_size = max_size
+        self.records = 0
+        self.files: List[Path] = []
+        self._file: Optional[BinaryIO] = None
+        self._index: Optional[TextIO] = None
+        # URLs with a response in the index, loaded on first use
+        self._urls: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+        self._started = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    
+    @property
+    def index_path(self) -> Path:
+        """Path of the CDXJ index covering all WARC files in the directory."""
+        return self.directory / config.WARC_INDEX_FILENAME
+    
+    def _open_next(self) -> None:
+        """Start a new WARC file beginning with a warcinfo record."""
+        if self._file is not None:
+            self._file.close()
+        path = self.directory / f"{self.prefix}-{self._started}-{len(self.files):05d}.warc.gz"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'ab')
+        self.files.append(path)
+        if self._index is None:
+            self._index = open(self.index_path, 'a', encoding='utf-8')
+        info = b"software: dld-web-tor\r\nformat: WARC File Format 1.1\r\n"
+        self._append([
+            ('WARC-Type', 'warcinfo'),
+            ('WARC-Filename', path.name),
+            ('Content-Type', 'application/warc-fields'),
+        ], [info], len(info))
+    
+    def _append(self, warc_headers: List[Tuple[str, str]], block: List[Union[bytes, BinaryIO]],
+                length: int, block_digest: Optional[str] = None,
+                record_id: Optional[str] = None) -> Tuple[int, int]:
+        """Write one record as a gzip member; returns its offset and compressed length.
+        
+        ``block`` holds the parts of the record body, as bytes or open files,
+        ``length`` bytes in total.
+        """
+        headers = [
+            ('WARC-Record-ID', record_id or f"<urn:uuid:{uuid.uuid4()}>"),
+            ('WARC-Date', datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ] + warc_headers
+        if block_digest:
+            headers.append(('WARC-Block-Digest', block_digest))
+        headers.append(('Content-Length', str(length)))
+        offset = self._file.tell()
+        with gzip.GzipFile(fileobj=self._file, mode='wb') as member:
+            member.write(_http_block('WARC/1.1', headers))
+            for part in block:
+                if isinstance(part, bytes):
+                    member.write(part)
+                else:
+                    shutil.copyfileobj(part, member, config.DOWNLOAD_CHUNK_SIZE)
+            member.write(b'\r\n\r\n')
+        return offset, self._file.tell() - offset
+    
+    def write_response(self, response: requests.Response, chunks: Iterable[bytes]) -> int:
+        """Archive the request and response, reading the body from ``chunks``.
+        
+        The body is stored decoded, so the original ``Content-Encoding`` is
+        kept as ``X-Archive-Orig-Content-Encoding`` and ``Content-Length``
+        is set to the stored length. Returns the number of body bytes.
+        """
+        raw = response.raw
+        version = '1.0' if getattr(raw, 'version', 11) == 10 else '1.1'
+        headers = [
+            (f"X-Archive-Orig-{name}" if name.lower() in _TRANSFER_HEADERS else name, value)
+            for name, value in (raw.headers.items() if raw is not None else response.headers.items())
+        ]
+        payload_digest = hashlib.sha1()
+        with tempfile.SpooledTemporaryFile(max_size=config.WARC_SPOOL_SIZE) as body:
+            for chunk in chunks:
+                body.write(chunk)
+                payload_digest.update(chunk)
+            size = body.tell()
+            body.seek(0)
+            head = _http_block(
+                f"HTTP/{version} {response.status_code} {response.reason}",
+                headers + [('Content-Length', str(size))]
+            )
+            block_digest = hashlib.sha1(head)
+            for chunk in iter(lambda: body.read(config.DOWNLOAD_CHUNK_SIZE), b''):
+                block_digest.update(chunk)
+            body.seek(0)
+            request = response.request
+            parts = urlsplit(request.url)
+            request_block = _http_block(
+                f"{request.method} {request.path_url} HTTP/{version}",
+                [('Host', parts.netloc)] + list(request.headers.items())
+            )
+            response_id = f"<urn:uuid:{uuid.uuid4()}>"
+            try:
+                with self._lock:
+                    if self._file is None or self._file.tell() >= self.max_size:
+                        self._open_next()
+                    offset, length = self._append([
+                        ('WARC-Type', 'response'),
+                        ('WARC-Target-URI', response.url),
+                        ('WARC-Payload-Digest', _digest(payload_digest)),
+                        ('Content-Type', 'application/http;msgtype=response'),
+                    ], [head, body], len(head) + size, _digest(block_digest), response_id)
+                    self._append([
+                        ('WARC-Type', 'request'),
+                        ('WARC-Target-URI', response.url),
+                        ('WARC-Concurrent-To', response_id),
+                        ('Content-Type', 'application/http;msgtype=request'),
+                    ], [request_block], len(request_block))
+                    self.records += 1
+                    self._index.write(self._cdxj_line(response, payload_digest, offset, length))
+                    if self._urls is not None:
+                        self._urls.add(response.url)
+            except OSError as e:
+                raise FileSystemError(f"Error writing WARC record for {response.url}: {e}")
+        return size
+    
+    def has_record(self, url: str) -> bool:
+        """Whether a response for ``url`` was archived in the directory, by this or an earlier run."""
+        with self._lock:
+            if self._urls is None:
+                self._urls = set()
+                try:
+                    if self._index is not None:
+                        self._index.flush()
+                    with open(self.index_path, encoding='utf-8') as index:
+                        for line in index:
+                            self._urls.add(json.loads(line.split(' ', 2)[2])['url'])
+                except FileNotFoundError:
+                    pass
+                except (OSError, ValueError, IndexError, KeyError) as e:
+                    raise FileSystemError(f"Error reading WARC index {self.index_path}: {e}")
+            return url in self._urls
+    
+    def _cdxj_line(self, response: requests.Response, payload_digest: 'hashlib._Hash',
+                   offset: int, length: int) -> str:
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+        fields = {
+            'url': response.url,
+            'mime': response.headers.get('content-type', '').split(';')[0].strip(),
+            'status': str(response.status_code),
+            'digest': _digest(payload_digest)[5:],
+            'length': str(length),
+            'offset': str(offset),
+            'filename': self.files[-1].name,
+        }
+        return f"{surt(response.url)} {timestamp} {json.dumps(fields)}\n"
+    
+    def close(self) -> None:
+        """Close the current file and sort the index so it can be binary searched."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+                lines = self.index_path.read_text(encoding='utf-8').splitlines(keepends=True)
+                self.index_path.write_text(''.join(sorted(lines)), encoding='utf-8')
@@ -0,0 +1,48 @@
+import hashlib
+import os
+
+from download_webpage_data.lib import utils
+from download_webpage_data.lib.blob_store import BlobStore
+
+
+def _no_hardlinks(src, dst):
+    raise OSError("hardlinks not supported")
+
+
+def test_identical_bodies_stored_once(tmp_path):
+    store = BlobStore(tmp_path / '.blobs')
+    utils.save_content(b'same body', tmp_path / 'a.css', store=store)
+    utils.save_content(b'same body', tmp_path / 'b.css', store=store)
+
+    blob = store.blob_path(hashlib.sha256(b'same body').hexdigest())
+    assert os.path.samefile(blob, tmp_path / 'a.css')
+    assert os.path.samefile(blob, tmp_path / 'b.css')
+    assert (store.files, store.unique_bytes, store.saved_bytes) == (2, 9, 9)
+
+
+def test_prune_removes_replaced_bodies(tmp_path):
+    store = BlobStore(tmp_path / '.blobs')
+    utils.save_content(b'old', tmp_path / 'index.html', store=store)
+    utils.save_content(b'shared', tmp_path / 'a.css', store=store)
+    utils.save_content(b'new', tmp_path / 'index.html', store=store)
+
+    assert store.prune() == len(b'old')
+    assert not store.blob_path(hashlib.sha256(b'old').hexdigest()).exists()
+    assert (tmp_path / 'index.html').read_bytes() == b'new'
+    assert (tmp_path / 'a.css').read_bytes() == b'shared'
+    assert store.prune() == 0
+
+
+def test_prune_keeps_copied_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'link', _no_hardlinks)
+    store = BlobStore(tmp_path / '.blobs')
+    utils.save_content(b'body', tmp_path / 'a.css', store=store)
+    utils.save_content(b'body', tmp_path / 'b.css', store=store)
+    monkeypatch.undo()
+
+    assert os.stat(tmp_path / 'a.css').st_nlink == 1
+    assert store.prune() == 0
+    # Also on later runs, which only see the list of copies
+    assert BlobStore(tmp_path / '.blobs').prune() == 0
+    assert store.blob_path(hashlib.sha256(b'body').hexdigest()).exists()
+    assert (tmp_path / 'a.css').read_bytes() == (tmp_path / 'b.css').read_bytes() == b'body'
@@ -0,0 +1,136 @@
+import gzip
+import io
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from download_webpage_data.lib import compression, utils
+from download_webpage_data.lib.crawl_state import CrawlState, Resource, stored_codecs
+from download_webpage_data.lib.downloader import TorDownloader
+from download_webpage_data.lib.image_extractor import ImageExtractor
+
+CODECS = ['gzip', pytest.param('zstd', marks=pytest.mark.skipif(
+    compression.zstandard is None, reason="needs zstandard"))]
+
+
+def test_resolve_codec():
+    assert compression.resolve_codec('none') is None
+    assert compression.resolve_codec('gzip') == 'gzip'
+    with pytest.raises(ValueError):
+        compression.resolve_codec('brotli')
+
+
+def test_should_compress():
+    assert compression.should_compress('text/html; charset=utf-8', Path('a'))
+    assert compression.should_compress('image/svg+xml', Path('a'))
+    assert not compression.should_compress('image/png', Path('a.html'))
+    assert compression.should_compress(None, Path('app.js'))
+    assert not compression.should_compress(None, Path('photo.jpg'))
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip(tmp_path, codec):
+    path = tmp_path / 'site' / 'index.html'
+    body = b'<html>' + b'x' * 10000 + b'</html>'
+    utils.save_content(body, path, codec=codec)
+
+    stored = compression.compressed_path(path, codec)
+    assert stored.is_file() and not path.exists()
+    assert stored.stat().st_size < len(body)
+    assert compression.find_stored(path, codec) == stored
+    assert compression.read_content(path, codec) == body
+
+
+def test_open_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        compression.open_content(tmp_path / 'missing.html', 'gzip')
+
+
+def test_save_keeps_sibling_downloads(tmp_path):
+    # The site serves both; neither is a stored copy of the other
+    archive = gzip.compress(b'<urlset/>')
+    utils.save_content(archive, tmp_path / 'sitemap.xml.gz')
+    utils.save_content(b'<urlset></urlset>', tmp_path / 'sitemap.xml')
+
+    assert (tmp_path / 'sitemap.xml.gz').read_bytes() == archive
+    assert (tmp_path / 'sitemap.xml').read_bytes() == b'<urlset></urlset>'
+    assert compression.find_stored(tmp_path / 'sitemap.xml') == tmp_path / 'sitemap.xml'
+    assert compression.read_content(tmp_path / 'sitemap.xml') == b'<urlset></urlset>'
+    assert compression.find_stored(tmp_path / 'data.json') is None
+
+
+def test_stored_codecs(tmp_path):
+    assert stored_codecs(tmp_path) == {}
+    state = CrawlState(tmp_path)
+    state.save_resource('https://example.com/', Resource(codec='gzip'))
+    state.save_resource('https://example.com/logo.png', Resource())
+    state.close()
+
+    assert stored_codecs(tmp_path) == {'https://example.com/': 'gzip'}
+    # Reopening keeps the codec of each URL
+    state = CrawlState(tmp_path)
+    assert state.get_resource('https://example.com/').codec == 'gzip'
+    state.close()
+
+
+def test_extractor_only_decompresses_recorded_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = tmp_path / 'downloads' / 'example.com'
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"/>'
+    utils.save_content(svg, site / 'img' / 'icon.svg', codec='gzip')
+    # A gzipped SVG the site serves as is; it is not a compressed copy of logo.svg
+    served = gzip.compress(svg)
+    utils.save_content(served, site / 'img' / 'logo.svg.gz')
+    state = CrawlState(site)
+    state.save_resource('https://example.com/img/icon.svg', Resource(codec='gzip'))
+    state.save_resource('https://example.com/img/logo.svg.gz', Resource())
+    state.close()
+
+    extractor = ImageExtractor(base_dir=tmp_path / 'downloads', processes=1)
+    assert extractor.extract_images('example.com') == 1
+
+    images = tmp_path / 'images' / 'example.com'
+    assert (images / 'icon_icon.svg').read_bytes() == svg
+    assert not list(images.glob('logo*'))
+    assert (site / 'img' / 'logo.svg.gz').read_bytes() == served
+
+
+def test_compressed_copy_never_replaces_a_download(tmp_path, monkeypatch):
+    # The site serves app.js and, separately, a gzipped app.js.gz
+    script = b'console.log(1);' * 100
+    served = gzip.compress(b'something else')
+    bodies = {
+        'https://example.com/app.js': (script, 'application/javascript'),
+        'https://example.com/app.js.gz': (served, 'application/gzip'),
+    }
+
+    def get(url, **kwargs):
+        body, content_type = bodies[url]
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = content_type
+        response.raw = io.BytesIO(body)
+        response.url = url
+        return response
+
+    downloader = TorDownloader(workers=1, compress='gzip')
+    for circuit in downloader.circuits.circuits:
+        monkeypatch.setattr(circuit.session, 'get', get)
+    site = SimpleNamespace(output_dir=tmp_path, base_url='https://example.com', domain='example.com',
+                           warc=None, blob_store=None)
+
+    downloader._download_page(site, 'https://example.com/app.js.gz')
+    stored = downloader._download_page(site, 'https://example.com/app.js').resource
+    assert stored.codec == 'gzip'
+    assert (tmp_path / 'app.js.gz').read_bytes() == served
+    assert compression.read_content(tmp_path / 'app.js', 'gzip') == script
+
+    # Stored plain again; only the compressed copy of app.js is removed
+    downloader.codec = None
+    downloader._download_page(site, 'https://example.com/app.js', stored=stored)
+    downloader.close()
+    assert (tmp_path / 'app.js').read_bytes() == script
+    assert compression.find_stored(tmp_path / 'app.js', 'gzip') is None
+    assert (tmp_path / 'app.js.gz').read_bytes() == served
@@ -0,0 +1,82 @@
+from download_webpage_data.lib import config
+from download_webpage_data.lib.crawl_state import (
+    DONE, FAILED, IN_PROGRESS, CrawlState, Resource
+)
+
+
+def _crawl(tmp_path):
+    state = CrawlState(tmp_path)
+    state.add_pending(['https://example.com/'])
+    state.mark('https://example.com/', IN_PROGRESS)
+    state.add_pending(['https://example.com/a', 'https://example.com/b'], depth=1)
+    state.mark('https://example.com/', DONE)
+    state.mark('https://example.com/a', IN_PROGRESS)
+    state.add_pending(['https://example.com/a/c'], depth=2)
+    state.mark('https://example.com/b', IN_PROGRESS)
+    state.mark('https://example.com/b', FAILED)
+    return state
+
+
+def test_resume(tmp_path):
+    _crawl(tmp_path).close()
+
+    state = CrawlState(tmp_path, resume=True)
+    visited = set()
+    # The download in progress when the run stopped is pending again
+    assert state.load(visited) == {'https://example.com/a': 1, 'https://example.com/a/c': 2}
+    assert visited == {'https://example.com/', 'https://example.com/b'}
+    state.close()
+
+
+def test_fresh_crawl_clears_urls_but_keeps_resources(tmp_path):
+    state = _crawl(tmp_path)
+    state.save_resource('https://example.com/', Resource('"v1"', outlinks=['https://example.com/a']))
+    state.close()
+
+    state = CrawlState(tmp_path)
+    visited = set()
+    assert state.load(visited) == {}
+    assert not visited
+    assert state.get_resource('https://example.com/') == Resource('"v1"', outlinks=['https://example.com/a'])
+    assert state.get_resource('https://example.com/a') is None
+    state.close()
+
+
+def test_changes_are_buffered_until_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'STATE_CHECKPOINT_INTERVAL', 3600)
+    state = _crawl(tmp_path)
+    reader = CrawlState(tmp_path, resume=True)
+    assert reader.load(set()) == {}
+    reader.close()
+
+    state.checkpoint()
+    reader = CrawlState(tmp_path, resume=True)
+    assert reader.load(set()) == {'https://example.com/a': 1, 'https://example.com/a/c': 2}
+    reader.close()
+    state.close()
+
+
+def test_checkpoint_after_batch_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'STATE_CHECKPOINT_INTERVAL', 3600)
+    monkeypatch.setattr(config, 'STATE_CHECKPOINT_SIZE', 3)
+    state = CrawlState(tmp_path)
+    state.add_pending(['https://example.com/1', 'https://example.com/2'])
+    state.save_resource('https://example.com/0', Resource(fetched=1.0))
+
+    reader = CrawlState(tmp_path, resume=True)
+    assert reader.load(set()) == {'https://example.com/1': 0, 'https://example.com/2': 0}
+    assert reader.get_resource('https://example.com/0') == Resource(fetched=1.0)
+    reader.close()
+    state.close()
+
+
+def test_depth_kept_on_status_change(tmp_path):
+    state = CrawlState(tmp_path)
+    state.add_pending(['https://example.com/x'], depth=3)
+    state.checkpoint()
+    state.mark('https://example.com/x', IN_PROGRESS)
+    state.close()
+
+    state = CrawlState(tmp_path, resume=True)
+    assert state.load(set()) == {'https://example.com/x': 3}
+    state.close()
@@ -0,0 +1,259 @@
+import io
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from download_webpage_data.lib import downloader as downloader_module
+from download_webpage_data.lib.crawl_state import CrawlState, Resource
+from download_webpage_data.lib.downloader import PageResult, TorDownloader
+from download_webpage_data.lib.exceptions import DownloadInterrupted
+from download_webpage_data.lib.link_extractor import PageLinks
+from download_webpage_data.lib.warc import WarcWriter
+
+
+def _response(url: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.request = requests.Request('GET', url).prepare()
+    return response
+
+
+class _FakeController:
+    """Stands in for a stem controller connected to Tor."""
+
+    def __init__(self):
+        self.signals = 0
+        self.closed = False
+
+    def is_alive(self):
+        return not self.closed
+
+    def is_newnym_available(self):
+        return True
+
+    def signal(self, signal):
+        self.signals += 1
+
+    def close(self):
+        self.closed = True
+
+
+class _Executor:
+    """Takes submitted downloads without running them."""
+
+    def __init__(self):
+        self.urls = []
+
+    def submit(self, fn, site, url, *args):
+        self.urls.append(url)
+        return Future()
+
+
+def test_close_releases_metrics_and_control_port(tmp_path):
+    downloader = TorDownloader(workers=1, metrics_log=tmp_path / 'metrics.jsonl', metrics_port=0)
+    controller = _FakeController()
+    downloader.tor_control._controller = controller
+    assert downloader.tor_control.controller is controller
+    downloader._start_metrics_server()
+    address = downloader._metrics_server.address
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    with opener.open(address, timeout=5) as response:
+        assert response.status == 200
+
+    downloader.close()
+    assert downloader._metrics_server is None
+    assert controller.closed
+    assert downloader.tor_control._controller is None
+    with pytest.raises(urllib.error.URLError):
+        opener.open(address, timeout=5)
+    # Events after closing are no longer written
+    downloader.metrics.log('page', url='https://example.com/')
+    assert (tmp_path / 'metrics.jsonl').read_text(encoding='utf-8') == ''
+    # Closing twice is harmless
+    downloader.close()
+
+
+def test_urls_without_host_are_rejected(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = TorDownloader(workers=1)
+    results = downloader.download_websites(['example.com/page', 'http:///index.html', 'mailto:a@example.com'])
+    downloader.close()
+
+    assert results == {'example.com/page': False, 'http:///index.html': False, 'mailto:a@example.com': False}
+    assert not (tmp_path / 'downloads').exists()
+
+
+def test_interrupt_keeps_crawl_state_for_resume(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = TorDownloader(workers=1, warm_up=False)
+
+    def interrupt(*args):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(downloader, '_dispatch', interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        downloader.download_websites(['https://example.com/'])
+    downloader.close()
+
+    state = CrawlState(tmp_path / 'downloads' / 'example.com', resume=True)
+    assert state.load(set()) == {'https://example.com/': 0}
+    state.close()
+
+
+def test_interrupted_download_stops_between_chunks(tmp_path):
+    downloader = TorDownloader(workers=1)
+    chunks = iter([b'a' * 10, b'b' * 10, b'c' * 10])
+    stream = downloader._until_stopped('https://example.com/file.bin', chunks)
+    assert next(stream) == b'a' * 10
+    downloader._stopping.set()
+    with pytest.raises(DownloadInterrupted):
+        next(stream)
+    # Nothing more is requested either
+    with pytest.raises(DownloadInterrupted):
+        downloader._fetch('https://example.com/sitemap.xml')
+    downloader.close()
+
+
+def _stop_soon(downloader, download):
+    """Run ``download`` in a worker, interrupt the crawl and return how long it took to stop."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(download)
+        time.sleep(0.2)
+        started = time.monotonic()
+        downloader._stopping.set()
+        with pytest.raises(DownloadInterrupted):
+            future.result(timeout=5)
+    return time.monotonic() - started
+
+
+def test_interrupt_stops_waiting_for_the_rate_limiter(monkeypatch):
+    downloader = TorDownloader(workers=1)
+    requested = []
+    for circuit in downloader.circuits.circuits:
+        monkeypatch.setattr(circuit.session, 'get', lambda url, **kwargs: requested.append(url))
+    # The host asked for a pause with Retry-After
+    downloader.rate_limiter.record_throttle('example.com', 30)
+    site = SimpleNamespace(base_url='https://example.com', warc=None, blob_store=None)
+
+    assert _stop_soon(downloader, lambda: downloader._download_with_retry(
+        site, 'https://example.com/a', Path('unused'))) < 1
+    assert requested == []
+    downloader.close()
+
+
+def test_interrupt_stops_retry_backoff(monkeypatch):
+    downloader = TorDownloader(workers=1)
+
+    def refuse(url, **kwargs):
+        raise requests.exceptions.ConnectionError("connection refused")
+    for circuit in downloader.circuits.circuits:
+        monkeypatch.setattr(circuit.session, 'get', refuse)
+    monkeypatch.setattr(downloader_module, 'backoff_delay', lambda attempt: 30)
+    site = SimpleNamespace(base_url='https://example.com', warc=None, blob_store=None)
+
+    assert _stop_soon(downloader, lambda: downloader._download_with_retry(
+        site, 'https://example.com/a', Path('unused'))) < 1
+    downloader.close()
+
+
+def test_interrupt_stops_waiting_for_a_new_circuit():
+    downloader = TorDownloader(workers=1)
+    downloader.tor_control._controller = _FakeController()
+    downloader._stopping.set()
+
+    started = time.monotonic()
+    downloader.new_tor_identity()
+    # NEWNYM is sent, but nobody waits for its circuit
+    assert downloader.tor_control._controller.signals == 1
+    assert time.monotonic() - started < 1
+    downloader.close()
+
+
+def test_warm_up_is_rate_limited_and_counted(monkeypatch, capsys):
+    downloader = TorDownloader(workers=4, circuits=2, pool_size=2)
+    acquired = []
+    monkeypatch.setattr(downloader.rate_limiter, 'acquire', lambda host, stop=None: acquired.append(host))
+    for circuit in downloader.circuits.circuits:
+        opened = []
+
+        def head(*args, opened=opened, **kwargs):
+            # The second request of a circuit reuses the first one's connection
+            if not opened:
+                opened.append(True)
+                downloader.connection_stats.record_handshake(0.1)
+            response = requests.Response()
+            response.status_code = 200
+            response.raw = io.BytesIO()
+            return response
+        monkeypatch.setattr(circuit.session, 'head', head)
+
+    downloader._warm_up_connections('https://example.com')
+    downloader.close()
+
+    assert acquired == ['example.com'] * 4
+    assert downloader.metrics.snapshot()['requests_total'] == {'status=200': 4}
+    assert 'Warmed up 2 connections with 4/4 requests' in capsys.readouterr().out
+
+
+def test_urls_saved_to_the_same_file_are_downloaded_one_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = TorDownloader(workers=2)
+    urls = ['https://example.com/page?x=1', 'https://example.com/page?x=2']
+    site = downloader._open_site(urls, resume=False, announce=False)
+    executor, in_flight = _Executor(), {}
+
+    downloader._dispatch(executor, None, [site], in_flight, incremental=False)
+    # Both map to page/index.html, so the second waits for the first
+    assert len(executor.urls) == 1
+    assert not site.done
+    future, (_, url, depth) = in_flight.popitem()
+    future.set_result(PageResult(PageLinks(set()), Resource()))
+    downloader._handle_page(site, url, depth, future)
+
+    downloader._dispatch(executor, None, [site], in_flight, incremental=False)
+    assert sorted(executor.urls) == urls
+    site.close()
+    downloader.close()
+
+
+def test_incremental_warc_crawl_only_revalidates_archived_urls(tmp_path):
+    downloader = TorDownloader(workers=1, output_format='warc')
+    site = SimpleNamespace(warc=WarcWriter(tmp_path / 'warc', 'example.com'))
+    previous = Resource('"v1"')
+    site.warc.write_response(_response('https://example.com/a'), [b'a'])
+
+    assert downloader._conditional_headers(site, 'https://example.com/a', tmp_path / 'a', previous) == {
+        'If-None-Match': '"v1"'
+    }
+    # Saved as a file by an earlier crawl, so not archived yet
+    assert downloader._conditional_headers(site, 'https://example.com/b', tmp_path / 'b', previous) == {}
+    site.warc.close()
+    downloader.close()
+
+
+@pytest.mark.parametrize('status', [500, 502, 504])
+def test_transient_server_errors_are_retried(monkeypatch, tmp_path, status):
+    downloader = TorDownloader(workers=1)
+    statuses = [status, 200]
+
+    def get(url, **kwargs):
+        response = _response(url)
+        response.status_code = statuses.pop(0)
+        response.raw = io.BytesIO(b'body')
+        return response
+    for circuit in downloader.circuits.circuits:
+        monkeypatch.setattr(circuit.session, 'get', get)
+    monkeypatch.setattr(downloader_module, 'backoff_delay', lambda attempt: 0)
+    site = SimpleNamespace(base_url='https://example.com', warc=None, blob_store=None)
+
+    response, nbytes = downloader._download_with_retry(site, 'https://example.com/a.bin', tmp_path / 'a.bin')
+    downloader.close()
+    assert (response.status_code, nbytes) == (200, 4)
+    assert (tmp_path / 'a.bin').read_bytes() == b'body'
+    assert downloader.metrics.snapshot()['retries_total'] == {'reason=server_error': 1}
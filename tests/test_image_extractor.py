@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from download_webpage_data.lib import export
+from download_webpage_data.lib.image_extractor import ImageExtractor
+
+
+def _write_in_place(path, data: bytes):
+    # Keeps the inode, so hardlinked exports see the new contents
+    with open(path, 'r+b') as f:
+        f.write(data)
+        f.truncate()
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = tmp_path / 'downloads' / 'example.com'
+    for name, data in (('a', b'logo a'), ('b', b'logo b')):
+        (site / name).mkdir(parents=True)
+        (site / name / 'logo.png').write_bytes(data)
+    return site
+
+
+def _exports(tmp_path):
+    images = tmp_path / 'images' / 'example.com'
+    return {entry.name: entry.read_bytes() for entry in images.iterdir() if not entry.name.startswith('.')}
+
+
+@pytest.mark.parametrize('mode', [export.COPY, export.HARDLINK])
+def test_changed_image_replaces_its_export(tmp_path, site, mode):
+    extractor = ImageExtractor(base_dir=tmp_path / 'downloads', processes=1, mode=mode)
+    assert extractor.extract_images('example.com') == 2
+    before = _exports(tmp_path)
+    assert sorted(before.values()) == [b'logo a', b'logo b']
+
+    _write_in_place(site / 'b' / 'logo.png', b'logo b, version 2')
+    assert extractor.extract_images('example.com') == 1
+
+    after = _exports(tmp_path)
+    assert sorted(after.values()) == [b'logo a', b'logo b, version 2']
+    # The export named after the old contents is gone
+    old = next(name for name, data in before.items() if data == b'logo b')
+    assert old not in after
+
+
+def test_shared_export_linked_to_changed_image_is_refreshed(tmp_path, site):
+    (site / 'b' / 'logo.png').write_bytes(b'logo a')
+    extractor = ImageExtractor(base_dir=tmp_path / 'downloads', processes=1, mode=export.HARDLINK)
+    assert extractor.extract_images('example.com') == 1
+    (dest,) = _exports(tmp_path)
+    assert os.path.samefile(tmp_path / 'images' / 'example.com' / dest, site / 'a' / 'logo.png')
+
+    # b/logo.png still has the contents the shared export stands for
+    _write_in_place(site / 'a' / 'logo.png', b'logo a, version 2')
+    extractor.extract_images('example.com')
+
+    after = _exports(tmp_path)
+    assert after[dest] == b'logo a'
+    assert sorted(after.values()) == [b'logo a', b'logo a, version 2']
+
+
+def test_unchanged_images_are_skipped(tmp_path, site):
+    extractor = ImageExtractor(base_dir=tmp_path / 'downloads', processes=1)
+    assert extractor.extract_images('example.com') == 2
+    assert extractor.extract_images('example.com') == 0
+    assert len(_exports(tmp_path)) == 2
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+
+from download_webpage_data.lib import link_extractor
+
+CORPUS = sorted((Path(__file__).parent / 'corpus').glob('*.html'))
+PAGE_URL = 'https://example.com/dir/page.html'
+
+BACKENDS = [
+    pytest.param(name, marks=pytest.mark.skipif(
+        name == 'lxml' and link_extractor.lxml is None, reason="needs lxml"))
+    for name in link_extractor.BACKENDS
+]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('page', CORPUS, ids=lambda path: path.name)
+def test_backends_match_html_parser(page, backend):
+    content = page.read_bytes()
+    text = content.decode('utf-8', 'replace')
+    assert link_extractor.BACKENDS[backend](text) == link_extractor.extract_with_html_parser(text)
+    assert (link_extractor.parse_page(content, None, PAGE_URL, 'example.com', backend) ==
+            link_extractor.parse_page(content, None, PAGE_URL, 'example.com', link_extractor.FALLBACK))
+
+
+def _urls(name: str):
+    content = (Path(__file__).parent / 'corpus' / name).read_bytes()
+    return link_extractor.parse_page(content, None, PAGE_URL, 'example.com').urls
+
+
+def test_duplicate_attributes_keep_first_value():
+    assert _urls('duplicate_attributes.html') == {
+        'https://example.com/first',
+        'https://example.com/a.png',
+        'https://example.com/x.png',
+        'https://example.com/y.png',
+        'https://example.com/one.css',
+    }
+
+
+def test_entities():
+    assert _urls('entities.html') == {
+        'https://example.com/search?page=2&q=a',
+        'https://example.com/café.html',
+        'https://example.com/café//x.html',
+        'https://example.com/naïve/日本語.html',
+        'https://example.com/percent%20encoded.html',
+        'https://example.com/a<b>.html',
+        'https://example.com/padded.html',
+        'https://example.com/s1.png',
+        'https://example.com/s2.png',
+        'https://example.com/s3.png',
+    }
+
+
+def test_encoding_detected_without_charset_header():
+    assert _urls('latin1.html') == {
+        'https://example.com/münchen.html',
+        'https://example.com/straße/café.html',
+        'https://example.com/bücher.png',
+    }
+
+
+def test_malformed_markup():
+    urls = _urls('malformed.html')
+    assert 'https://example.com/commented.html' not in urls
+    assert 'https://example.com/in-script.png' not in urls
+    assert {
+        'https://example.com/unclosed',
+        'https://example.com/unquoted.html',
+        'https://example.com/UPPER.html',
+        'https://example.com/misnested.html',
+        'https://example.com/video.webm',
+    } <= urls
+
+
+def test_fallback_on_parser_errors():
+    # lxml rejects an encoding declaration in str input
+    content = '<?xml version="1.0" encoding="utf-8"?><html><a href="/x">x</a></html>'
+    for backend in link_extractor.BACKENDS:
+        if backend != 'lxml' or link_extractor.lxml is not None:
+            assert link_extractor.extract_links(content, backend) == ['/x']
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        link_extractor.resolve_backend('regex')
@@ -0,0 +1,142 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from download_webpage_data.lib import utils
+from download_webpage_data.lib.downloader import TorDownloader
+from download_webpage_data.lib.exceptions import DownloadError
+
+BODY = bytes(range(256)) * 64
+URL = 'https://example.com/file.bin'
+
+
+def _interrupted(data: bytes, after: int):
+    yield data[:after]
+    raise requests.exceptions.ConnectionError("connection dropped")
+
+
+def _response(status: int, body: bytes, **headers) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update({'Content-Type': 'application/octet-stream', **headers})
+    response.raw = io.BytesIO(body)
+    response.url = URL
+    return response
+
+
+@pytest.fixture
+def downloader():
+    return TorDownloader(workers=1)
+
+
+@pytest.fixture
+def site():
+    return SimpleNamespace(warc=None, blob_store=None)
+
+
+def test_save_stream_keeps_partial_for_resume(tmp_path):
+    path = tmp_path / 'file.bin'
+    with pytest.raises(requests.exceptions.ConnectionError):
+        utils.save_stream(_interrupted(BODY, 1000), path, keep_partial=True)
+    assert not path.exists()
+    assert utils.get_partial_size(path) == 1000
+
+    utils.save_partial_validator(path, URL, '"v1"')
+    assert utils.save_stream([BODY[1000:]], path, append=True) == len(BODY) - 1000
+    assert path.read_bytes() == BODY
+    assert utils.get_partial_size(path) == 0
+    assert utils.load_partial_validator(path, URL) is None
+
+
+def test_save_stream_drops_partial_by_default(tmp_path):
+    path = tmp_path / 'file.bin'
+    with pytest.raises(requests.exceptions.ConnectionError):
+        utils.save_stream(_interrupted(BODY, 1000), path)
+    assert not utils.get_partial_path(path).exists()
+
+
+def test_resume_headers(downloader, tmp_path):
+    path = tmp_path / 'file.bin'
+    assert downloader._resume_headers(URL, path) == {}
+
+    utils.get_partial_path(path).write_bytes(BODY[:100])
+    # Without a validator the partial file can't be resumed safely
+    assert downloader._resume_headers(URL, path) == {}
+    assert not utils.get_partial_path(path).exists()
+
+    utils.get_partial_path(path).write_bytes(BODY[:100])
+    utils.save_partial_validator(path, URL, '"v1"')
+    assert downloader._resume_headers(URL, path) == {
+        'Range': 'bytes=100-',
+        'If-Range': '"v1"',
+        'Accept-Encoding': 'identity',
+    }
+
+
+def test_partial_of_another_url_is_not_resumed(downloader, tmp_path):
+    # /file.bin?v=2 is saved to the same file as /file.bin
+    path = tmp_path / 'file.bin'
+    utils.get_partial_path(path).write_bytes(BODY[:100])
+    utils.save_partial_validator(path, URL, '"v1"')
+
+    assert downloader._resume_headers(URL + '?v=2', path) == {}
+    assert not utils.get_partial_path(path).exists()
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}, '"v1"'),
+    ({'ETag': 'W/"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'},
+     'Mon, 01 Jan 2024 00:00:00 GMT'),
+    ({'ETag': '"v1"', 'Content-Encoding': 'gzip'}, None),
+    ({}, None),
+])
+def test_resume_validator(downloader, headers, expected):
+    assert downloader._resume_validator(_response(200, b'', **headers)) == expected
+
+
+def test_save_body_continues_partial_file(downloader, site, tmp_path):
+    path = tmp_path / 'file.bin'
+    utils.get_partial_path(path).write_bytes(BODY[:1000])
+    utils.save_partial_validator(path, URL, '"v1"')
+    response = _response(206, BODY[1000:], ETag='"v1"',
+                         **{'Content-Range': f'bytes 1000-{len(BODY) - 1}/{len(BODY)}'})
+
+    assert downloader._save_body(site, URL, response, path) == len(BODY) - 1000
+    assert path.read_bytes() == BODY
+    assert utils.load_partial_validator(path, URL) is None
+
+
+def test_save_body_rejects_misaligned_range(downloader, site, tmp_path):
+    path = tmp_path / 'file.bin'
+    utils.get_partial_path(path).write_bytes(BODY[:1000])
+    utils.save_partial_validator(path, URL, '"v1"')
+    response = _response(206, BODY[500:], **{'Content-Range': f'bytes 500-{len(BODY) - 1}/{len(BODY)}'})
+
+    with pytest.raises(DownloadError):
+        downloader._save_body(site, URL, response, path)
+    assert not utils.get_partial_path(path).exists()
+    assert not path.exists()
+
+
+def test_save_body_full_response_replaces_partial(downloader, site, tmp_path):
+    # The resource changed, so If-Range made the server send all of it
+    path = tmp_path / 'file.bin'
+    utils.get_partial_path(path).write_bytes(b'stale' * 100)
+    utils.save_partial_validator(path, URL, '"v1"')
+    response = _response(200, BODY, ETag='"v2"')
+
+    assert downloader._save_body(site, URL, response, path) == len(BODY)
+    assert path.read_bytes() == BODY
+
+
+def test_save_body_keeps_validator_of_interrupted_download(downloader, site, tmp_path):
+    path = tmp_path / 'file.bin'
+    response = _response(200, BODY, ETag='"v1"')
+    response.iter_content = lambda chunk_size: _interrupted(BODY, 1000)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        downloader._save_body(site, URL, response, path)
+    assert utils.get_partial_size(path) == 1000
+    assert downloader._resume_headers(URL, path)['If-Range'] == '"v1"'
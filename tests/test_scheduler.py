@@ -0,0 +1,79 @@
+import pytest
+
+from download_webpage_data.lib.scheduler import ASSET, MEDIA, OTHER, PAGE, CrawlScheduler, content_class
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://example.com/', PAGE),
+    ('https://example.com/about', PAGE),
+    ('https://example.com/index.PHP?x=1', PAGE),
+    ('https://example.com/app.js', ASSET),
+    ('https://example.com/style.css', ASSET),
+    ('https://example.com/movie.mp4', MEDIA),
+    ('https://example.com/logo.png', ASSET),
+    ('https://example.com/report.pdf', OTHER),
+])
+def test_content_class(url, expected):
+    assert content_class(url) == expected
+
+
+def test_order():
+    scheduler = CrawlScheduler()
+    scheduler.push('https://example.com/video.mp4', 0)
+    scheduler.push('https://example.com/a/deep', 2)
+    scheduler.push('https://example.com/report.pdf', 1)
+    scheduler.push('https://example.com/app.js', 1)
+    scheduler.push('https://example.com/page-b', 1)
+    scheduler.push('https://example.com/page-a', 1)
+
+    order = [scheduler.pop().url for _ in range(len(scheduler))]
+    assert order == [
+        'https://example.com/page-b',
+        'https://example.com/page-a',
+        'https://example.com/app.js',
+        'https://example.com/report.pdf',
+        'https://example.com/a/deep',
+        # Large media waits until everything else is done
+        'https://example.com/video.mp4',
+    ]
+
+
+def test_push_skips_queued_and_too_deep_urls():
+    scheduler = CrawlScheduler(max_depth=1)
+    assert scheduler.push('https://example.com/', 0)
+    assert not scheduler.push('https://example.com/', 1)
+    assert not scheduler.push('https://example.com/deep', 2)
+    assert 'https://example.com/' in scheduler
+    assert len(scheduler) == 1
+
+    queued = scheduler.pop()
+    assert (queued.url, queued.depth) == ('https://example.com/', 0)
+    assert queued.waited >= 0
+    assert 'https://example.com/' not in scheduler
+    # Popped URLs may be queued again; the crawler's visited set stops repeats
+    assert scheduler.push('https://example.com/', 1)
+
+
+def test_page_budget():
+    scheduler = CrawlScheduler(max_pages=2)
+    assert not scheduler.exhausted
+    scheduler.record_page()
+    assert not scheduler.exhausted
+    scheduler.record_page()
+    assert scheduler.exhausted
+
+
+def test_byte_budget():
+    scheduler = CrawlScheduler(max_bytes=1000)
+    scheduler.record_bytes(999)
+    assert not scheduler.exhausted
+    scheduler.record_bytes(1)
+    assert scheduler.exhausted
+
+
+def test_unlimited_by_default():
+    scheduler = CrawlScheduler()
+    for _ in range(1000):
+        scheduler.record_page()
+    scheduler.record_bytes(10 ** 12)
+    assert not scheduler.exhausted
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+import gzip
+import io
+
+import pytest
+
+from download_webpage_data.lib import config, sitemaps
+
+
+def _read(body: bytes):
+    return list(sitemaps.iter_sitemap(sitemaps.open_sitemap(io.BytesIO(body))))
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-05-01T10:20:30Z', datetime(2024, 5, 1, 10, 20, 30, tzinfo=timezone.utc)),
+    ('2024-05-01T10:20:30.123+02:00', datetime(2024, 5, 1, 8, 20, 30, tzinfo=timezone.utc)),
+    ('2024-05-01T10:20-0130', datetime(2024, 5, 1, 11, 50, tzinfo=timezone.utc)),
+    ('  2024-05-01T10:20:30Z\n', datetime(2024, 5, 1, 10, 20, 30, tzinfo=timezone.utc)),
+    # A date alone counts until the end of the day
+    ('2024-05-01', datetime(2024, 5, 2, tzinfo=timezone.utc)),
+])
+def test_parse_lastmod(value, expected):
+    assert sitemaps.parse_lastmod(value) == expected.timestamp()
+
+
+@pytest.mark.parametrize('value', [None, '', 'yesterday', '2024-13-01', '2024-02-30', '01/05/2024'])
+def test_parse_lastmod_invalid(value):
+    assert sitemaps.parse_lastmod(value) is None
+
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url><loc> https://example.com/a </loc><lastmod>2024-05-01</lastmod></url>
+  <url>
+    <loc>https://example.com/b</loc>
+    <image:image><image:loc>https://example.com/b.png</image:loc></image:image>
+  </url>
+  <url><lastmod>2024-05-01</lastmod></url>
+</urlset>
+"""
+
+
+def test_iter_sitemap():
+    assert _read(URLSET) == [
+        (False, 'https://example.com/a', '2024-05-01'),
+        (False, 'https://example.com/b', None),
+    ]
+
+
+def test_iter_sitemap_index():
+    body = b"""<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+      <sitemap><loc>https://example.com/s1.xml.gz</loc><lastmod>2024-05-01</lastmod></sitemap>
+    </sitemapindex>"""
+    assert _read(body) == [(True, 'https://example.com/s1.xml.gz', '2024-05-01')]
+
+
+def test_iter_sitemap_gzipped():
+    assert _read(gzip.compress(URLSET)) == _read(URLSET)
+
+
+def test_iter_sitemap_text():
+    body = b'\xef\xbb\xbfhttps://example.com/a\r\n\nhttps://example.com/b\n'
+    assert _read(body) == [
+        (False, 'https://example.com/a', None),
+        (False, 'https://example.com/b', None),
+    ]
+
+
+def test_sitemap_size_limit(monkeypatch):
+    monkeypatch.setattr(config, 'SITEMAP_MAX_BYTES', 100)
+    with pytest.raises(ValueError):
+        _read(URLSET)
+
+
+def test_robots_sitemaps():
+    text = "User-agent: *\nDisallow: /x\nSitemap: https://example.com/s.xml # main\nsitemap:\nSITEMAP: /other.xml\n"
+    assert sitemaps.robots_sitemaps(text) == ['https://example.com/s.xml', '/other.xml']
@@ -0,0 +1,44 @@
+import pytest
+
+from download_webpage_data.lib.utils import canonicalize_url
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTP://Example.COM/a', 'http://example.com/a'),
+    ('http://example.com:80/a', 'http://example.com/a'),
+    ('https://example.com:443/a', 'https://example.com/a'),
+    ('https://example.com:8443/a', 'https://example.com:8443/a'),
+    ('http://example.com', 'http://example.com/'),
+    ('http://example.com/a#section', 'http://example.com/a'),
+    ('http://example.com/a/./b/../c', 'http://example.com/a/c'),
+    ('http://example.com/../../a', 'http://example.com/a'),
+    ('http://example.com/a/b/..', 'http://example.com/a/'),
+    ('http://example.com/%7Euser/%41', 'http://example.com/~user/A'),
+    ('http://example.com/a%2fb%c3%a9', 'http://example.com/a%2Fb%C3%A9'),
+    ('http://example.com/?b=2&a=1&&c', 'http://example.com/?a=1&b=2&c'),
+    ('http://user:pw@Example.com/', 'http://user:pw@example.com/'),
+    ('http://[::1]:8080/a', 'http://[::1]:8080/a'),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_spellings_compare_equal():
+    spellings = [
+        'http://example.com/a/b?y=2&x=1',
+        'HTTP://EXAMPLE.com:80/a/./b?x=1&y=2#top',
+        'http://example.com/a/c/../b?x=1&y=2',
+        'http://example.com/%61/b?x=1&y=2',
+    ]
+    assert {canonicalize_url(url) for url in spellings} == {'http://example.com/a/b?x=1&y=2'}
+
+
+def test_strip_tracking():
+    url = 'http://example.com/p?utm_source=x&UTM_Medium=y&fbclid=1&id=7&ref=home'
+    assert canonicalize_url(url) == 'http://example.com/p?UTM_Medium=y&fbclid=1&id=7&ref=home&utm_source=x'
+    assert canonicalize_url(url, strip_tracking=True) == 'http://example.com/p?id=7&ref=home'
+
+
+def test_invalid_port():
+    with pytest.raises(ValueError):
+        canonicalize_url('http://example.com:99999/')
@@ -0,0 +1,134 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import zlib
+
+import pytest
+import requests
+from urllib3 import HTTPResponse
+
+from download_webpage_data.lib.warc import WarcWriter, surt
+
+
+def _response(url: str, body: bytes, **headers) -> requests.Response:
+    response = requests.Response()
+    response.raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=200,
+                                version=11, preload_content=False)
+    response.status_code = 200
+    response.reason = 'OK'
+    response.headers.update(headers)
+    response.url = url
+    response.request = requests.Request('GET', url, headers={'User-Agent': 'test'}).prepare()
+    return response
+
+
+def _record(path, offset: int, length: int):
+    """Return the WARC headers and block of the record at ``offset``."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        # Only the first gzip member, as a reader seeking to the record would
+        data = zlib.decompressobj(wbits=31).decompress(f.read(length))
+    head, _, block = data.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    assert lines[0] == 'WARC/1.1'
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    assert block.endswith(b'\r\n\r\n')
+    block = block[:-4]
+    assert int(headers['Content-Length']) == len(block)
+    return headers, block
+
+
+def _index(writer):
+    return [line.split(' ', 2) for line in writer.index_path.read_text(encoding='utf-8').splitlines()]
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.Example.com/A/b?z=1&a=2', 'com,example)/a/b?a=2&z=1'),
+    ('http://example.com', 'com,example)/'),
+    ('http://example.com:8080/x', 'com,example:8080)/x'),
+    ('https://sub.example.co.uk:443/', 'uk,co,example,sub)/'),
+])
+def test_surt(url, expected):
+    assert surt(url) == expected
+
+
+def test_response_records_and_index(tmp_path):
+    writer = WarcWriter(tmp_path, 'example.com')
+    body = b'<html>hello</html>'
+    assert writer.write_response(
+        _response('https://example.com/b', body, **{'Content-Type': 'text/html; charset=utf-8',
+                                                     'Content-Encoding': 'gzip',
+                                                     'Content-Length': '5'}),
+        [body[:6], body[6:]]
+    ) == len(body)
+    writer.write_response(_response('https://example.com/a', b'body {}', **{'Content-Type': 'text/css'}),
+                          [b'body {}'])
+    writer.close()
+
+    assert writer.records == 2
+    assert len(writer.files) == 1
+    index = _index(writer)
+    # Sorted by key, so the later /a comes first
+    assert [key for key, _, _ in index] == ['com,example)/a', 'com,example)/b']
+    fields = json.loads(index[1][2])
+    payload_digest = base64.b32encode(hashlib.sha1(body).digest()).decode('ascii')
+    assert fields['url'] == 'https://example.com/b'
+    assert fields['mime'] == 'text/html'
+    assert fields['status'] == '200'
+    assert fields['digest'] == payload_digest
+    assert fields['filename'] == writer.files[0].name
+
+    headers, block = _record(writer.files[0], int(fields['offset']), int(fields['length']))
+    assert headers['WARC-Type'] == 'response'
+    assert headers['WARC-Target-URI'] == 'https://example.com/b'
+    assert headers['WARC-Payload-Digest'] == f'sha1:{payload_digest}'
+    assert headers['WARC-Block-Digest'] == 'sha1:' + base64.b32encode(hashlib.sha1(block).digest()).decode('ascii')
+    http_head, _, payload = block.partition(b'\r\n\r\n')
+    assert payload == body
+    http_lines = http_head.decode('latin-1').split('\r\n')
+    assert http_lines[0] == 'HTTP/1.1 200 OK'
+    assert 'X-Archive-Orig-Content-Encoding: gzip' in http_lines
+    assert 'X-Archive-Orig-Content-Length: 5' in http_lines
+    assert f'Content-Length: {len(body)}' in http_lines
+
+    # The request record follows its response
+    offset = int(fields['offset']) + int(fields['length'])
+    with open(writer.files[0], 'rb') as f:
+        f.seek(offset)
+        request = gzip.GzipFile(fileobj=f).read().split(b'\r\n\r\n')
+    assert b'WARC-Type: request' in request[0]
+    assert f"WARC-Concurrent-To: {headers['WARC-Record-ID']}".encode() in request[0]
+    assert request[1].startswith(b'GET /b HTTP/1.1\r\nHost: example.com')
+
+
+def test_files_roll_over(tmp_path):
+    writer = WarcWriter(tmp_path, 'example.com', max_size=1)
+    for name in ('a', 'b', 'c'):
+        writer.write_response(_response(f'https://example.com/{name}', name.encode()), [name.encode()])
+    writer.close()
+
+    assert len(writer.files) == 3
+    filenames = {json.loads(fields)['filename'] for _, _, fields in _index(writer)}
+    assert filenames == {path.name for path in writer.files}
+    for path in writer.files:
+        headers, _ = _record(path, 0, path.stat().st_size)
+        assert headers['WARC-Type'] == 'warcinfo'
+        assert headers['WARC-Filename'] == path.name
+
+
+def test_has_record(tmp_path):
+    writer = WarcWriter(tmp_path, 'example.com')
+    assert not writer.has_record('https://example.com/a')
+    writer.write_response(_response('https://example.com/a', b'a'), [b'a'])
+    assert writer.has_record('https://example.com/a')
+    writer.close()
+
+    # A later run finds the records of earlier ones in the index
+    writer = WarcWriter(tmp_path, 'example.com')
+    writer.write_response(_response('https://example.com/b', b'b'), [b'b'])
+    assert writer.has_record('https://example.com/a')
+    assert writer.has_record('https://example.com/b')
+    assert not writer.has_record('https://example.com/c')
+    writer.close()